@@ -1,5 +1,8 @@
+import hashlib
 import os
 import secrets
+import time
+from collections import OrderedDict
 from fastapi import Request, HTTPException
 from fastapi.responses import RedirectResponse
 
@@ -7,31 +10,140 @@ from fastapi.responses import RedirectResponse
 AUTH_USERNAME = os.getenv("AUTH_USERNAME", "admin")
 AUTH_PASSWORD = os.getenv("AUTH_PASSWORD", "longformvideo123")
 
-# Session token storage (in-memory, resets on restart)
-valid_sessions: set[str] = set()
+# "memory" keeps sessions in this process (dev, single worker, lost on
+# restart); "redis" shares them between all web processes and replicas
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(60 * 60 * 24 * 7)))  # 1 week
+# Per-process cache of recently verified sessions in front of the backend. A
+# logout reaches other processes once their cached entry expires.
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "1024"))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "30"))
 
 
-def create_session() -> str:
+class MemorySessionStore:
+    """Session tokens in a dict of token -> expiry time."""
+
+    def __init__(self, ttl: int = SESSION_TTL):
+        self.ttl = ttl
+        self._sessions: dict[str, float] = {}
+
+    async def add(self, token: str):
+        self._sessions[token] = time.time() + self.ttl
+
+    async def exists(self, token: str) -> bool:
+        expires = self._sessions.get(token)
+        if expires is None:
+            return False
+        if expires < time.time():
+            del self._sessions[token]
+            return False
+        return True
+
+    async def remove(self, token: str):
+        self._sessions.pop(token, None)
+
+
+class RedisSessionStore:
+    """
+    Session tokens as Redis keys with a TTL; only token hashes are stored.
+    Uses the asyncio client, so a lookup never blocks the event loop.
+    """
+
+    def __init__(self, ttl: int = SESSION_TTL, client=None):
+        self.ttl = ttl
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from app.redis_client import get_async_redis
+            self._client = get_async_redis()
+        return self._client
+
+    def _key(self, token: str) -> str:
+        return f"session:{hashlib.sha256(token.encode()).hexdigest()}"
+
+    async def add(self, token: str):
+        await self.client.set(self._key(token), "1", ex=self.ttl)
+
+    async def exists(self, token: str) -> bool:
+        return bool(await self.client.exists(self._key(token)))
+
+    async def remove(self, token: str):
+        await self.client.delete(self._key(token))
+
+
+class CachedSessionStore:
+    """
+    LRU cache of valid tokens in front of another store, so verifying a
+    session usually needs no network round trip. Only hits are cached, so
+    sessions created by other processes are seen immediately.
+    """
+
+    def __init__(self, store, size: int = SESSION_CACHE_SIZE, ttl: float = SESSION_CACHE_TTL):
+        self.store = store
+        self.size = size
+        self.ttl = ttl
+        self._cache: OrderedDict[str, float] = OrderedDict()
+
+    def _remember(self, token: str):
+        self._cache[token] = time.monotonic() + self.ttl
+        self._cache.move_to_end(token)
+        while len(self._cache) > self.size:
+            self._cache.popitem(last=False)
+
+    async def add(self, token: str):
+        await self.store.add(token)
+        self._remember(token)
+
+    async def exists(self, token: str) -> bool:
+        cached_until = self._cache.get(token)
+        if cached_until is not None and cached_until > time.monotonic():
+            self._cache.move_to_end(token)
+            return True
+        self._cache.pop(token, None)
+        if not await self.store.exists(token):
+            return False
+        self._remember(token)
+        return True
+
+    async def remove(self, token: str):
+        self._cache.pop(token, None)
+        await self.store.remove(token)
+
+
+def make_session_store(backend: str = SESSION_BACKEND):
+    if backend == "redis":
+        return CachedSessionStore(RedisSessionStore())
+    if backend == "memory":
+        return MemorySessionStore()
+    raise ValueError(f"Unknown session backend: {backend}")
+
+
+session_store = make_session_store()
+
+
+async def create_session() -> str:
     token = secrets.token_urlsafe(32)
-    valid_sessions.add(token)
+    await session_store.add(token)
     return token
 
 
-def verify_session(token: str) -> bool:
-    return token in valid_sessions
+async def verify_session(token: str) -> bool:
+    return await session_store.exists(token)
 
 
-def logout(token: str):
-    valid_sessions.discard(token)
+async def logout(token: str):
+    await session_store.remove(token)
 
 
-def get_current_user(request: Request) -> str | None:
+async def get_current_user(request: Request) -> str | None:
     token = request.cookies.get("session")
-    if token and verify_session(token):
+    if token and await verify_session(token):
         return AUTH_USERNAME
     return None
 
 
-def require_auth(request: Request):
-    if not get_current_user(request):
+async def require_auth(request: Request):
+    if not await get_current_user(request):
         raise HTTPException(status_code=401, detail="Not authenticated")
@@ -1,17 +1,22 @@
+import os
+
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 from sqlalchemy import text
 
-from app.routes import pages, api
-from app.database import engine, Base
+from app.routes import pages, api, metrics
+from app.database import engine, async_engine, Base
+from app.services.progress import progress_broker
 from app.models import Project, Scene  # noqa: F401 - needed for Base.metadata
 
+UPLOADS_PATH = os.getenv("UPLOADS_PATH", "/app/uploads")
+
 
 def run_migrations():
     """Add missing columns to existing tables."""
     migrations = [
-        # Add new columns to projects table if they don't exist
+        # Add new columns to existing tables if they don't exist
         """
         DO $$
         BEGIN
@@ -27,8 +32,44 @@ def run_migrations():
             IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='projects' AND column_name='video_duration') THEN
                 ALTER TABLE projects ADD COLUMN video_duration INTEGER DEFAULT 5;
             END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='projects' AND column_name='preview_playlist_path') THEN
+                ALTER TABLE projects ADD COLUMN preview_playlist_path VARCHAR(500);
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='projects' AND column_name='draft_status') THEN
+                ALTER TABLE projects ADD COLUMN draft_status VARCHAR(50);
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='projects' AND column_name='draft_video_path') THEN
+                ALTER TABLE projects ADD COLUMN draft_video_path VARCHAR(500);
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='projects' AND column_name='render_priority') THEN
+                ALTER TABLE projects ADD COLUMN render_priority INTEGER;
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='scenes' AND column_name='fingerprint') THEN
+                ALTER TABLE scenes ADD COLUMN fingerprint VARCHAR(64);
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='scenes' AND column_name='generation_step') THEN
+                ALTER TABLE scenes ADD COLUMN generation_step VARCHAR(50);
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='scenes' AND column_name='generation_error') THEN
+                ALTER TABLE scenes ADD COLUMN generation_error TEXT;
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='scenes' AND column_name='fal_request') THEN
+                ALTER TABLE scenes ADD COLUMN fal_request TEXT;
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='scenes' AND column_name='draft_image_path') THEN
+                ALTER TABLE scenes ADD COLUMN draft_image_path VARCHAR(500);
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='scenes' AND column_name='draft_video_path') THEN
+                ALTER TABLE scenes ADD COLUMN draft_video_path VARCHAR(500);
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='scenes' AND column_name='draft_fingerprint') THEN
+                ALTER TABLE scenes ADD COLUMN draft_fingerprint VARCHAR(64);
+            END IF;
         END $$;
         """,
+        # Indexes backing the keyset-paginated listings
+        "CREATE INDEX IF NOT EXISTS ix_projects_created_at_id ON projects (created_at, id)",
+        'CREATE INDEX IF NOT EXISTS ix_scenes_project_id_order ON scenes (project_id, "order", id)',
     ]
 
     with engine.connect() as conn:
@@ -48,6 +89,8 @@ async def lifespan(app: FastAPI):
     run_migrations()
     yield
     # Shutdown
+    await progress_broker.close()
+    await async_engine.dispose()
 
 
 app = FastAPI(title="Long Form Video Generator", lifespan=lifespan)
@@ -56,8 +99,10 @@ app = FastAPI(title="Long Form Video Generator", lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 # Mount uploads folder for serving generated videos
-app.mount("/uploads", StaticFiles(directory="/app/uploads"), name="uploads")
+os.makedirs(UPLOADS_PATH, exist_ok=True)
+app.mount("/uploads", StaticFiles(directory=UPLOADS_PATH), name="uploads")
 
 # Include routers
 app.include_router(pages.router)
 app.include_router(api.router, prefix="/api")
+app.include_router(metrics.router)
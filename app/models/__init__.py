@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Enum
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Enum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -9,12 +9,23 @@ from app.database import Base
 class ProjectStatus(str, enum.Enum):
     DRAFT = "draft"
     GENERATING = "generating"
+    STITCHING = "stitching"
     COMPLETED = "completed"
     FAILED = "failed"
 
 
+class GenerationStep(str, enum.Enum):
+    IMAGE = "image"
+    VIDEO = "video"
+    DOWNLOADED = "downloaded"
+
+
+GENERATION_STEPS = [step.value for step in GenerationStep]
+
+
 class Project(Base):
     __tablename__ = "projects"
+    __table_args__ = (Index("ix_projects_created_at_id", "created_at", "id"),)
 
     id = Column(Integer, primary_key=True)
     name = Column(String(255), nullable=False)
@@ -28,12 +39,40 @@ class Project(Base):
     image_size = Column(String(50), default="landscape_16_9")
     video_duration = Column(Integer, default=5)  # seconds per scene
 
-    scenes = relationship("Scene", back_populates="project", cascade="all, delete-orphan")
+    scenes = relationship(
+        "Scene",
+        back_populates="project",
+        cascade="all, delete-orphan",
+        order_by="(Scene.order, Scene.id)",
+    )
     output_video_path = Column(String(500), nullable=True)
+    preview_playlist_path = Column(String(500), nullable=True)  # live HLS playlist
+    # Low-cost preview render, kept apart from the final output
+    draft_status = Column(String(50), nullable=True)
+    draft_video_path = Column(String(500), nullable=True)
+    # Priority of the running render, for steps advanced by the queue poller
+    render_priority = Column(Integer, nullable=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "image_model": self.image_model,
+            "video_model": self.video_model,
+            "image_size": self.image_size,
+            "video_duration": self.video_duration,
+            "output_video_path": self.output_video_path,
+            "preview_playlist_path": self.preview_playlist_path,
+            "draft_status": self.draft_status,
+            "draft_video_path": self.draft_video_path,
+        }
 
 
 class Scene(Base):
     __tablename__ = "scenes"
+    __table_args__ = (Index("ix_scenes_project_id_order", "project_id", "order", "id"),)
 
     id = Column(Integer, primary_key=True)
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
@@ -44,6 +83,33 @@ class Scene(Base):
     generated_image_url = Column(String(500), nullable=True)
     generated_video_url = Column(String(500), nullable=True)
     video_path = Column(String(500), nullable=True)
+    fingerprint = Column(String(64), nullable=True)  # inputs that produced video_path
+    generation_step = Column(String(50), nullable=True)  # last completed step
+    generation_error = Column(Text, nullable=True)
+    fal_request = Column(Text, nullable=True)  # pending QueuedGeneration as JSON
+    draft_image_path = Column(String(500), nullable=True)  # still the draft clip is made from
+    draft_video_path = Column(String(500), nullable=True)
+    draft_fingerprint = Column(String(64), nullable=True)  # inputs that produced the draft
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     project = relationship("Project", back_populates="scenes")
+
+    def has_completed(self, step: str) -> bool:
+        """Whether the generation checkpoint is at or past `step`."""
+        if self.generation_step not in GENERATION_STEPS:
+            return False
+        return GENERATION_STEPS.index(self.generation_step) >= GENERATION_STEPS.index(step)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "project_id": self.project_id,
+            "order": self.order,
+            "prompt": self.prompt,
+            "has_reference_image": bool(self.reference_image_path),
+            "has_audio": bool(self.audio_path),
+            "generation_step": self.generation_step,
+            "generation_error": self.generation_error,
+            "video_path": self.video_path,
+            "draft_video_path": self.draft_video_path,
+        }
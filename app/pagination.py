@@ -0,0 +1,91 @@
+"""
+Keyset pagination for the project and scene listings.
+
+Pages are addressed by an opaque cursor holding the sort key of the last row
+of the previous page, so every page is a single index range scan no matter
+how deep into the listing it is.
+"""
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Project, Scene
+
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(*values) -> str:
+    # Unpadded, so cursors can go into URLs as they are
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types: type) -> list:
+    """
+    Sort key values of a cursor, one of each of `types`; raises ValueError
+    for malformed cursors.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError("Invalid cursor")
+    for value, expected in zip(values, types):
+        # bool is an int subclass, but never a valid sort key
+        if isinstance(value, bool) or not isinstance(value, expected):
+            raise ValueError("Invalid cursor")
+    return values
+
+
+def next_page_url(path: str, cursor: Optional[str]) -> Optional[str]:
+    return f"{path}?cursor={cursor}" if cursor else None
+
+
+def clamp_limit(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+async def project_page(
+    db: AsyncSession, cursor: Optional[str] = None, limit: int = PAGE_SIZE
+) -> tuple[list[Project], Optional[str]]:
+    """Projects, newest first, after `cursor`; returns the page and the next cursor."""
+    limit = clamp_limit(limit)
+    query = select(Project).order_by(Project.created_at.desc(), Project.id.desc())
+    if cursor:
+        created_at, project_id = decode_cursor(cursor, str, int)
+        query = query.where(
+            tuple_(Project.created_at, Project.id) < (datetime.fromisoformat(created_at), project_id)
+        )
+
+    projects = (await db.scalars(query.limit(limit + 1))).all()
+    if len(projects) <= limit:
+        return list(projects), None
+    last = projects[limit - 1]
+    return list(projects[:limit]), encode_cursor(last.created_at.isoformat(), last.id)
+
+
+async def scene_page(
+    db: AsyncSession, project_id: int, cursor: Optional[str] = None, limit: int = PAGE_SIZE
+) -> tuple[list[Scene], Optional[str]]:
+    """A project's scenes in timeline order after `cursor`; returns the page and the next cursor."""
+    limit = clamp_limit(limit)
+    query = (
+        select(Scene)
+        .where(Scene.project_id == project_id)
+        .order_by(Scene.order, Scene.id)
+    )
+    if cursor:
+        order, scene_id = decode_cursor(cursor, int, int)
+        query = query.where(tuple_(Scene.order, Scene.id) > (order, scene_id))
+
+    scenes = (await db.scalars(query.limit(limit + 1))).all()
+    if len(scenes) <= limit:
+        return list(scenes), None
+    last = scenes[limit - 1]
+    return list(scenes[:limit]), encode_cursor(last.order, last.id)
@@ -0,0 +1,24 @@
+import os
+import redis
+import redis.asyncio as aioredis
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+_client: redis.Redis | None = None
+_async_client: aioredis.Redis | None = None
+
+
+def get_redis() -> redis.Redis:
+    """Return the process-wide Redis client (connections are pooled)."""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _client
+
+
+def get_async_redis() -> aioredis.Redis:
+    """Return the process-wide asyncio Redis client, for the web app's event loop."""
+    global _async_client
+    if _async_client is None:
+        _async_client = aioredis.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _async_client
@@ -1,25 +1,36 @@
-from fastapi import APIRouter, UploadFile, File, Form, Request, Depends
+from fastapi import APIRouter, UploadFile, File, Form, Body, Request, Depends
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select, insert, update, case
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
-import os
-import uuid
+import asyncio
 
 from app.database import get_db
 from app.models import Project, Scene
 from app.auth import get_current_user
 from app.services.fal_service import IMAGE_MODELS, VIDEO_MODELS, IMAGE_SIZES
+from app.services.progress import progress_broker, SSE_KEEPALIVE_SECONDS
+from app.services.metrics import project_metrics, clear_project_metrics
+from app.pagination import PAGE_SIZE, project_page, scene_page, next_page_url
+from app.services.uploads import store_upload, UploadTooLarge
+from app.services.storage import remove_project_files, remove_scene_files
+from app.services.scene_import import (
+    SceneImportError,
+    detect_format,
+    parse_scenes,
+    lock_project_scenes,
+)
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
-UPLOADS_PATH = os.getenv("UPLOADS_PATH", "/app/uploads")
 
 
 @router.get("/models")
 async def get_models(request: Request):
     """Return available models for frontend."""
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return {"error": "Not authenticated"}
 
@@ -30,6 +41,65 @@ async def get_models(request: Request):
     }
 
 
+@router.get("/projects")
+async def list_projects(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = PAGE_SIZE,
+    db: AsyncSession = Depends(get_db),
+):
+    """A page of projects: card HTML for htmx requests, JSON otherwise."""
+    user = await get_current_user(request)
+    if not user:
+        return {"error": "Not authenticated"}
+
+    try:
+        projects, next_cursor = await project_page(db, cursor, limit)
+    except ValueError:
+        return JSONResponse({"error": "Invalid cursor"}, status_code=400)
+
+    if request.headers.get("HX-Request"):
+        return templates.TemplateResponse(
+            "partials/project_page.html",
+            {
+                "request": request,
+                "projects": projects,
+                "next_url": next_page_url("/api/projects", next_cursor),
+            },
+        )
+    return {"projects": [project.to_dict() for project in projects], "next_cursor": next_cursor}
+
+
+@router.get("/projects/{project_id}/scenes")
+async def list_scenes(
+    request: Request,
+    project_id: int,
+    cursor: Optional[str] = None,
+    limit: int = PAGE_SIZE,
+    db: AsyncSession = Depends(get_db),
+):
+    """A page of a project's scenes: card HTML for htmx requests, JSON otherwise."""
+    user = await get_current_user(request)
+    if not user:
+        return {"error": "Not authenticated"}
+
+    try:
+        scenes, next_cursor = await scene_page(db, project_id, cursor, limit)
+    except ValueError:
+        return JSONResponse({"error": "Invalid cursor"}, status_code=400)
+
+    if request.headers.get("HX-Request"):
+        return templates.TemplateResponse(
+            "partials/scene_page.html",
+            {
+                "request": request,
+                "scenes": scenes,
+                "next_url": next_page_url(f"/api/projects/{project_id}/scenes", next_cursor),
+            },
+        )
+    return {"scenes": [scene.to_dict() for scene in scenes], "next_cursor": next_cursor}
+
+
 @router.post("/projects", response_class=HTMLResponse)
 async def create_project(
     request: Request,
@@ -38,9 +108,9 @@ async def create_project(
     video_model: str = Form("fal-ai/ovi/image-to-video"),
     image_size: str = Form("landscape_16_9"),
     video_duration: int = Form(5),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return HTMLResponse('<div class="error">Not authenticated</div>', status_code=401)
 
@@ -52,8 +122,8 @@ async def create_project(
         video_duration=video_duration,
     )
     db.add(project)
-    db.commit()
-    db.refresh(project)
+    await db.commit()
+    await db.refresh(project)
 
     return templates.TemplateResponse(
         "partials/project_card.html", {"request": request, "project": project}
@@ -68,13 +138,13 @@ async def update_project_settings(
     video_model: str = Form(...),
     image_size: str = Form(...),
     video_duration: int = Form(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return HTMLResponse("", status_code=401)
 
-    project = db.query(Project).filter(Project.id == project_id).first()
+    project = await db.get(Project, project_id)
     if not project:
         return HTMLResponse('<div class="error">Project not found</div>', status_code=404)
 
@@ -82,23 +152,25 @@ async def update_project_settings(
     project.video_model = video_model
     project.image_size = image_size
     project.video_duration = video_duration
-    db.commit()
+    await db.commit()
 
     return HTMLResponse('<div class="success">Settings saved!</div>')
 
 
 @router.delete("/projects/{project_id}", response_class=HTMLResponse)
 async def delete_project(
-    request: Request, project_id: int, db: Session = Depends(get_db)
+    request: Request, project_id: int, db: AsyncSession = Depends(get_db)
 ):
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return HTMLResponse("", status_code=401)
 
-    project = db.query(Project).filter(Project.id == project_id).first()
+    project = await db.get(Project, project_id)
     if project:
-        db.delete(project)
-        db.commit()
+        await db.delete(project)
+        await db.commit()
+        await run_in_threadpool(clear_project_metrics, project_id)
+        await run_in_threadpool(remove_project_files, project_id)
 
     return HTMLResponse("")
 
@@ -110,102 +182,321 @@ async def create_scene(
     prompt: str = Form(...),
     reference_image: Optional[UploadFile] = File(None),
     audio: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return HTMLResponse("", status_code=401)
 
-    project = db.query(Project).filter(Project.id == project_id).first()
+    project = await db.get(Project, project_id)
     if not project:
         return HTMLResponse('<div class="error">Project not found</div>', status_code=404)
 
-    # Get next order number
-    max_order = (
-        db.query(Scene)
-        .filter(Scene.project_id == project_id)
-        .count()
-    )
+    scene = Scene(project_id=project_id, prompt=prompt)
+
+    # Save uploaded files (content-addressed, identical uploads share a file)
+    try:
+        if reference_image and reference_image.filename:
+            scene.reference_image_path = await store_upload(reference_image, "images")
+        if audio and audio.filename:
+            scene.audio_path = await store_upload(audio, "audio")
+    except UploadTooLarge as e:
+        return HTMLResponse(f'<div class="error">{e}</div>', status_code=413)
 
-    scene = Scene(project_id=project_id, prompt=prompt, order=max_order)
-
-    # Save uploaded files
-    if reference_image and reference_image.filename:
-        ext = os.path.splitext(reference_image.filename)[1]
-        filename = f"{uuid.uuid4()}{ext}"
-        filepath = os.path.join(UPLOADS_PATH, "images", filename)
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        with open(filepath, "wb") as f:
-            f.write(await reference_image.read())
-        scene.reference_image_path = filepath
-
-    if audio and audio.filename:
-        ext = os.path.splitext(audio.filename)[1]
-        filename = f"{uuid.uuid4()}{ext}"
-        filepath = os.path.join(UPLOADS_PATH, "audio", filename)
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        with open(filepath, "wb") as f:
-            f.write(await audio.read())
-        scene.audio_path = filepath
+    # Next order number, assigned under the project's row lock
+    scene.order = await lock_project_scenes(db, project_id)
+    if scene.order is None:
+        return HTMLResponse('<div class="error">Project not found</div>', status_code=404)
 
     db.add(scene)
-    db.commit()
-    db.refresh(scene)
+    await db.commit()
+    await db.refresh(scene)
 
     return templates.TemplateResponse(
         "partials/scene_card.html", {"request": request, "scene": scene}
     )
 
 
+@router.post("/projects/{project_id}/scenes/import")
+async def import_scenes(
+    request: Request,
+    project_id: int,
+    file: UploadFile = File(...),
+    fmt: Optional[str] = Form(None, alias="format"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Add many scenes at once from a JSON, CSV or plain-text script file (see
+    app.services.scene_import), in one transaction and a single INSERT.
+    """
+    user = await get_current_user(request)
+    if not user:
+        return HTMLResponse("", status_code=401)
+
+    fmt = fmt or detect_format(file.filename, file.content_type)
+    try:
+        prompts = parse_scenes((await file.read()).decode("utf-8-sig"), fmt)
+    except UnicodeDecodeError:
+        return JSONResponse({"error": "File is not UTF-8 text"}, status_code=400)
+    except SceneImportError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    first_order = await lock_project_scenes(db, project_id)
+    if first_order is None:
+        return JSONResponse({"error": "Project not found"}, status_code=404)
+
+    scenes = (await db.scalars(
+        insert(Scene).returning(Scene),
+        [
+            {"project_id": project_id, "prompt": prompt, "order": first_order + i}
+            for i, prompt in enumerate(prompts)
+        ],
+    )).all()
+    await db.commit()
+
+    if request.headers.get("HX-Request"):
+        return templates.TemplateResponse(
+            "partials/scene_page.html", {"request": request, "scenes": scenes, "paginated": False}
+        )
+    return {"imported": len(scenes), "scenes": [scene.to_dict() for scene in scenes]}
+
+
+@router.put("/projects/{project_id}/scenes/order")
+async def reorder_scenes(
+    request: Request,
+    project_id: int,
+    scene_ids: list[int] = Body(..., embed=True),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Reorder all scenes of a project in one UPDATE. `scene_ids` lists every
+    scene of the project in its new order.
+    """
+    user = await get_current_user(request)
+    if not user:
+        return {"error": "Not authenticated"}
+
+    if await lock_project_scenes(db, project_id) is None:
+        return JSONResponse({"error": "Project not found"}, status_code=404)
+
+    existing = set(await db.scalars(select(Scene.id).where(Scene.project_id == project_id)))
+    if len(scene_ids) != len(existing) or set(scene_ids) != existing:
+        return JSONResponse(
+            {"error": "scene_ids must list every scene of the project exactly once"},
+            status_code=400,
+        )
+
+    if scene_ids:
+        await db.execute(
+            update(Scene)
+            .where(Scene.project_id == project_id)
+            .values(order=case({scene_id: i for i, scene_id in enumerate(scene_ids)}, value=Scene.id))
+            .execution_options(synchronize_session=False)
+        )
+    await db.commit()
+
+    return {"status": "reordered", "scenes": len(scene_ids)}
+
+
 @router.delete("/scenes/{scene_id}", response_class=HTMLResponse)
 async def delete_scene(
-    request: Request, scene_id: int, db: Session = Depends(get_db)
+    request: Request, scene_id: int, db: AsyncSession = Depends(get_db)
 ):
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return HTMLResponse("", status_code=401)
 
-    scene = db.query(Scene).filter(Scene.id == scene_id).first()
+    scene = await db.get(Scene, scene_id)
     if scene:
-        db.delete(scene)
-        db.commit()
+        # Uploaded images and audio may be shared, the storage GC collects them
+        paths = [scene.video_path, scene.draft_video_path, scene.draft_image_path]
+        await db.delete(scene)
+        await db.commit()
+        await run_in_threadpool(remove_scene_files, paths)
 
     return HTMLResponse("")
 
 
 @router.post("/projects/{project_id}/generate")
 async def generate_video(
-    request: Request, project_id: int, db: Session = Depends(get_db)
+    request: Request,
+    project_id: int,
+    mode: str = Form("full"),
+    priority: Optional[str] = Form(None),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = get_current_user(request)
+    """
+    Render a project. The "draft" mode renders a low-cost preview next to
+    the final video (see app.tasks.draft) and runs interactive by default.
+    """
+    user = await get_current_user(request)
     if not user:
         return {"error": "Not authenticated"}
 
-    project = db.query(Project).filter(Project.id == project_id).first()
+    project = await db.get(Project, project_id)
     if not project:
         return {"error": "Project not found"}
 
-    from app.tasks.video import generate_project_video
-
-    task = generate_project_video.delay(project_id)
+    from app.tasks.video import generate_project_video, GENERATE_MODES
+    from app.tasks.draft import generate_project_draft, DRAFT_MODE
+    from app.services.rate_limiter import PRIORITIES
+
+    if mode not in GENERATE_MODES and mode != DRAFT_MODE:
+        return {"error": f"Unknown mode: {mode}"}
+    priority = priority or ("interactive" if mode == DRAFT_MODE else "batch")
+    if priority not in PRIORITIES:
+        return {"error": f"Unknown priority: {priority}"}
+
+    if mode == DRAFT_MODE:
+        task = await run_in_threadpool(
+            generate_project_draft.apply_async,
+            (project_id,),
+            {"priority": PRIORITIES[priority]},
+            priority=PRIORITIES[priority],
+        )
+        project.draft_status = "generating"
+        await db.commit()
+        return {"task_id": task.id, "status": "queued"}
+
+    # Publishing to the broker is blocking I/O
+    task = await run_in_threadpool(
+        generate_project_video.apply_async,
+        (project_id,),
+        {"mode": mode, "priority": PRIORITIES[priority]},
+        priority=PRIORITIES[priority],
+    )
 
     project.status = "generating"
-    db.commit()
+    await db.commit()
 
     return {"task_id": task.id, "status": "queued"}
 
 
+@router.post("/scenes/{scene_id}/promote")
+async def promote_scene(
+    request: Request,
+    scene_id: int,
+    priority: str = Form("interactive"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Render a scene's final clip starting from its approved draft still."""
+    user = await get_current_user(request)
+    if not user:
+        return {"error": "Not authenticated"}
+
+    scene = await db.get(Scene, scene_id)
+    if not scene:
+        return JSONResponse({"error": "Scene not found"}, status_code=404)
+    if not scene.draft_image_path:
+        return JSONResponse({"error": "Scene has no draft"}, status_code=400)
+    project = await db.get(Project, scene.project_id)
+    if project.status in ("generating", "stitching"):
+        return JSONResponse({"error": "Project is being rendered"}, status_code=409)
+
+    from app.tasks.draft import promote_scene_draft
+    from app.services.rate_limiter import PRIORITIES
+
+    if priority not in PRIORITIES:
+        return {"error": f"Unknown priority: {priority}"}
+
+    task = await run_in_threadpool(
+        promote_scene_draft.apply_async,
+        (scene_id,),
+        {"priority": PRIORITIES[priority]},
+        priority=PRIORITIES[priority],
+    )
+    return {"task_id": task.id, "status": "queued"}
+
+
 @router.get("/tasks/{task_id}/status")
 async def task_status(request: Request, task_id: str):
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return {"error": "Not authenticated"}
 
     from app.tasks.celery_app import celery_app
 
-    task = celery_app.AsyncResult(task_id)
+    def read_status():
+        task = celery_app.AsyncResult(task_id)
+        return {
+            "task_id": task_id,
+            "status": task.status,
+            "result": task.result if task.ready() else None,
+        }
+
+    # The result backend client is blocking
+    return await run_in_threadpool(read_status)
+
+
+@router.post("/storage/report")
+async def storage_report(request: Request):
+    """
+    Queue a dry run of the storage garbage collection; its report (what
+    would be evicted and why) is the task result at /api/tasks/{id}/status.
+    """
+    user = await get_current_user(request)
+    if not user:
+        return {"error": "Not authenticated"}
+
+    from app.tasks.storage import collect_garbage
+
+    task = await run_in_threadpool(collect_garbage.apply_async, (), {"dry_run": True})
+    return {"task_id": task.id, "status": "queued"}
+
+
+@router.get("/projects/{project_id}/metrics")
+async def get_project_metrics(
+    request: Request, project_id: int, db: AsyncSession = Depends(get_db)
+):
+    """Timing totals of a project's generation steps, per step and model."""
+    user = await get_current_user(request)
+    if not user:
+        return {"error": "Not authenticated"}
+
+    if await db.get(Project, project_id) is None:
+        return JSONResponse({"error": "Project not found"}, status_code=404)
+
     return {
-        "task_id": task_id,
-        "status": task.status,
-        "result": task.result if task.ready() else None,
+        "project_id": project_id,
+        "steps": await run_in_threadpool(project_metrics, project_id),
     }
+
+
+@router.get("/projects/{project_id}/events")
+async def project_events(request: Request, project_id: int):
+    """Server-Sent Events stream of a project's generation progress."""
+    user = await get_current_user(request)
+    if not user:
+        return HTMLResponse("", status_code=401)
+
+    async def stream():
+        queue = progress_broker.subscribe(project_id)
+        try:
+            while not await request.is_disconnected():
+                try:
+                    data = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {data}\n\n"
+        finally:
+            progress_broker.unsubscribe(project_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/fal/webhook/{scene_id}")
+async def fal_webhook(scene_id: int, token: str = ""):
+    """Called by fal.ai when a queued request of the scene has finished."""
+    import hmac
+    from app.tasks.polling import poll_scene, webhook_token, FAL_WEBHOOK_SECRET
+
+    if not FAL_WEBHOOK_SECRET or not hmac.compare_digest(token, webhook_token(scene_id)):
+        return JSONResponse({"error": "Invalid token"}, status_code=403)
+
+    await run_in_threadpool(poll_scene.delay, scene_id)
+    return {"status": "accepted"}
@@ -0,0 +1,27 @@
+import os
+import secrets
+
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.services.metrics import render_prometheus
+
+# Bearer token required by /metrics; scraping is open when unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    """Step timing histograms for Prometheus."""
+    if METRICS_TOKEN:
+        authorization = request.headers.get("Authorization", "")
+        if not secrets.compare_digest(authorization, f"Bearer {METRICS_TOKEN}"):
+            return PlainTextResponse("", status_code=401)
+
+    return PlainTextResponse(
+        await run_in_threadpool(render_prometheus),
+        media_type="text/plain; version=0.0.4",
+    )
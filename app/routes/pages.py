@@ -1,14 +1,16 @@
 from fastapi import APIRouter, Request, Form, Depends
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
 from app.models import Project
+from app.pagination import project_page, scene_page, next_page_url
 from app.auth import (
     get_current_user,
     AUTH_USERNAME,
     AUTH_PASSWORD,
+    SESSION_TTL,
     create_session,
     logout,
 )
@@ -19,7 +21,7 @@ templates = Jinja2Templates(directory="app/templates")
 
 @router.get("/login")
 async def login_page(request: Request):
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if user:
         return RedirectResponse(url="/", status_code=302)
     return templates.TemplateResponse("login.html", {"request": request})
@@ -28,13 +30,13 @@ async def login_page(request: Request):
 @router.post("/login")
 async def login(request: Request, username: str = Form(...), password: str = Form(...)):
     if username == AUTH_USERNAME and password == AUTH_PASSWORD:
-        token = create_session()
+        token = await create_session()
         response = RedirectResponse(url="/", status_code=302)
         response.set_cookie(
             key="session",
             value=token,
             httponly=True,
-            max_age=60 * 60 * 24 * 7,  # 1 week
+            max_age=SESSION_TTL,
             samesite="lax",
         )
         return response
@@ -47,36 +49,49 @@ async def login(request: Request, username: str = Form(...), password: str = For
 async def logout_route(request: Request):
     token = request.cookies.get("session")
     if token:
-        logout(token)
+        await logout(token)
     response = RedirectResponse(url="/login", status_code=302)
     response.delete_cookie("session")
     return response
 
 
 @router.get("/")
-async def index(request: Request, db: Session = Depends(get_db)):
-    user = get_current_user(request)
+async def index(request: Request, db: AsyncSession = Depends(get_db)):
+    user = await get_current_user(request)
     if not user:
         return RedirectResponse(url="/login", status_code=302)
 
-    projects = db.query(Project).order_by(Project.created_at.desc()).all()
+    projects, next_cursor = await project_page(db)
     return templates.TemplateResponse(
-        "index.html", {"request": request, "projects": projects}
+        "index.html",
+        {
+            "request": request,
+            "projects": projects,
+            "next_url": next_page_url("/api/projects", next_cursor),
+        },
     )
 
 
 @router.get("/projects/{project_id}")
 async def project_detail(
-    request: Request, project_id: int, db: Session = Depends(get_db)
+    request: Request, project_id: int, db: AsyncSession = Depends(get_db)
 ):
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         return RedirectResponse(url="/login", status_code=302)
 
-    project = db.query(Project).filter(Project.id == project_id).first()
+    project = await db.get(Project, project_id)
     if not project:
         return RedirectResponse(url="/", status_code=302)
 
+    # Only the first page of scenes; the rest is loaded on demand
+    scenes, next_cursor = await scene_page(db, project_id)
     return templates.TemplateResponse(
-        "project.html", {"request": request, "project": project}
+        "project.html",
+        {
+            "request": request,
+            "project": project,
+            "scenes": scenes,
+            "next_url": next_page_url(f"/api/projects/{project_id}/scenes", next_cursor),
+        },
     )
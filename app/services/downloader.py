@@ -0,0 +1,176 @@
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+DOWNLOAD_MAX_RESUMES = int(os.getenv("DOWNLOAD_MAX_RESUMES", "5"))
+DOWNLOAD_MAX_CONNECTIONS = int(os.getenv("DOWNLOAD_MAX_CONNECTIONS", "20"))
+# HTTP/2 needs the optional `h2` package and silently falls back to HTTP/1.1
+DOWNLOAD_HTTP2 = os.getenv("DOWNLOAD_HTTP2", "false").lower() == "true"
+DOWNLOAD_TIMEOUT = httpx.Timeout(300, connect=30)
+
+
+class DownloadError(Exception):
+    """Raised when a downloaded file fails size verification."""
+
+
+class IncompleteDownload(DownloadError):
+    """Raised when the body ended before the expected size (a truncated transfer)."""
+
+
+def _http2_available() -> bool:
+    if not DOWNLOAD_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _client_options() -> dict:
+    return {
+        "timeout": DOWNLOAD_TIMEOUT,
+        "follow_redirects": True,
+        "http2": _http2_available(),
+        "limits": httpx.Limits(
+            max_connections=DOWNLOAD_MAX_CONNECTIONS,
+            max_keepalive_connections=DOWNLOAD_MAX_CONNECTIONS,
+        ),
+    }
+
+
+_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> httpx.Client:
+    """Return the process-wide pooled client used for all clip downloads."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = httpx.Client(**_client_options())
+        return _client
+
+
+def create_async_client() -> httpx.AsyncClient:
+    """Create a pooled async client with the same settings (one per event loop)."""
+    return httpx.AsyncClient(**_client_options())
+
+
+def _request_headers(offset: int) -> dict:
+    # Sizes and Range offsets are counted in bytes on the wire, so ask for
+    # the file as is rather than a compressed encoding of it
+    headers = {"Accept-Encoding": "identity"}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+    return headers
+
+
+def _check_encoding(response: httpx.Response):
+    encoding = response.headers.get("Content-Encoding", "identity").lower()
+    if encoding != "identity":
+        raise DownloadError(f"Unexpected Content-Encoding: {encoding}")
+
+
+def _expected_total(response: httpx.Response, offset: int) -> Optional[int]:
+    """Total size of the resource according to the response headers."""
+    content_range = response.headers.get("Content-Range")
+    if response.status_code == 206 and content_range and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("Content-Length")
+    return int(length) + offset if length and length.isdigit() else None
+
+
+def _range_complete(response: httpx.Response, offset: int) -> bool:
+    """True for a 416 to a Range starting at the end of an already complete file."""
+    if response.status_code != 416 or not offset:
+        return False
+    total = response.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+    return total.isdigit() and int(total) == offset
+
+
+def _finish(part_path: Path, output_path: Path, total: Optional[int]) -> Path:
+    size = part_path.stat().st_size
+    if total is not None and size < total:
+        raise IncompleteDownload(f"Expected {total} bytes, got {size}")
+    if total is not None and size != total:
+        raise DownloadError(f"Expected {total} bytes, got {size}")
+    os.replace(part_path, output_path)
+    return output_path
+
+
+def download(
+    url: str,
+    output_path: Path,
+    client: Optional[httpx.Client] = None,
+) -> Path:
+    """
+    Stream `url` to `output_path` in chunks.
+
+    Data goes to a `.part` file next to the target, a dropped connection or
+    truncated body is resumed with an HTTP Range request, and the file's size
+    is verified against the response headers before it is atomically renamed
+    into place.
+    """
+    client = client or get_client()
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    part_path = output_path.with_name(output_path.name + ".part")
+    part_path.unlink(missing_ok=True)
+    total = None
+
+    for attempt in range(DOWNLOAD_MAX_RESUMES + 1):
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        try:
+            with client.stream("GET", url, headers=_request_headers(offset)) as response:
+                if _range_complete(response, offset):
+                    return _finish(part_path, output_path, offset)
+                response.raise_for_status()
+                _check_encoding(response)
+                if offset and response.status_code != 206:
+                    # Server ignored the Range header, start over
+                    offset = 0
+                total = _expected_total(response, offset)
+                with open(part_path, "ab" if offset else "wb") as f:
+                    for chunk in response.iter_raw():
+                        f.write(chunk)
+            return _finish(part_path, output_path, total)
+        except (httpx.TransportError, IncompleteDownload):
+            if attempt == DOWNLOAD_MAX_RESUMES:
+                raise
+
+
+async def download_async(
+    client: httpx.AsyncClient,
+    url: str,
+    output_path: Path,
+) -> Path:
+    """Async version of download."""
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    part_path = output_path.with_name(output_path.name + ".part")
+    part_path.unlink(missing_ok=True)
+    total = None
+
+    for attempt in range(DOWNLOAD_MAX_RESUMES + 1):
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        try:
+            async with client.stream("GET", url, headers=_request_headers(offset)) as response:
+                if _range_complete(response, offset):
+                    return _finish(part_path, output_path, offset)
+                response.raise_for_status()
+                _check_encoding(response)
+                if offset and response.status_code != 206:
+                    offset = 0
+                total = _expected_total(response, offset)
+                with open(part_path, "ab" if offset else "wb") as f:
+                    async for chunk in response.aiter_raw():
+                        f.write(chunk)
+            return _finish(part_path, output_path, total)
+        except (httpx.TransportError, IncompleteDownload):
+            if attempt == DOWNLOAD_MAX_RESUMES:
+                raise
@@ -0,0 +1,77 @@
+import os
+import threading
+from typing import Optional
+from urllib.parse import urlencode
+
+import httpx
+
+# Base URL of fal's queue API; point it at a local stand-in server for testing
+FAL_QUEUE_URL = os.getenv("FAL_QUEUE_URL", "https://queue.fal.run")
+
+
+class FalQueueClient:
+    """
+    Minimal client for fal's queue REST API: submit a request, check its
+    status and fetch its result, without holding a connection open while
+    the model runs.
+    """
+
+    def __init__(
+        self,
+        base_url: str = FAL_QUEUE_URL,
+        key: Optional[str] = None,
+        client: Optional[httpx.Client] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.key = key or os.getenv("FAL_KEY", "")
+        self._client = client
+
+    @property
+    def client(self) -> httpx.Client:
+        if self._client is None:
+            self._client = httpx.Client(timeout=60)
+        return self._client
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Key {self.key}"} if self.key else {}
+
+    def _requests_url(self, model: str, request_id: str) -> str:
+        # Requests live under the app id (owner/alias), not the full model path
+        app_id = "/".join(model.split("/")[:2])
+        return f"{self.base_url}/{app_id}/requests/{request_id}"
+
+    def submit(self, model: str, arguments: dict, webhook_url: Optional[str] = None) -> str:
+        """Queue a request and return its request id."""
+        url = f"{self.base_url}/{model}"
+        if webhook_url:
+            url += "?" + urlencode({"fal_webhook": webhook_url})
+        response = self.client.post(url, json=arguments, headers=self.headers)
+        response.raise_for_status()
+        return response.json()["request_id"]
+
+    def status(self, model: str, request_id: str) -> str:
+        """Return IN_QUEUE, IN_PROGRESS or COMPLETED."""
+        response = self.client.get(
+            self._requests_url(model, request_id) + "/status", headers=self.headers
+        )
+        response.raise_for_status()
+        return response.json()["status"]
+
+    def result(self, model: str, request_id: str) -> dict:
+        response = self.client.get(self._requests_url(model, request_id), headers=self.headers)
+        response.raise_for_status()
+        return response.json()
+
+
+_queue_client: Optional[FalQueueClient] = None
+_queue_client_lock = threading.Lock()
+
+
+def get_queue_client() -> FalQueueClient:
+    """Return the process-wide queue client."""
+    global _queue_client
+    with _queue_client_lock:
+        if _queue_client is None:
+            _queue_client = FalQueueClient()
+        return _queue_client
@@ -1,5 +1,23 @@
+import asyncio
+import json
+import time
+from dataclasses import dataclass, asdict
+from typing import TYPE_CHECKING, Callable, Optional, Union
+
 import fal_client
 
+from app.services.generation_cache import GenerationCache
+from app.services.fal_queue import FalQueueClient, get_queue_client
+from app.services.metrics import observe, span, span_async
+from app.services.retry import retry_call
+
+if TYPE_CHECKING:
+    from app.services.rate_limiter import ModelRateLimiter
+
+# Celery/limiter priorities, lower runs first (Redis broker semantics)
+PRIORITIES = {"interactive": 0, "batch": 5}
+PRIORITY_INTERACTIVE = PRIORITIES["interactive"]
+PRIORITY_BATCH = PRIORITIES["batch"]
 
 # Available models for selection
 IMAGE_MODELS = {
@@ -15,6 +33,27 @@ VIDEO_MODELS = {
     "fal-ai/minimax-video/image-to-video": {"name": "MiniMax", "price": "$0.35", "speed": "Medium", "duration_support": False},
 }
 
+SPEED_RANKS = {"Fast": 0, "Medium": 1, "Slow": 2}
+
+
+def _price_value(info: dict) -> float:
+    try:
+        return float(info.get("price", "").lstrip("$").split("/")[0])
+    except ValueError:
+        return float("inf")
+
+
+def fastest_model(models: dict) -> str:
+    """Fastest model of IMAGE_MODELS or VIDEO_MODELS, the cheapest of equally fast ones."""
+    return min(
+        models,
+        key=lambda model: (
+            SPEED_RANKS.get(models[model].get("speed"), len(SPEED_RANKS)),
+            _price_value(models[model]),
+        ),
+    )
+
+
 IMAGE_SIZES = {
     "square": "1:1 Square",
     "square_hd": "1:1 Square HD",
@@ -25,6 +64,46 @@ IMAGE_SIZES = {
 }
 
 
+def _image_url(result: dict) -> str:
+    return result["images"][0]["url"]
+
+
+def _video_url(result: dict) -> str:
+    return result["video"]["url"]
+
+
+RESULT_EXTRACTORS = {"image": _image_url, "video": _video_url}
+
+
+def model_step(model: str) -> str:
+    """Metrics step name of a model call."""
+    if model in IMAGE_MODELS:
+        return "fal_image"
+    if model in VIDEO_MODELS:
+        return "fal_video"
+    return "fal_run"
+
+
+@dataclass
+class QueuedGeneration:
+    """A generation submitted to fal's queue; `url` is set once it finished."""
+
+    kind: str  # "image" or "video"
+    model: str
+    request_id: Optional[str] = None
+    cache_key: Optional[str] = None
+    url: Optional[str] = None
+    slot: Optional[str] = None  # rate limiter slot held until the request finishes
+    submitted_at: Optional[float] = None  # unix time, for the queued duration
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, data: str) -> "QueuedGeneration":
+        return cls(**json.loads(data))
+
+
 class FalService:
     """Service for interacting with fal.ai API for image and video generation."""
 
@@ -32,26 +111,33 @@ class FalService:
         self,
         image_model: str = "fal-ai/flux/schnell",
         video_model: str = "fal-ai/ovi/image-to-video",
+        cache: Optional[GenerationCache] = None,
+        queue: Optional[FalQueueClient] = None,
+        limiter: Optional["ModelRateLimiter"] = None,
+        project_id: Optional[int] = None,
+        priority: int = PRIORITY_BATCH,
     ):
         self.image_model = image_model
         self.video_model = video_model
+        self.cache = cache
+        self._queue = queue
+        # Calls are attributed to a project and priority for fair scheduling
+        self.limiter = limiter
+        self.project_id = project_id
+        self.priority = priority
 
-    def generate_image(self, prompt: str, image_size: str = "landscape_16_9") -> str:
-        """Generate an image from a text prompt."""
-        result = fal_client.run(
-            self.image_model,
-            arguments={
-                "prompt": prompt,
-                "image_size": image_size,
-                "num_images": 1,
-            },
-        )
-        return result["images"][0]["url"]
+    @property
+    def queue(self) -> FalQueueClient:
+        return self._queue or get_queue_client()
 
-    def generate_video_from_image(
-        self, image_url: str, prompt: str = "", duration: int = 5
-    ) -> str:
-        """Generate a video clip from an image."""
+    def _image_arguments(self, prompt: str, image_size: Union[str, dict]) -> dict:
+        return {
+            "prompt": prompt,
+            "image_size": image_size,
+            "num_images": 1,
+        }
+
+    def _video_arguments(self, image_url: str, prompt: str, duration: int) -> dict:
         args = {
             "prompt": prompt,
             "image_url": image_url,
@@ -61,34 +147,177 @@ class FalService:
         model_info = VIDEO_MODELS.get(self.video_model, {})
         if model_info.get("duration_support", False):
             args["duration"] = duration
+        return args
+
+    def _call(self, model: str, arguments: dict) -> dict:
+        """Run a model, holding a rate limiter slot while it runs."""
+        if not self.limiter:
+            return self._timed_run(model, arguments)
+        with self.limiter.slot(model, self.project_id, self.priority):
+            return self._timed_run(model, arguments)
+
+    async def _call_async(self, model: str, arguments: dict) -> dict:
+        """Async version of _call."""
+        if not self.limiter:
+            return await self._timed_run_async(model, arguments)
+        async with self.limiter.slot_async(model, self.project_id, self.priority):
+            return await self._timed_run_async(model, arguments)
 
-        result = fal_client.run(self.video_model, arguments=args)
-        return result["video"]["url"]
+    def _timed_run(self, model: str, arguments: dict) -> dict:
+        # Timed without the wait for a rate limiter slot
+        with span(model_step(model), model, self.project_id):
+            return fal_client.run(model, arguments=arguments)
+
+    async def _timed_run_async(self, model: str, arguments: dict) -> dict:
+        async with span_async(model_step(model), model, self.project_id):
+            return await fal_client.run_async(model, arguments=arguments)
+
+    def _run(self, model: str, arguments: dict, extract: Callable[[dict], str]) -> str:
+        """Call a model, serving repeated (model, arguments) pairs from the cache."""
+        if not self.cache:
+            return extract(self._call(model, arguments))
+
+        key = self.cache.make_key(model, arguments)
+        url = self.cache.get_url(key)
+        if url is None:
+            url = extract(self._call(model, arguments))
+            self.cache.set_url(key, url)
+        return url
+
+    async def _run_async(self, model: str, arguments: dict, extract: Callable[[dict], str]) -> str:
+        """Async version of _run; cache lookups run in a thread."""
+        if not self.cache:
+            return extract(await self._call_async(model, arguments))
+
+        key = await asyncio.to_thread(self.cache.make_key, model, arguments)
+        url = await asyncio.to_thread(self.cache.get_url, key)
+        if url is None:
+            url = extract(await self._call_async(model, arguments))
+            await asyncio.to_thread(self.cache.set_url, key, url)
+        return url
+
+    def generate_image(self, prompt: str, image_size: Union[str, dict] = "landscape_16_9") -> str:
+        """Generate an image from a text prompt; `image_size` is a preset or {"width", "height"}."""
+        return self._run(
+            self.image_model,
+            self._image_arguments(prompt, image_size),
+            _image_url,
+        )
+
+    def generate_video_from_image(
+        self, image_url: str, prompt: str = "", duration: int = 5
+    ) -> str:
+        """Generate a video clip from an image."""
+        return self._run(
+            self.video_model,
+            self._video_arguments(image_url, prompt, duration),
+            _video_url,
+        )
 
     async def generate_image_async(self, prompt: str, image_size: str = "landscape_16_9") -> str:
         """Async version of generate_image."""
-        result = await fal_client.run_async(
+        return await self._run_async(
             self.image_model,
-            arguments={
-                "prompt": prompt,
-                "image_size": image_size,
-                "num_images": 1,
-            },
+            self._image_arguments(prompt, image_size),
+            _image_url,
         )
-        return result["images"][0]["url"]
 
     async def generate_video_from_image_async(
         self, image_url: str, prompt: str = "", duration: int = 5
     ) -> str:
         """Async version of generate_video_from_image."""
-        args = {
-            "prompt": prompt,
-            "image_url": image_url,
-        }
+        return await self._run_async(
+            self.video_model,
+            self._video_arguments(image_url, prompt, duration),
+            _video_url,
+        )
 
-        model_info = VIDEO_MODELS.get(self.video_model, {})
-        if model_info.get("duration_support", False):
-            args["duration"] = duration
+    def _submit(
+        self,
+        kind: str,
+        model: str,
+        arguments: dict,
+        webhook_url: Optional[str],
+        slot_name: Optional[str],
+    ) -> QueuedGeneration:
+        """
+        Queue a request, or return a finished one straight from the cache.
+        With a `slot_name` the rate limiter slot is taken without waiting
+        (SlotUnavailable is raised when there is none), so queue-mode
+        workers never block on a slot only other polls can free.
+        """
+        key = None
+        if self.cache:
+            key = self.cache.make_key(model, arguments)
+            url = self.cache.get_url(key)
+            if url is not None:
+                return QueuedGeneration(kind, model, cache_key=key, url=url)
+
+        # The slot stays taken while the request runs on fal's side
+        slot = None
+        if self.limiter and slot_name:
+            slot = self.limiter.try_acquire(
+                model, slot_name, self.project_id, self.priority, lease=self.limiter.queue_lease
+            )
+        elif self.limiter:
+            slot = self.limiter.acquire(
+                model, self.project_id, self.priority, lease=self.limiter.queue_lease
+            )
+        try:
+            request_id = self.queue.submit(model, arguments, webhook_url=webhook_url)
+        except Exception:
+            if self.limiter:
+                self.limiter.release(model, slot)
+            raise
+        return QueuedGeneration(
+            kind, model, request_id=request_id, cache_key=key, slot=slot, submitted_at=time.time()
+        )
+
+    def submit_image(
+        self,
+        prompt: str,
+        image_size: str = "landscape_16_9",
+        webhook_url: Optional[str] = None,
+        slot_name: Optional[str] = None,
+    ) -> QueuedGeneration:
+        """Queue image generation without waiting for the result."""
+        return self._submit(
+            "image", self.image_model, self._image_arguments(prompt, image_size), webhook_url, slot_name
+        )
+
+    def submit_video_from_image(
+        self,
+        image_url: str,
+        prompt: str = "",
+        duration: int = 5,
+        webhook_url: Optional[str] = None,
+        slot_name: Optional[str] = None,
+    ) -> QueuedGeneration:
+        """Queue video generation without waiting for the result."""
+        return self._submit(
+            "video",
+            self.video_model,
+            self._video_arguments(image_url, prompt, duration),
+            webhook_url,
+            slot_name,
+        )
+
+    def poll(self, queued: QueuedGeneration) -> QueuedGeneration:
+        """Check a queued generation and fill in its URL once it completed."""
+        if queued.url is not None:
+            return queued
+        if retry_call(self.queue.status, queued.model, queued.request_id) != "COMPLETED":
+            return queued
 
-        result = await fal_client.run_async(self.video_model, arguments=args)
-        return result["video"]["url"]
+        try:
+            result = retry_call(self.queue.result, queued.model, queued.request_id)
+        finally:
+            if self.limiter:
+                self.limiter.release(queued.model, queued.slot)
+        queued.url = RESULT_EXTRACTORS[queued.kind](result)
+        if queued.submitted_at is not None:
+            # Time in fal's queue, up to the poll or webhook that noticed it
+            observe(model_step(queued.model), time.time() - queued.submitted_at, queued.model, self.project_id)
+        if self.cache and queued.cache_key:
+            self.cache.set_url(queued.cache_key, queued.url)
+        return queued
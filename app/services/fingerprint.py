@@ -0,0 +1,70 @@
+import hashlib
+import json
+from typing import Optional
+
+
+def file_hash(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _reference_hash(scene) -> Optional[str]:
+    if scene.reference_image_path:
+        return file_hash(scene.reference_image_path)
+    return None
+
+
+def scene_fingerprint(scene, project) -> str:
+    """
+    Fingerprint of every input that determines a scene's clip: the prompt,
+    the reference image contents and the project's model settings.
+    """
+    inputs = {
+        "prompt": scene.prompt,
+        "reference_image": _reference_hash(scene),
+        "image_model": project.image_model,
+        "video_model": project.video_model,
+        "image_size": project.image_size,
+        "video_duration": project.video_duration,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def promoted_fingerprint(scene, project, scene_fp: Optional[str] = None) -> str:
+    """
+    Fingerprint of a clip rendered from a promoted draft still: the scene's
+    inputs plus those of the draft, since the image did not come from the
+    project's image model.
+    """
+    inputs = {
+        "scene": scene_fp or scene_fingerprint(scene, project),
+        "draft": scene.draft_fingerprint,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def is_current(scene, project) -> bool:
+    """
+    Whether a scene's checkpoint matches its inputs: rendered from them, or
+    promoted from the draft the scene still has.
+    """
+    if not scene.fingerprint:
+        return False
+    scene_fp = scene_fingerprint(scene, project)
+    if scene.fingerprint == scene_fp:
+        return True
+    return bool(scene.draft_fingerprint) and scene.fingerprint == promoted_fingerprint(scene, project, scene_fp)
+
+
+def draft_fingerprint(scene, settings: dict) -> str:
+    """Fingerprint of the inputs of a scene's draft clip, given the draft settings."""
+    inputs = {
+        "prompt": scene.prompt,
+        "reference_image": _reference_hash(scene),
+        **settings,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
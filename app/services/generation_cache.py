@@ -0,0 +1,202 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+import redis
+
+from app.redis_client import get_redis
+from app.services.fingerprint import file_hash
+from app.services.storage import touch
+
+UPLOADS_PATH = os.getenv("UPLOADS_PATH", "/app/uploads")
+
+GEN_CACHE_ENABLED = os.getenv("GEN_CACHE_ENABLED", "true").lower() == "true"
+# How long a provider URL may be handed out again (fal CDN links expire)
+GEN_CACHE_URL_TTL = int(os.getenv("GEN_CACHE_URL_TTL", str(24 * 3600)))
+# How long cache records are kept at all (they still resolve to local files)
+GEN_CACHE_RECORD_TTL = int(os.getenv("GEN_CACHE_RECORD_TTL", str(30 * 24 * 3600)))
+# Disk quota for cached clips, least recently used files are evicted first
+GEN_CACHE_MAX_BYTES = int(os.getenv("GEN_CACHE_MAX_BYTES", str(20 * 1024**3)))
+
+
+def _sha256(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+class GenerationCache:
+    """
+    Content-addressed cache of fal.ai generation results.
+
+    A result is keyed on a hash of (model, arguments). Redis stores the
+    provider URL per key, plus the reverse mapping from URL to key so that a
+    URL produced by one cached call (e.g. an image) can be replaced by its
+    stable key inside the arguments of the next call (e.g. image-to-video).
+    Downloaded files live in `cache_dir` named by key and are evicted LRU
+    under a disk quota.
+
+    Local files uploaded to the fal CDN are cached the same way, keyed on
+    their content hash, so an unchanged reference image is uploaded once per
+    GEN_CACHE_URL_TTL and the calls using it keep stable keys.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        url_ttl: int = GEN_CACHE_URL_TTL,
+        record_ttl: int = GEN_CACHE_RECORD_TTL,
+        max_bytes: int = GEN_CACHE_MAX_BYTES,
+        client: Optional[redis.Redis] = None,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.url_ttl = url_ttl
+        self.record_ttl = record_ttl
+        self.max_bytes = max_bytes
+        self._client = client
+
+    @property
+    def client(self) -> redis.Redis:
+        return self._client or get_redis()
+
+    def make_key(self, model: str, arguments: dict) -> str:
+        """Hash (model, arguments), with known result URLs replaced by their keys."""
+        resolved = {}
+        for name, value in arguments.items():
+            if isinstance(value, str) and value.startswith(("http://", "https://")):
+                value = self.key_for_url(value) or value
+            resolved[name] = value
+        return _sha256(json.dumps({"model": model, "arguments": resolved}, sort_keys=True))
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        try:
+            return self.client.get(f"gencache:origin:{_sha256(url)}")
+        except redis.RedisError:
+            return None
+
+    def get_url(self, key: str) -> Optional[str]:
+        """Return the cached URL for a key if it is still fresh or backed by a local file."""
+        try:
+            record = self.client.get(f"gencache:result:{key}")
+        except redis.RedisError:
+            return None
+        if not record:
+            return None
+        record = json.loads(record)
+        if time.time() - record["created_at"] < self.url_ttl or self._find_file(key):
+            return record["url"]
+        return None
+
+    def set_url(self, key: str, url: str):
+        record = json.dumps({"url": url, "created_at": time.time()})
+        try:
+            pipe = self.client.pipeline()
+            pipe.set(f"gencache:result:{key}", record, ex=self.record_ttl)
+            pipe.set(f"gencache:origin:{_sha256(url)}", key, ex=self.record_ttl)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def upload_key(self, path: str) -> str:
+        return _sha256(f"upload:{file_hash(path)}")
+
+    def upload(self, path: str, uploader: Callable[[str], str]) -> str:
+        """CDN URL of a local file, calling `uploader` only on a cache miss."""
+        key = self.upload_key(path)
+        url = self.get_url(key)
+        if url is None:
+            url = uploader(path)
+            self.set_url(key, url)
+        return url
+
+    async def upload_async(self, path: str, uploader: Callable[[str], Awaitable[str]]) -> str:
+        """`upload` for the asyncio engine; hashing and Redis calls run in threads."""
+        key = await asyncio.to_thread(self.upload_key, path)
+        url = await asyncio.to_thread(self.get_url, key)
+        if url is None:
+            url = await uploader(path)
+            await asyncio.to_thread(self.set_url, key, url)
+        return url
+
+    def materialize(
+        self, url: str, output_path: Path, download: Callable[[str, Path], Path]
+    ) -> Path:
+        """
+        Place the file behind `url` at `output_path`, reusing the cached copy
+        when there is one and adding freshly downloaded files to the cache.
+        """
+        if not self.restore(url, output_path):
+            download(url, output_path)
+            self.store_downloaded(url, output_path)
+        return output_path
+
+    def restore(self, url: str, output_path: Path) -> bool:
+        """Link the cached file for `url` to `output_path`; False on a miss."""
+        key = self.key_for_url(url)
+        cached = self._find_file(key) if key else None
+        if not cached:
+            return False
+        # atime only: the inode is shared by every clip linked to it, and their
+        # mtimes are part of the ffmpeg cache keys
+        touch(str(cached))
+        _link_or_copy(cached, Path(output_path))
+        return True
+
+    def store_downloaded(self, url: str, path: Path):
+        """Add a file downloaded from a cached result URL to the cache."""
+        key = self.key_for_url(url)
+        if key:
+            self.store_file(key, path)
+
+    def store_file(self, key: str, path: Path):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        target = self.cache_dir / f"{key}{Path(path).suffix}"
+        if not target.exists():
+            _link_or_copy(Path(path), target)
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used files until the cache fits its quota."""
+        if not self.cache_dir.exists():
+            return
+        entries = []
+        total = 0
+        for path in self.cache_dir.iterdir():
+            stat = path.stat()
+            entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+            total += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def _find_file(self, key: str) -> Optional[Path]:
+        matches = list(self.cache_dir.glob(f"{key}.*")) if self.cache_dir.exists() else []
+        return matches[0] if matches else None
+
+
+def _link_or_copy(source: Path, target: Path):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.unlink(missing_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+_cache: Optional[GenerationCache] = None
+
+
+def get_generation_cache() -> Optional[GenerationCache]:
+    """Return the shared cache, or None when caching is disabled."""
+    global _cache
+    if not GEN_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = GenerationCache(os.path.join(UPLOADS_PATH, "cache", "generations"))
+    return _cache
@@ -0,0 +1,164 @@
+import asyncio
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import fal_client
+import httpx
+
+from app.services import downloader
+from app.services.fal_service import FalService
+from app.services.metrics import span_async
+from app.services.retry import retry_call_async
+
+
+@dataclass
+class SceneJob:
+    """Inputs needed to render a single scene outside of the database session."""
+
+    scene_id: int
+    index: int
+    prompt: str
+    clip_path: Path
+    reference_image_path: Optional[str] = None
+    # Checkpointed results of earlier attempts; set stages are skipped
+    image_url: Optional[str] = None
+    video_url: Optional[str] = None
+
+
+class GenerationEngine:
+    """
+    Pipelined asyncio engine that renders many scenes within one worker.
+
+    Every scene runs as its own coroutine (image -> video -> download), and at
+    most `max_in_flight` scenes are active at once. Transient errors are
+    retried per stage, and stages with a checkpointed result are skipped.
+    Because the stages of different scenes await independently, the image of
+    scene N+1, the video of scene N and the download of scene N-1 all
+    progress at the same time.
+    """
+
+    def __init__(
+        self,
+        fal_service: FalService,
+        image_size: str = "landscape_16_9",
+        duration: int = 5,
+        max_in_flight: int = 16,
+        max_downloads: int = 4,
+    ):
+        self.fal_service = fal_service
+        self.image_size = image_size
+        self.duration = duration
+        self.max_in_flight = max_in_flight
+        self.max_downloads = max_downloads
+
+    async def run(
+        self,
+        jobs: List[SceneJob],
+        on_update: Optional[Callable[[SceneJob, str, dict], None]] = None,
+    ) -> List[dict]:
+        """
+        Render all jobs and return one result dict per job, in job order.
+
+        `on_update(job, step, values)` is called from the event loop whenever a
+        scene enters a step or produces a value worth persisting.
+        """
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        downloads = asyncio.Semaphore(self.max_downloads)
+
+        def notify(job: SceneJob, step: str, **values):
+            if on_update:
+                on_update(job, step, values)
+
+        async with downloader.create_async_client() as client:
+            async def render(job: SceneJob) -> dict:
+                async with in_flight:
+                    try:
+                        return await self._render_scene(job, client, downloads, notify)
+                    except Exception as e:
+                        error = f"Scene {job.index+1} failed: {str(e)}"
+                        notify(job, "failed", generation_error=error)
+                        return {"status": "failed", "scene_id": job.scene_id, "error": error}
+
+            return await asyncio.gather(*(render(job) for job in jobs))
+
+    async def _render_scene(
+        self,
+        job: SceneJob,
+        client: httpx.AsyncClient,
+        downloads: asyncio.Semaphore,
+        notify: Callable,
+    ) -> dict:
+        def fail(error: str) -> dict:
+            notify(job, "failed", generation_error=error)
+            return {"status": "failed", "scene_id": job.scene_id, "error": error}
+
+        # Step 1: Generate or use existing image
+        image_url = job.image_url
+        if image_url is None:
+            if job.reference_image_path:
+                notify(job, "uploading_image")
+                cache = self.fal_service.cache
+                try:
+                    if cache:
+                        image_url = await cache.upload_async(
+                            job.reference_image_path,
+                            lambda path: retry_call_async(self._upload, path),
+                        )
+                    else:
+                        image_url = await retry_call_async(self._upload, job.reference_image_path)
+                except Exception as e:
+                    return fail(f"Image upload failed for scene {job.index+1}: {str(e)}")
+            else:
+                notify(job, "generating_image")
+                try:
+                    image_url = await retry_call_async(
+                        self.fal_service.generate_image_async,
+                        job.prompt,
+                        image_size=self.image_size,
+                    )
+                except Exception as e:
+                    return fail(f"Image generation failed for scene {job.index+1}: {str(e)}")
+            notify(job, "image_generated", generated_image_url=image_url, generation_step="image")
+
+        # Step 2: Generate video from image
+        video_url = job.video_url
+        if video_url is None:
+            notify(job, "generating_video")
+            try:
+                video_url = await retry_call_async(
+                    self.fal_service.generate_video_from_image_async,
+                    image_url=image_url,
+                    prompt=job.prompt,
+                    duration=self.duration,
+                )
+            except Exception as e:
+                return fail(f"Video generation failed for scene {job.index+1}: {str(e)}")
+            notify(job, "video_generated", generated_video_url=video_url, generation_step="video")
+
+        # Step 3: Download video clip
+        async with downloads:
+            notify(job, "downloading_video")
+            try:
+                await retry_call_async(self._download, client, video_url, job.clip_path)
+            except Exception as e:
+                return fail(f"Download failed for scene {job.index+1}: {str(e)}")
+        notify(job, "downloaded", video_path=str(job.clip_path), generation_step="downloaded")
+
+        return {"status": "completed", "scene_id": job.scene_id, "video_path": str(job.clip_path)}
+
+    async def _upload(self, path: str) -> str:
+        async with span_async("cdn_upload", project_id=self.fal_service.project_id):
+            return await fal_client.upload_file_async(path)
+
+    async def _download(self, client: httpx.AsyncClient, url: str, output_path: Path) -> Path:
+        cache = self.fal_service.cache
+        if cache and await asyncio.to_thread(cache.restore, url, output_path):
+            return output_path
+
+        async with span_async("download", project_id=self.fal_service.project_id):
+            await downloader.download_async(client, url, output_path)
+
+        if cache:
+            await asyncio.to_thread(cache.store_downloaded, url, output_path)
+        return output_path
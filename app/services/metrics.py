@@ -0,0 +1,181 @@
+"""
+Timing metrics of the generation pipeline.
+
+Every step (fal.ai calls, CDN uploads, downloads, ffmpeg) is timed with
+`span` and recorded in Redis, so the web app and all workers add to the same
+histograms. `/metrics` renders them in the Prometheus text format, labelled
+with the model and its listed price; per project totals are kept alongside
+for the project's own metrics endpoint.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+import redis
+
+from app.redis_client import get_redis
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# How long per project timings are kept after the project's last step
+METRICS_PROJECT_TTL = int(os.getenv("METRICS_PROJECT_TTL", str(30 * 24 * 3600)))
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+METRIC_NAME = "lfv_step_duration_seconds"
+HISTOGRAM_KEY = "metrics:histogram"
+PROJECT_KEY_PREFIX = "metrics:project:"
+
+
+def project_metrics_key(project_id: int) -> str:
+    return f"{PROJECT_KEY_PREFIX}{project_id}"
+
+
+def model_price(model: Optional[str]) -> str:
+    """Listed price of a fal.ai model, or "" for other steps."""
+    from app.services.fal_service import IMAGE_MODELS, VIDEO_MODELS
+
+    info = IMAGE_MODELS.get(model) or VIDEO_MODELS.get(model) or {}
+    return info.get("price", "")
+
+
+def _bucket(seconds: float) -> str:
+    for bound in BUCKETS:
+        if seconds <= bound:
+            return f"{bound:g}"
+    return "+Inf"
+
+
+def observe(
+    step: str,
+    seconds: float,
+    model: Optional[str] = None,
+    project_id: Optional[int] = None,
+    status: str = "ok",
+):
+    """
+    Record one timed step. Only the matching bucket is counted, cumulative
+    counts are summed up when rendering. Metrics are best effort: a Redis
+    outage never fails the step.
+    """
+    if not METRICS_ENABLED:
+        return
+    series = f"{step}|{model or ''}|{status}"
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hincrby(HISTOGRAM_KEY, f"{series}|{_bucket(seconds)}", 1)
+        pipe.hincrby(HISTOGRAM_KEY, f"{series}|count", 1)
+        pipe.hincrbyfloat(HISTOGRAM_KEY, f"{series}|sum", seconds)
+        if project_id is not None:
+            key = project_metrics_key(project_id)
+            pipe.hincrby(key, f"{series}|count", 1)
+            pipe.hincrbyfloat(key, f"{series}|sum", seconds)
+            pipe.expire(key, METRICS_PROJECT_TTL)
+        pipe.execute()
+    except redis.RedisError:
+        pass
+
+
+@contextmanager
+def span(step: str, model: Optional[str] = None, project_id: Optional[int] = None):
+    """
+    Time the enclosed block as `step`; failures are recorded with status
+    "error".
+    """
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        observe(step, time.perf_counter() - start, model, project_id, status)
+
+
+@asynccontextmanager
+async def span_async(step: str, model: Optional[str] = None, project_id: Optional[int] = None):
+    """Async version of span; the Redis write runs in a thread."""
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        await asyncio.to_thread(observe, step, time.perf_counter() - start, model, project_id, status)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(step: str, model: str, status: str, **extra) -> str:
+    labels = {"step": step, "model": model, "price": model_price(model), "status": status, **extra}
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def render_prometheus() -> str:
+    """All step histograms in the Prometheus text exposition format."""
+    try:
+        fields = get_redis().hgetall(HISTOGRAM_KEY)
+    except redis.RedisError:
+        fields = {}
+
+    series: dict[tuple, dict[str, float]] = {}
+    for field, value in fields.items():
+        step, model, status, name = field.rsplit("|", 3)
+        series.setdefault((step, model, status), {})[name] = float(value)
+
+    lines = [
+        f"# HELP {METRIC_NAME} Duration of generation pipeline steps.",
+        f"# TYPE {METRIC_NAME} histogram",
+    ]
+    for (step, model, status), values in sorted(series.items()):
+        cumulative = 0
+        for bound in [f"{b:g}" for b in BUCKETS] + ["+Inf"]:
+            cumulative += values.get(bound, 0)
+            labels = _labels(step, model, status, le=bound)
+            lines.append(f"{METRIC_NAME}_bucket{{{labels}}} {cumulative:g}")
+        labels = _labels(step, model, status)
+        lines.append(f"{METRIC_NAME}_sum{{{labels}}} {values.get('sum', 0):g}")
+        lines.append(f"{METRIC_NAME}_count{{{labels}}} {values.get('count', 0):g}")
+    return "\n".join(lines) + "\n"
+
+
+def project_metrics(project_id: int) -> list[dict]:
+    """Per step and model timing totals of one project."""
+    try:
+        fields = get_redis().hgetall(project_metrics_key(project_id))
+    except redis.RedisError:
+        fields = {}
+
+    steps: dict[tuple, dict] = {}
+    for field, value in fields.items():
+        step, model, status, name = field.rsplit("|", 3)
+        entry = steps.setdefault((step, model, status), {
+            "step": step,
+            "model": model or None,
+            "price": model_price(model) or None,
+            "status": status,
+            "count": 0,
+            "total_seconds": 0.0,
+        })
+        if name == "count":
+            entry["count"] = int(value)
+        else:
+            entry["total_seconds"] = round(float(value), 3)
+
+    for entry in steps.values():
+        entry["avg_seconds"] = round(entry["total_seconds"] / entry["count"], 3) if entry["count"] else None
+    return [steps[key] for key in sorted(steps)]
+
+
+def clear_project_metrics(project_id: int):
+    try:
+        get_redis().delete(project_metrics_key(project_id))
+    except redis.RedisError:
+        pass
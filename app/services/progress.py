@@ -0,0 +1,101 @@
+"""
+Live generation progress.
+
+Workers publish small JSON events on a per-project Redis pub/sub channel.
+The web app keeps a single pattern subscription per process (ProgressBroker)
+and fans the events out to the SSE streams of all connected browsers, so open
+tabs cost no Redis round trips of their own.
+"""
+import asyncio
+import json
+import os
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from app.redis_client import REDIS_URL, get_redis
+
+CHANNEL_PREFIX = "progress:project:"
+
+# Seconds between SSE keepalive comments on idle streams
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+# Events buffered per client; a client that falls behind loses the oldest
+SSE_CLIENT_BUFFER = int(os.getenv("SSE_CLIENT_BUFFER", "100"))
+
+
+def progress_channel(project_id: int) -> str:
+    return f"{CHANNEL_PREFIX}{project_id}"
+
+
+def publish_progress(project_id: int, event: str, **data):
+    """
+    Publish a progress event ("scene" or "project") for a project. Progress
+    is best effort: a Redis outage never fails the generation.
+    """
+    try:
+        get_redis().publish(progress_channel(project_id), json.dumps({"event": event, **data}))
+    except redis.RedisError:
+        pass
+
+
+class ProgressBroker:
+    """Shares one Redis subscription between all SSE clients of a process."""
+
+    def __init__(self, url: str = REDIS_URL):
+        self.url = url
+        self._subscribers: dict[int, set[asyncio.Queue]] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    def subscribe(self, project_id: int) -> asyncio.Queue:
+        """Queue receiving the raw JSON events of a project."""
+        queue = asyncio.Queue(maxsize=SSE_CLIENT_BUFFER)
+        self._subscribers.setdefault(project_id, set()).add(queue)
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+        return queue
+
+    def unsubscribe(self, project_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(project_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[project_id]
+
+    def _dispatch(self, channel: str, data: str):
+        try:
+            project_id = int(channel[len(CHANNEL_PREFIX):])
+        except ValueError:
+            return
+        for queue in list(self._subscribers.get(project_id, ())):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(data)
+
+    async def _listen(self):
+        """Pattern-subscribe to every project's channel, reconnecting on errors."""
+        while True:
+            client = aioredis.from_url(self.url, decode_responses=True)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        self._dispatch(message["channel"], message["data"])
+            except redis.RedisError:
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+                await client.aclose()
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+
+progress_broker = ProgressBroker()
@@ -0,0 +1,335 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+import redis
+
+from app.redis_client import get_redis
+from app.services.fal_service import (
+    IMAGE_MODELS,
+    VIDEO_MODELS,
+    PRIORITIES,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_BATCH,
+)
+
+FAL_RATE_LIMIT_ENABLED = os.getenv("FAL_RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Seconds a caller waits for a slot before giving up
+FAL_RATE_LIMIT_TIMEOUT = float(os.getenv("FAL_RATE_LIMIT_TIMEOUT", "1800"))
+# Slots are leases so a crashed worker cannot hold one forever; live
+# holders renew theirs every third of the lease
+FAL_SLOT_LEASE = int(os.getenv("FAL_SLOT_LEASE", "900"))
+# Queued requests hold their slot until the result is collected
+FAL_QUEUE_SLOT_LEASE = int(os.getenv("FAL_QUEUE_SLOT_LEASE", "3600"))
+POLL_INTERVAL = 0.25
+
+DEFAULT_IMAGE_LIMITS = {"rate": 5.0, "burst": 10, "concurrency": 8}
+DEFAULT_VIDEO_LIMITS = {"rate": 1.0, "burst": 4, "concurrency": 4}
+
+
+def _load_limits() -> dict:
+    """Per-model limits, overridable with FAL_MODEL_LIMITS (JSON keyed by model ID)."""
+    limits = {model: dict(DEFAULT_IMAGE_LIMITS) for model in IMAGE_MODELS}
+    limits.update({model: dict(DEFAULT_VIDEO_LIMITS) for model in VIDEO_MODELS})
+    for model, overrides in json.loads(os.getenv("FAL_MODEL_LIMITS", "{}")).items():
+        limits.setdefault(model, dict(DEFAULT_VIDEO_LIMITS)).update(overrides)
+    return limits
+
+
+MODEL_LIMITS = _load_limits()
+
+# Token bucket refilled at `rate` tokens/s up to `burst`. Returns 0 when a
+# token was taken, otherwise the seconds until one is available.
+TOKEN_BUCKET_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate)
+if tokens < 1 then
+    return tostring((1 - tokens) / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens - 1, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return '0'
+"""
+
+# Fair concurrency slots. Waiters are ordered by score (priority, then how
+# many slots their project already holds, then arrival); a waiter gets a slot
+# only when it is among the first `free` waiters. Waiters that stop
+# refreshing their liveness entry are dropped so they cannot block the head.
+ACQUIRE_SLOT_SCRIPT = """
+local holders, waiters, alive = KEYS[1], KEYS[2], KEYS[3]
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local limit, lease = tonumber(ARGV[1]), tonumber(ARGV[2])
+local holder, score = ARGV[3], tonumber(ARGV[4])
+
+redis.call('ZREMRANGEBYSCORE', holders, '-inf', now)
+for _, dead in ipairs(redis.call('ZRANGEBYSCORE', alive, '-inf', now)) do
+    redis.call('ZREM', waiters, dead)
+    redis.call('ZREM', alive, dead)
+end
+redis.call('ZADD', waiters, 'NX', score, holder)
+redis.call('ZADD', alive, now + 30, holder)
+
+local free = limit - redis.call('ZCARD', holders)
+if free <= 0 then
+    return 0
+end
+for _, waiter in ipairs(redis.call('ZRANGE', waiters, 0, free - 1)) do
+    if waiter == holder then
+        redis.call('ZREM', waiters, holder)
+        redis.call('ZREM', alive, holder)
+        redis.call('ZADD', holders, now + lease, holder)
+        return 1
+    end
+end
+return 0
+"""
+
+
+# Extends a held slot's lease; a slot that already expired is not revived
+RENEW_SLOT_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+return redis.call('ZADD', KEYS[1], 'XX', 'CH', now + tonumber(ARGV[1]), ARGV[2])
+"""
+
+
+class RateLimitTimeout(Exception):
+    """Raised when no slot for a model became available in time."""
+
+
+class SlotUnavailable(Exception):
+    """Raised by try_acquire when the model has no free slot right now."""
+
+
+class ModelRateLimiter:
+    """
+    Cluster-wide limiter for fal.ai calls, keyed by model ID.
+
+    Every call takes a concurrency slot (fairly shared between projects and
+    ordered by priority) and a token from the model's token bucket. Redis
+    errors fail open so an unavailable Redis never stops generation.
+    """
+
+    def __init__(
+        self,
+        client: Optional[redis.Redis] = None,
+        limits: dict = MODEL_LIMITS,
+        queue_lease: int = FAL_QUEUE_SLOT_LEASE,
+    ):
+        self._client = client
+        self.limits = limits
+        self.queue_lease = queue_lease
+
+    @property
+    def client(self) -> redis.Redis:
+        return self._client or get_redis()
+
+    def _limits(self, model: str) -> dict:
+        return self.limits.get(model, DEFAULT_VIDEO_LIMITS)
+
+    def _keys(self, model: str) -> list[str]:
+        return [
+            f"ratelimit:holders:{model}",
+            f"ratelimit:waiters:{model}",
+            f"ratelimit:alive:{model}",
+        ]
+
+    def _score(self, model: str, project_id: Optional[int], priority: int) -> float:
+        held = 0
+        if project_id is not None:
+            prefix = f"project:{project_id}:"
+            held = sum(
+                1 for holder in self.client.zrange(f"ratelimit:holders:{model}", 0, -1)
+                if holder.startswith(prefix)
+            )
+        return priority * 1e15 + held * 1e13 + time.time() * 1000
+
+    def _holder_id(self, project_id: Optional[int], name: Optional[str] = None) -> str:
+        return f"project:{project_id}:{name or uuid.uuid4().hex}"
+
+    def _try_acquire(self, model: str, holder: str, score: float, lease: int) -> bool:
+        return bool(self.client.eval(
+            ACQUIRE_SLOT_SCRIPT, 3, *self._keys(model),
+            self._limits(model)["concurrency"], lease, holder, score,
+        ))
+
+    def _take_token(self, model: str) -> float:
+        limits = self._limits(model)
+        return float(self.client.eval(
+            TOKEN_BUCKET_SCRIPT, 1, f"ratelimit:bucket:{model}",
+            limits["rate"], limits["burst"],
+        ))
+
+    def _renew(self, model: str, holder: str, lease: int):
+        self.client.eval(RENEW_SLOT_SCRIPT, 1, f"ratelimit:holders:{model}", lease, holder)
+
+    def _abandon(self, model: str, holder: str):
+        holders, waiters, alive = self._keys(model)
+        pipe = self.client.pipeline()
+        pipe.zrem(waiters, holder)
+        pipe.zrem(alive, holder)
+        pipe.zrem(holders, holder)
+        pipe.execute()
+
+    def acquire(
+        self,
+        model: str,
+        project_id: Optional[int] = None,
+        priority: int = PRIORITY_BATCH,
+        lease: int = FAL_SLOT_LEASE,
+        timeout: float = FAL_RATE_LIMIT_TIMEOUT,
+    ) -> Optional[str]:
+        """Block until a slot and a token are available; return the slot's holder id."""
+        holder = self._holder_id(project_id)
+        deadline = time.monotonic() + timeout
+        try:
+            score = self._score(model, project_id, priority)
+            while not self._try_acquire(model, holder, score, lease):
+                if time.monotonic() > deadline:
+                    raise RateLimitTimeout(f"No slot for {model} within {timeout}s")
+                time.sleep(POLL_INTERVAL)
+            while (wait := self._take_token(model)) > 0:
+                time.sleep(wait)
+        except redis.RedisError:
+            # Fail open, without leaking a slot taken before the error
+            self.release(model, holder)
+            return None
+        except BaseException:
+            self.release(model, holder)
+            raise
+        return holder
+
+    def try_acquire(
+        self,
+        model: str,
+        name: str,
+        project_id: Optional[int] = None,
+        priority: int = PRIORITY_BATCH,
+        lease: int = FAL_SLOT_LEASE,
+    ) -> Optional[str]:
+        """
+        Take a slot (and a token) without waiting for one, for callers that
+        must not block a worker thread. Raises SlotUnavailable when none is
+        free; the caller keeps its place in line as long as it retries under
+        the same `name` within the liveness window.
+        """
+        holder = self._holder_id(project_id, name)
+        try:
+            score = self._score(model, project_id, priority)
+            if not self._try_acquire(model, holder, score, lease):
+                raise SlotUnavailable(f"No free slot for {model}")
+            while (wait := self._take_token(model)) > 0:
+                time.sleep(wait)
+        except redis.RedisError:
+            self.release(model, holder)
+            return None
+        except SlotUnavailable:
+            raise
+        except BaseException:
+            self.release(model, holder)
+            raise
+        return holder
+
+    def release(self, model: str, holder: Optional[str]):
+        if holder is None:
+            return
+        try:
+            self._abandon(model, holder)
+        except redis.RedisError:
+            pass
+
+    async def acquire_async(
+        self,
+        model: str,
+        project_id: Optional[int] = None,
+        priority: int = PRIORITY_BATCH,
+        lease: int = FAL_SLOT_LEASE,
+        timeout: float = FAL_RATE_LIMIT_TIMEOUT,
+    ) -> Optional[str]:
+        """Async version of acquire; Redis calls run in a thread."""
+        holder = self._holder_id(project_id)
+        deadline = time.monotonic() + timeout
+        try:
+            score = await asyncio.to_thread(self._score, model, project_id, priority)
+            while not await asyncio.to_thread(self._try_acquire, model, holder, score, lease):
+                if time.monotonic() > deadline:
+                    raise RateLimitTimeout(f"No slot for {model} within {timeout}s")
+                await asyncio.sleep(POLL_INTERVAL)
+            while (wait := await asyncio.to_thread(self._take_token, model)) > 0:
+                await asyncio.sleep(wait)
+        except redis.RedisError:
+            await asyncio.to_thread(self.release, model, holder)
+            return None
+        except BaseException:
+            await asyncio.to_thread(self.release, model, holder)
+            raise
+        return holder
+
+    def renew(self, model: str, holder: Optional[str], lease: int = FAL_SLOT_LEASE):
+        if holder is None:
+            return
+        try:
+            self._renew(model, holder, lease)
+        except redis.RedisError:
+            pass
+
+    @contextmanager
+    def slot(self, model: str, project_id: Optional[int] = None, priority: int = PRIORITY_BATCH):
+        """Hold a slot for the enclosed call, renewing its lease while the call runs."""
+        holder = self.acquire(model, project_id, priority)
+        stop = threading.Event()
+
+        def keep_alive():
+            while not stop.wait(FAL_SLOT_LEASE / 3):
+                self.renew(model, holder)
+
+        keeper = threading.Thread(target=keep_alive, daemon=True)
+        try:
+            if holder is not None:
+                keeper.start()
+            yield holder
+        finally:
+            stop.set()
+            self.release(model, holder)
+
+    @asynccontextmanager
+    async def slot_async(self, model: str, project_id: Optional[int] = None, priority: int = PRIORITY_BATCH):
+        """Async version of slot."""
+        holder = await self.acquire_async(model, project_id, priority)
+
+        async def keep_alive():
+            while True:
+                await asyncio.sleep(FAL_SLOT_LEASE / 3)
+                await asyncio.to_thread(self.renew, model, holder)
+
+        keeper = asyncio.create_task(keep_alive()) if holder is not None else None
+        try:
+            yield holder
+        finally:
+            if keeper:
+                keeper.cancel()
+            await asyncio.to_thread(self.release, model, holder)
+
+
+_limiter: Optional[ModelRateLimiter] = None
+
+
+def get_rate_limiter() -> Optional[ModelRateLimiter]:
+    """Return the shared limiter, or None when rate limiting is disabled."""
+    global _limiter
+    if not FAL_RATE_LIMIT_ENABLED:
+        return None
+    if _limiter is None:
+        _limiter = ModelRateLimiter()
+    return _limiter
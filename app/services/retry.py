@@ -0,0 +1,59 @@
+import asyncio
+import os
+import random
+import time
+from typing import Awaitable, Callable, TypeVar
+
+import httpx
+from fal_client.client import FalClientError
+
+from app.services.downloader import IncompleteDownload
+
+T = TypeVar("T")
+
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "2"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "60"))
+
+TRANSIENT_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+def is_transient(exc: BaseException) -> bool:
+    """True for network errors and HTTP responses worth trying again."""
+    # fal_client wraps HTTP errors, the original response is the cause
+    if isinstance(exc, FalClientError) and exc.__cause__ is not None:
+        exc = exc.__cause__
+    if isinstance(exc, (httpx.TransportError, IncompleteDownload)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in TRANSIENT_STATUS_CODES
+    return False
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given (0-based) attempt."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt))
+
+
+def retry_call(fn: Callable[..., T], *args, attempts: int = RETRY_ATTEMPTS, **kwargs) -> T:
+    """Call fn, retrying transient failures with exponential backoff."""
+    for attempt in range(attempts):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts - 1 or not is_transient(e):
+                raise
+            time.sleep(backoff_delay(attempt))
+
+
+async def retry_call_async(
+    fn: Callable[..., Awaitable[T]], *args, attempts: int = RETRY_ATTEMPTS, **kwargs
+) -> T:
+    """Async version of retry_call."""
+    for attempt in range(attempts):
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts - 1 or not is_transient(e):
+                raise
+            await asyncio.sleep(backoff_delay(attempt))
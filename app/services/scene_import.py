@@ -0,0 +1,108 @@
+import csv
+import io
+import json
+import os
+from typing import Optional
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Project, Scene
+
+# Upper bound on the scenes of a single import
+MAX_IMPORT_SCENES = int(os.getenv("MAX_IMPORT_SCENES", "1000"))
+
+IMPORT_FORMATS = ("json", "csv", "script")
+
+
+class SceneImportError(ValueError):
+    pass
+
+
+def detect_format(filename: str, content_type: Optional[str] = None) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext == ".json" or content_type == "application/json":
+        return "json"
+    if ext == ".csv" or content_type == "text/csv":
+        return "csv"
+    return "script"
+
+
+def parse_json(text: str) -> list[str]:
+    """A list of prompts or of {"prompt": ...} objects, optionally under "scenes"."""
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise SceneImportError(f"Invalid JSON: {e}") from e
+    if isinstance(data, dict):
+        data = data.get("scenes")
+    if not isinstance(data, list):
+        raise SceneImportError('Expected a list of scenes or {"scenes": [...]}')
+
+    prompts = []
+    for i, item in enumerate(data):
+        prompt = item.get("prompt") if isinstance(item, dict) else item
+        if not isinstance(prompt, str):
+            raise SceneImportError(f"Scene {i+1} has no prompt")
+        prompts.append(prompt)
+    return prompts
+
+
+def parse_csv(text: str) -> list[str]:
+    """Prompts from the "prompt" column, or the first column without a header."""
+    rows = list(csv.reader(io.StringIO(text)))
+    if not rows:
+        return []
+    header = [cell.strip().lower() for cell in rows[0]]
+    if "prompt" in header:
+        column, rows = header.index("prompt"), rows[1:]
+    else:
+        column = 0
+    return [row[column] for row in rows if len(row) > column]
+
+
+def parse_script(text: str) -> list[str]:
+    """One scene per paragraph; paragraphs are separated by blank lines."""
+    paragraphs, current = [], []
+    for line in text.splitlines():
+        if line.strip():
+            current.append(line.strip())
+        elif current:
+            paragraphs.append(" ".join(current))
+            current = []
+    if current:
+        paragraphs.append(" ".join(current))
+    return paragraphs
+
+
+PARSERS = {"json": parse_json, "csv": parse_csv, "script": parse_script}
+
+
+def parse_scenes(text: str, fmt: str) -> list[str]:
+    """Scene prompts of an import file in the given format."""
+    if fmt not in PARSERS:
+        raise SceneImportError(f"Unknown format: {fmt}")
+    prompts = [prompt.strip() for prompt in PARSERS[fmt](text)]
+    prompts = [prompt for prompt in prompts if prompt]
+    if not prompts:
+        raise SceneImportError("No scenes found")
+    if len(prompts) > MAX_IMPORT_SCENES:
+        raise SceneImportError(f"At most {MAX_IMPORT_SCENES} scenes can be imported at once")
+    return prompts
+
+
+async def lock_project_scenes(db: AsyncSession, project_id: int) -> Optional[int]:
+    """
+    Lock the project row for the rest of the transaction, so concurrent
+    writers assign scene orders one after another. Returns the next free
+    order, or None if the project does not exist.
+    """
+    locked = await db.scalar(
+        select(Project.id).where(Project.id == project_id).with_for_update()
+    )
+    if locked is None:
+        return None
+    last_order = await db.scalar(
+        select(func.max(Scene.order)).where(Scene.project_id == project_id)
+    )
+    return 0 if last_order is None else last_order + 1
@@ -0,0 +1,387 @@
+"""
+Garbage collection of the uploads volume.
+
+Every file under UPLOADS_PATH is attributed to an owner by the database
+rows referencing it (scene uploads, clips and drafts; project outputs and
+live playlists) and by the project directory it lives in. Its last access
+is its atime, which the pipeline bumps whenever it reuses a file (mtimes
+stay untouched, they are part of the ffmpeg cache keys).
+
+A collection first removes unreferenced files, then, while the volume is
+over STORAGE_MAX_BYTES, evicts referenced artifacts that can be rebuilt,
+least recently used first and cheapest to rebuild first: ffmpeg caches,
+live playlists, drafts, final outputs and, last, scene clips. Uploaded
+images and audio in use are never evicted, nor is anything of a project
+that is being rendered.
+"""
+import os
+import shutil
+import time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional
+
+from app.models import Project, Scene, GenerationStep, ProjectStatus
+
+UPLOADS_PATH = Path(os.getenv("UPLOADS_PATH", "/app/uploads"))
+
+# Disk budget of the uploads volume, in bytes
+STORAGE_MAX_BYTES = int(os.getenv("STORAGE_MAX_BYTES", str(200 * 1024**3)))
+# Files younger than this are never collected, so uploads and renders in
+# flight are not mistaken for orphans
+STORAGE_GRACE_SECONDS = int(os.getenv("STORAGE_GRACE_SECONDS", str(24 * 3600)))
+# Collections by Celery beat only report what they would evict
+STORAGE_GC_DRY_RUN = os.getenv("STORAGE_GC_DRY_RUN", "false").lower() == "true"
+
+# Kinds of rebuildable artifacts, in the order they are evicted for space
+EVICTION_ORDER = ("cache", "hls", "draft", "output", "clip")
+# Directories of uploaded scene files (content-addressed, shared by scenes)
+UPLOAD_DIRS = ("images", "audio")
+# Managed by GenerationCache under its own quota
+SKIPPED_DIRS = (Path("cache") / "generations",)
+
+ACTIVE_STATUSES = (ProjectStatus.GENERATING, ProjectStatus.STITCHING)
+
+
+@dataclass
+class Artifact:
+    path: Path
+    size: int
+    last_access: float
+    kind: str  # "upload", "clip", "output", "draft", "hls", "cache" or "temp"
+    project_id: Optional[int] = None
+    scene_id: Optional[int] = None
+    referenced: bool = False
+    # Clips restored from the generation cache are hard links to its files,
+    # so space is accounted per inode
+    inode: tuple[int, int] = (0, 0)
+    links: int = 1
+
+
+@dataclass
+class Eviction:
+    artifact: Artifact
+    reason: str  # "unreferenced" or "over budget"
+
+
+def touch(path: Optional[str]):
+    """Record an access to a file (atime only, the mtime is left alone)."""
+    if not path:
+        return
+    try:
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+    except OSError:
+        pass
+
+
+def _absolute(path: Optional[str], uploads_path: Path) -> Optional[Path]:
+    if not path:
+        return None
+    path = Path(path)
+    return path if path.is_absolute() else uploads_path / path
+
+
+def _project_dir_id(name: str) -> Optional[int]:
+    prefix, _, project_id = name.partition("_")
+    return int(project_id) if prefix == "project" and project_id.isdigit() else None
+
+
+class References:
+    """Owners of the files referenced from the database."""
+
+    def __init__(self, uploads_path: Path = UPLOADS_PATH):
+        self.uploads_path = uploads_path
+        self.owners: dict[Path, tuple[int, Optional[int]]] = {}  # path -> (project, scene)
+        self.projects: set[int] = set()
+        self.active_projects: set[int] = set()
+        self.playlists: set[int] = set()  # projects whose live playlist is current
+
+    def add(self, path: Optional[str], project_id: int, scene_id: Optional[int] = None):
+        path = _absolute(path, self.uploads_path)
+        if path is not None:
+            self.owners.setdefault(path, (project_id, scene_id))
+
+    @classmethod
+    def load(cls, db, uploads_path: Path = UPLOADS_PATH) -> "References":
+        refs = cls(uploads_path)
+        for project in db.query(Project).yield_per(1000):
+            refs.projects.add(project.id)
+            if project.status in ACTIVE_STATUSES or project.draft_status in ACTIVE_STATUSES:
+                refs.active_projects.add(project.id)
+            if project.preview_playlist_path:
+                refs.playlists.add(project.id)
+            refs.add(project.output_video_path, project.id)
+            refs.add(project.draft_video_path, project.id)
+
+        columns = (
+            Scene.id, Scene.project_id, Scene.reference_image_path, Scene.audio_path,
+            Scene.video_path, Scene.draft_image_path, Scene.draft_video_path,
+        )
+        for scene_id, project_id, *paths in db.query(*columns).yield_per(1000):
+            for path in paths:
+                refs.add(path, project_id, scene_id)
+        return refs
+
+
+def _walk(directory: Path) -> Iterable[os.DirEntry]:
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from _walk(Path(entry.path))
+        elif entry.is_file(follow_symlinks=False):
+            yield entry
+
+
+def classify(relative: Path, refs: References) -> tuple[Optional[str], Optional[int]]:
+    """Kind and owning project (by directory) of a file, or (None, None) to skip it."""
+    parts = relative.parts
+    if len(parts) == 1:
+        # ffmpeg concat lists and the like left behind by killed workers
+        return "temp", None
+    top = parts[0]
+    if top in UPLOAD_DIRS:
+        return "upload", None
+    if top == "cache":
+        return "cache", None
+    if top in ("clips", "drafts", "output"):
+        project_id = _project_dir_id(parts[1]) if len(parts) > 2 else None
+        if top == "output" and len(parts) > 3 and parts[2] == "hls":
+            return "hls", project_id
+        return {"clips": "clip", "drafts": "draft", "output": "output"}[top], project_id
+    if top.startswith("render_"):
+        return "temp", None
+    return None, None
+
+
+def scan(refs: References, uploads_path: Path = UPLOADS_PATH) -> list[Artifact]:
+    """Every collectable file of the uploads volume with its owner."""
+    artifacts = []
+    for entry in _walk(uploads_path):
+        path = Path(entry.path)
+        relative = path.relative_to(uploads_path)
+        if any(relative.is_relative_to(skipped) for skipped in SKIPPED_DIRS):
+            continue
+        kind, project_id = classify(relative, refs)
+        if kind is None:
+            continue
+        stat = entry.stat(follow_symlinks=False)
+        artifact = Artifact(
+            path=path,
+            size=stat.st_size,
+            last_access=max(stat.st_atime, stat.st_mtime),
+            kind=kind,
+            project_id=project_id,
+            inode=(stat.st_dev, stat.st_ino),
+            links=stat.st_nlink,
+        )
+        if path in refs.owners:
+            artifact.project_id, artifact.scene_id = refs.owners[path]
+            artifact.referenced = True
+        elif kind == "hls" and project_id in refs.playlists:
+            artifact.referenced = True
+        elif kind == "cache":
+            # Keyed by content, in use until evicted for space
+            artifact.referenced = True
+        artifacts.append(artifact)
+    return artifacts
+
+
+def used_bytes(artifacts: list[Artifact]) -> int:
+    """Disk space of the artifacts, counting hard-linked files once."""
+    return sum({a.inode: a.size for a in artifacts}.values())
+
+
+def generation_cache_bytes(artifacts: list[Artifact], uploads_path: Path = UPLOADS_PATH) -> int:
+    """Disk space of the generation cache not already counted as an artifact."""
+    seen = {a.inode for a in artifacts}
+    sizes = {}
+    for skipped in SKIPPED_DIRS:
+        for entry in _walk(uploads_path / skipped):
+            stat = entry.stat(follow_symlinks=False)
+            if (stat.st_dev, stat.st_ino) not in seen:
+                sizes[(stat.st_dev, stat.st_ino)] = stat.st_size
+    return sum(sizes.values())
+
+
+class SpaceLedger:
+    """Bytes freed by deleting files: an inode's space only once its last link goes."""
+
+    def __init__(self):
+        self.unlinked: Counter = Counter()
+
+    def delete(self, artifact: Artifact) -> int:
+        self.unlinked[artifact.inode] += 1
+        return artifact.size if self.unlinked[artifact.inode] >= artifact.links else 0
+
+
+def freed_bytes(evictions: list[Eviction]) -> int:
+    ledger = SpaceLedger()
+    return sum(ledger.delete(e.artifact) for e in evictions)
+
+
+def plan_evictions(
+    artifacts: list[Artifact],
+    refs: References,
+    max_bytes: int = STORAGE_MAX_BYTES,
+    grace_seconds: int = STORAGE_GRACE_SECONDS,
+    extra_bytes: int = 0,
+    now: Optional[float] = None,
+) -> list[Eviction]:
+    """
+    Files to delete: unreferenced ones past the grace period, then
+    rebuildable ones in EVICTION_ORDER, least recently used first, until
+    the volume (plus `extra_bytes` not scanned) fits `max_bytes`. Files
+    with hard links outside the scan (into the generation cache) free no
+    space and are not evicted for it.
+    """
+    now = now or time.time()
+    ledger = SpaceLedger()
+    total = extra_bytes + used_bytes(artifacts)
+    evictions = []
+    kept = []
+    for artifact in artifacts:
+        if artifact.project_id in refs.active_projects:
+            continue
+        if not artifact.referenced and now - artifact.last_access > grace_seconds:
+            evictions.append(Eviction(artifact, "unreferenced"))
+            total -= ledger.delete(artifact)
+        else:
+            kept.append(artifact)
+
+    scanned_links = Counter(a.inode for a in artifacts)
+    # Shared caches may be read by any render in progress
+    evictable = [kind for kind in EVICTION_ORDER if kind != "cache" or not refs.active_projects]
+    candidates = sorted(
+        (a for a in kept if a.kind in evictable and a.links <= scanned_links[a.inode]),
+        key=lambda a: (EVICTION_ORDER.index(a.kind), a.last_access),
+    )
+    for artifact in candidates:
+        if total <= max_bytes:
+            break
+        evictions.append(Eviction(artifact, "over budget"))
+        total -= ledger.delete(artifact)
+    return evictions
+
+
+def release_references(db, evictions: list[Eviction], uploads_path: Path = UPLOADS_PATH):
+    """Clear the database references to evicted files, so they count as missing."""
+    evicted = {e.artifact.path for e in evictions if e.artifact.referenced}
+    if not evicted:
+        return
+
+    def is_evicted(path: Optional[str]) -> bool:
+        return _absolute(path, uploads_path) in evicted
+
+    project_ids = {e.artifact.project_id for e in evictions if e.artifact.referenced}
+    for project in db.query(Project).filter(Project.id.in_(project_ids)):
+        if is_evicted(project.output_video_path):
+            project.output_video_path = None
+        if is_evicted(project.draft_video_path):
+            project.draft_video_path = None
+        if project.preview_playlist_path and any(
+            e.artifact.kind == "hls" and e.artifact.project_id == project.id for e in evictions
+        ):
+            project.preview_playlist_path = None
+
+    scene_ids = {e.artifact.scene_id for e in evictions if e.artifact.scene_id is not None}
+    for scene in db.query(Scene).filter(Scene.id.in_(scene_ids)):
+        if is_evicted(scene.video_path):
+            scene.video_path = None
+            if scene.generation_step == GenerationStep.DOWNLOADED:
+                scene.generation_step = GenerationStep.VIDEO
+        if is_evicted(scene.draft_video_path):
+            scene.draft_video_path = None
+        if is_evicted(scene.draft_image_path):
+            scene.draft_image_path = None
+            scene.draft_fingerprint = None
+    db.commit()
+
+
+def collect(db, dry_run: bool = STORAGE_GC_DRY_RUN, uploads_path: Path = UPLOADS_PATH) -> dict:
+    """Run one collection (or only plan it) and return its report."""
+    refs = References.load(db, uploads_path)
+    artifacts = scan(refs, uploads_path)
+    cache_bytes = generation_cache_bytes(artifacts, uploads_path)
+    evictions = plan_evictions(artifacts, refs, extra_bytes=cache_bytes)
+
+    if not dry_run:
+        # Forget the files first: a reference to a missing file is re-rendered,
+        # a deleted file that is still referenced breaks the project
+        release_references(db, evictions, uploads_path)
+        for eviction in evictions:
+            eviction.artifact.path.unlink(missing_ok=True)
+        _remove_empty_dirs(uploads_path)
+
+    used = cache_bytes + used_bytes(artifacts)
+    freed = freed_bytes(evictions)
+    by_kind: dict[str, dict] = {}
+    for eviction in evictions:
+        entry = by_kind.setdefault(eviction.artifact.kind, {"files": 0, "bytes": 0})
+        entry["files"] += 1
+        entry["bytes"] += eviction.artifact.size
+
+    return {
+        "dry_run": dry_run,
+        "max_bytes": STORAGE_MAX_BYTES,
+        "used_bytes": used,
+        "used_after_bytes": used - freed,
+        "files": len(artifacts),
+        "evicted_files": len(evictions),
+        "evicted_bytes": freed,
+        "evicted_by_kind": by_kind,
+        "evictions": [
+            {
+                "path": str(e.artifact.path.relative_to(uploads_path)),
+                "kind": e.artifact.kind,
+                "bytes": e.artifact.size,
+                "project_id": e.artifact.project_id,
+                "scene_id": e.artifact.scene_id,
+                "last_access": e.artifact.last_access,
+                "reason": e.reason,
+            }
+            for e in evictions[:500]
+        ],
+    }
+
+
+def _remove_empty_dirs(uploads_path: Path):
+    for top in ("clips", "drafts", "output", "cache"):
+        for directory in sorted((uploads_path / top).glob("**/"), reverse=True):
+            if directory == uploads_path / top:
+                continue
+            try:
+                directory.rmdir()
+            except OSError:
+                pass
+
+
+def _owned_by_uploads(path: Optional[str], uploads_path: Path) -> bool:
+    """Whether a path lies in a per-project directory this module may delete."""
+    path = _absolute(path, uploads_path)
+    if path is None:
+        return False
+    try:
+        relative = path.resolve().relative_to(uploads_path.resolve())
+    except ValueError:
+        return False
+    return len(relative.parts) > 1 and relative.parts[0] in ("clips", "drafts", "output")
+
+
+def remove_project_files(project_id: int, uploads_path: Path = UPLOADS_PATH):
+    """Delete the clips, drafts and outputs of a deleted project."""
+    for top in ("clips", "drafts", "output"):
+        shutil.rmtree(uploads_path / top / f"project_{project_id}", ignore_errors=True)
+
+
+def remove_scene_files(paths: Iterable[Optional[str]], uploads_path: Path = UPLOADS_PATH):
+    """
+    Delete the clip and draft files of a deleted scene. Uploaded images and
+    audio may be shared with other scenes and are left to `collect`.
+    """
+    for path in paths:
+        if _owned_by_uploads(path, uploads_path):
+            _absolute(path, uploads_path).unlink(missing_ok=True)
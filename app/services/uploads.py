@@ -0,0 +1,73 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from app.services.storage import touch
+
+UPLOADS_PATH = os.getenv("UPLOADS_PATH", "/app/uploads")
+
+# Size limits of scene uploads, in bytes
+MAX_IMAGE_UPLOAD_BYTES = int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_AUDIO_UPLOAD_BYTES = int(os.getenv("MAX_AUDIO_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+UPLOAD_LIMITS = {"images": MAX_IMAGE_UPLOAD_BYTES, "audio": MAX_AUDIO_UPLOAD_BYTES}
+
+
+class UploadTooLarge(ValueError):
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Upload exceeds {max_bytes / (1024 * 1024):g} MB")
+
+
+def _copy_and_hash(source, directory: Path, max_bytes: int) -> tuple[Path, str]:
+    """Copy a file object chunk by chunk into a temp file, hashing as it goes."""
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(dir=directory, prefix="tmp_", delete=False) as tmp:
+        tmp_path = Path(tmp.name)
+        try:
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                digest.update(chunk)
+                tmp.write(chunk)
+        except BaseException:
+            tmp.close()
+            tmp_path.unlink(missing_ok=True)
+            raise
+    return tmp_path, digest.hexdigest()
+
+
+def _store_blob(source, directory: Path, ext: str, max_bytes: int) -> str:
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp_path, sha256 = _copy_and_hash(source, directory, max_bytes)
+    blob_path = directory / f"{sha256}{ext}"
+    if blob_path.exists():
+        # Identical content was uploaded before, share its blob
+        tmp_path.unlink()
+        touch(str(blob_path))
+    else:
+        os.replace(tmp_path, blob_path)
+    return str(blob_path)
+
+
+async def store_upload(upload: UploadFile, kind: str) -> str:
+    """
+    Store an uploaded scene file ("images" or "audio") under its content hash
+    and return its path. The upload is streamed to disk in chunks (in a worker
+    thread, so the event loop never blocks on file I/O) and rejected with
+    UploadTooLarge once it passes the kind's size limit.
+    """
+    max_bytes = UPLOAD_LIMITS[kind]
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+
+    ext = os.path.splitext(upload.filename or "")[1].lower()
+    return await run_in_threadpool(
+        _store_blob, upload.file, Path(UPLOADS_PATH) / kind, ext, max_bytes
+    )
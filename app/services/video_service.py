@@ -1,29 +1,631 @@
+import fcntl
+import hashlib
+import json
+import math
+import shutil
 import subprocess
 import os
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict, field
 from pathlib import Path
-from typing import List
+from typing import List, Optional
+
+from app.services.metrics import span
+from app.services.storage import touch
+
+# Total ffmpeg threads a single stitch may use, split across parallel jobs
+FFMPEG_THREAD_BUDGET = int(os.getenv("FFMPEG_THREAD_BUDGET", str(os.cpu_count() or 2)))
+FFMPEG_THREADS_PER_JOB = int(os.getenv("FFMPEG_THREADS_PER_JOB", "2"))
+# Cores all ffmpeg jobs on this host may use together, shared across worker
+# processes through lock files so concurrent renders do not oversubscribe
+FFMPEG_HOST_CORE_BUDGET = int(os.getenv("FFMPEG_HOST_CORE_BUDGET", str(os.cpu_count() or 2)))
+FFMPEG_LOCK_DIR = os.getenv("FFMPEG_LOCK_DIR", os.path.join(tempfile.gettempdir(), "ffmpeg-slots"))
+
+# Encoders used when a clip has to be re-encoded to the target codec
+ENCODERS = {"h264": "libx264", "hevc": "libx265", "vp9": "libvpx-vp9"}
+# ffprobe profile names -> libx264 -profile:v values
+H264_PROFILES = {
+    "Constrained Baseline": "baseline",
+    "Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+    "High 10": "high10",
+    "High 4:2:2": "high422",
+    "High 4:4:4 Predictive": "high444",
+}
+AUDIO_ENCODERS = {"aac": "aac", "opus": "libopus", "mp3": "libmp3lame"}
+
+# Long timelines are stitched as chapters of about this many clips; chapter
+# files are cached, so changing, inserting or removing a scene only
+# re-stitches its chapter and the top level
+CHAPTER_SIZE = int(os.getenv("CHAPTER_SIZE", "50"))
+CHAPTER_PARALLELISM = int(os.getenv("CHAPTER_PARALLELISM", "4"))
+
+# Re-encode settings for single-pass renders
+RENDER_PRESET = os.getenv("RENDER_PRESET", "veryfast")
+RENDER_CRF = int(os.getenv("RENDER_CRF", "20"))
+RENDER_SAMPLE_RATE = 48000
+# Rough encoder throughput used for cost estimates: CPU seconds per output
+# second of 1080p video at RENDER_PRESET
+RENDER_CPU_SECONDS_PER_1080P_SECOND = float(os.getenv("RENDER_CPU_SECONDS_PER_1080P_SECOND", "1.5"))
+# Re-encoded timelines longer than this are split at scene boundaries into
+# segments of about this length, encoded in parallel and concatenated
+RENDER_SEGMENT_SECONDS = float(os.getenv("RENDER_SEGMENT_SECONDS", "60"))
+
+# Target length of the segments of live HLS preview playlists
+HLS_SEGMENT_SECONDS = float(os.getenv("HLS_SEGMENT_SECONDS", "4"))
+# Moves the moov atom to the front so MP4s start playing before fully downloaded
+FASTSTART_ARGS = ["-movflags", "+faststart"]
+
+# Draft clips: fast, low quality encodes of still images with a slow zoom
+DRAFT_PRESET = os.getenv("DRAFT_PRESET", "ultrafast")
+DRAFT_CRF = int(os.getenv("DRAFT_CRF", "30"))
+KEN_BURNS_FPS = 24
+KEN_BURNS_ZOOM = 1.2  # scale reached at the end of a clip
+
+
+@contextmanager
+def host_core_slot(threads: int = FFMPEG_THREADS_PER_JOB):
+    """
+    Hold one of the host's ffmpeg slots (FFMPEG_HOST_CORE_BUDGET / threads)
+    while the block runs, waiting for a free slot if necessary.
+    """
+    slots = max(1, FFMPEG_HOST_CORE_BUDGET // max(1, threads))
+    os.makedirs(FFMPEG_LOCK_DIR, exist_ok=True)
+    while True:
+        for i in range(slots):
+            handle = open(os.path.join(FFMPEG_LOCK_DIR, f"slot_{i}.lock"), "w")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                handle.close()
+                continue
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+                handle.close()
+            return
+        time.sleep(0.5)
+
+
+@dataclass(frozen=True)
+class ClipProfile:
+    """
+    Stream parameters that must match for concat with stream copy.
+
+    The concat demuxer keeps the first clip's codec extradata (the H.264
+    SPS/PPS), so clips with a different profile, level or extradata decode
+    wrongly after the join even when size and frame rate agree.
+    """
+
+    video_codec: str
+    width: int
+    height: int
+    fps: str
+    pix_fmt: str
+    time_base: str
+    profile: Optional[str] = None
+    level: Optional[int] = None
+    extradata_hash: Optional[str] = None
+    audio_codec: Optional[str] = None
+    sample_rate: Optional[int] = None
+    channels: Optional[int] = None
+
+
+def probe_clip(path: str) -> ClipProfile:
+    """Read a clip's stream parameters with ffprobe."""
+    result = subprocess.run(
+        [
+            "ffprobe", "-v", "error",
+            "-show_entries",
+            "stream=codec_type,codec_name,profile,level,width,height,r_frame_rate,pix_fmt,time_base,"
+            "extradata_hash,sample_rate,channels",
+            "-show_data_hash", "sha256",
+            "-of", "json",
+            path,
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    streams = json.loads(result.stdout)["streams"]
+    video = next(s for s in streams if s["codec_type"] == "video")
+    audio = next((s for s in streams if s["codec_type"] == "audio"), None)
+    return ClipProfile(
+        video_codec=video["codec_name"],
+        width=int(video["width"]),
+        height=int(video["height"]),
+        fps=video["r_frame_rate"],
+        pix_fmt=video["pix_fmt"],
+        time_base=video["time_base"],
+        profile=video.get("profile"),
+        level=video.get("level"),
+        extradata_hash=video.get("extradata_hash"),
+        audio_codec=audio["codec_name"] if audio else None,
+        sample_rate=int(audio["sample_rate"]) if audio else None,
+        channels=int(audio["channels"]) if audio else None,
+    )
+
+
+def probe_duration(path: str) -> float:
+    """Read a media file's duration in seconds with ffprobe."""
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return float(result.stdout.strip())
+
+
+def clip_identity(path: str) -> str:
+    """Cheap identity of a clip file (path, size, mtime) used in cache keys."""
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def chapter_groups(keys: List[str], chapter_size: int = CHAPTER_SIZE) -> List[List[int]]:
+    """
+    Split a timeline into chapters with content-defined boundaries: a
+    chapter ends after a clip whose key hashes to 0 modulo `chapter_size`
+    (so chapters average about `chapter_size` clips), at least a quarter
+    and at most twice that long. Boundaries depend on the clips around
+    them, not on their index, so inserting or removing a scene only
+    changes the chapter it lands in.
+    """
+    min_size, max_size = max(1, chapter_size // 4), 2 * chapter_size
+    groups, current = [], []
+    for i, key in enumerate(keys):
+        current.append(i)
+        natural = int(hashlib.sha256(key.encode()).hexdigest()[:8], 16) % chapter_size == 0
+        if len(current) >= max_size or (len(current) >= min_size and natural):
+            groups.append(current)
+            current = []
+    if current:
+        groups.append(current)
+    return groups
+
+
+def normalize_clip(path: str, target: ClipProfile, output_path: str, threads: int) -> str:
+    """Re-encode a clip to the target profile (letterboxed, resampled)."""
+    has_audio = probe_clip(path).audio_codec is not None
+    cmd = ["ffmpeg", "-y", "-i", path]
+    if target.audio_codec and not has_audio:
+        # Concat needs the same streams in every clip, add silence
+        cmd += [
+            "-f", "lavfi",
+            "-i", f"anullsrc=r={target.sample_rate}:cl={'mono' if target.channels == 1 else 'stereo'}",
+            "-shortest",
+        ]
+    cmd += [
+        "-vf",
+        f"scale={target.width}:{target.height}:force_original_aspect_ratio=decrease,"
+        f"pad={target.width}:{target.height}:(ow-iw)/2:(oh-ih)/2,"
+        f"fps={target.fps},format={target.pix_fmt}",
+        "-c:v", ENCODERS.get(target.video_codec, "libx264"),
+        "-video_track_timescale", target.time_base.split("/")[1],
+        "-threads", str(threads),
+    ]
+    if target.video_codec == "h264":
+        if target.profile in H264_PROFILES:
+            cmd += ["-profile:v", H264_PROFILES[target.profile]]
+        if target.level and target.level > 0:
+            cmd += ["-level", f"{target.level // 10}.{target.level % 10}"]
+    if target.audio_codec:
+        cmd += [
+            "-c:a", AUDIO_ENCODERS.get(target.audio_codec, "aac"),
+            "-ar", str(target.sample_rate),
+            "-ac", str(target.channels),
+        ]
+    else:
+        cmd += ["-an"]
+    cmd.append(output_path)
+    subprocess.run(cmd, check=True)
+    return output_path
+
+
+@dataclass
+class RenderSegment:
+    """One scene on the render timeline."""
+
+    video_path: str
+    duration: float
+    has_audio: bool = True
+    audio_path: Optional[str] = None  # scene audio placed at the clip's offset
+    start: float = 0.0  # seek into the clip (and its scene audio)
+
+
+@dataclass
+class RenderPlan:
+    """
+    A whole project rendered by one ffmpeg invocation: every clip is scaled
+    to the target size, joined by concat or xfade/acrossfade transitions, and
+    each scene's audio is delayed to its clip's offset and mixed in.
+    """
+
+    segments: List[RenderSegment]
+    width: int
+    height: int
+    fps: str
+    transition: Optional[str] = None  # any xfade transition, e.g. "fade"
+    transition_duration: float = 0.5
+    extra_output_args: List[str] = field(default_factory=list)
+
+    @property
+    def overlap(self) -> float:
+        return self.transition_duration if self.transition and len(self.segments) > 1 else 0.0
+
+    def offsets(self) -> List[float]:
+        """Start time of every segment on the output timeline."""
+        offsets, position = [], 0.0
+        for segment in self.segments:
+            offsets.append(position)
+            position += segment.duration - self.overlap
+        return offsets
+
+    @property
+    def total_duration(self) -> float:
+        return sum(s.duration for s in self.segments) - self.overlap * (len(self.segments) - 1)
+
+    def inputs(self) -> List[str]:
+        args = []
+        for segment in self.segments:
+            if segment.start:
+                args += ["-ss", f"{segment.start:.3f}"]
+            args += ["-i", segment.video_path]
+        for segment in self.segments:
+            if segment.audio_path:
+                if segment.start:
+                    args += ["-ss", f"{segment.start:.3f}"]
+                args += ["-i", segment.audio_path]
+        return args
+
+    def split(self, max_seconds: float = RENDER_SEGMENT_SECONDS) -> List["RenderPlan"]:
+        """
+        Split the timeline at scene boundaries into sub-plans of about
+        `max_seconds`, whose outputs concatenate to this plan's output.
+
+        With transitions, a sub-plan starts with the last `transition_duration`
+        seconds of the previous scene as a lead-in (so the crossfade into its
+        first scene is kept) and its output is cut where the next sub-plan's
+        crossfade begins.
+        """
+        groups, current, length = [], [], 0.0
+        for i, segment in enumerate(self.segments):
+            current.append(i)
+            length += segment.duration
+            if length >= max_seconds:
+                groups.append(current)
+                current, length = [], 0.0
+        if current:
+            groups.append(current)
+        if len(groups) < 2:
+            return [self]
+
+        offsets = self.offsets()
+        plans = []
+        for g, group in enumerate(groups):
+            segments = [self.segments[i] for i in group]
+            if self.overlap and g > 0:
+                previous = self.segments[group[0] - 1]
+                segments.insert(0, RenderSegment(
+                    video_path=previous.video_path,
+                    duration=self.overlap,
+                    has_audio=previous.has_audio,
+                    audio_path=previous.audio_path,
+                    start=previous.start + previous.duration - self.overlap,
+                ))
+
+            extra = list(self.extra_output_args)
+            if self.overlap and g < len(groups) - 1:
+                end = offsets[groups[g + 1][0]]
+                extra += ["-t", f"{end - offsets[group[0]]:.3f}"]
+
+            plans.append(RenderPlan(
+                segments=segments,
+                width=self.width,
+                height=self.height,
+                fps=self.fps,
+                transition=self.transition,
+                transition_duration=self.transition_duration,
+                extra_output_args=extra,
+            ))
+        return plans
+
+    def filter_graph(self, video: bool = True, audio: bool = True) -> str:
+        """Filter graph producing [vout] and/or [aout]."""
+        n = len(self.segments)
+        offsets = self.offsets()
+        filters = []
+
+        for i, segment in enumerate(self.segments):
+            if video:
+                filters.append(
+                    f"[{i}:v]scale={self.width}:{self.height}:force_original_aspect_ratio=decrease,"
+                    f"pad={self.width}:{self.height}:(ow-iw)/2:(oh-ih)/2,setsar=1,"
+                    f"fps={self.fps},format=yuv420p,settb=AVTB[v{i}]"
+                )
+            if audio and segment.has_audio:
+                filters.append(
+                    f"[{i}:a]aresample={RENDER_SAMPLE_RATE},aformat=channel_layouts=stereo,"
+                    f"apad,atrim=0:{segment.duration:.3f}[a{i}]"
+                )
+            elif audio:
+                filters.append(
+                    f"anullsrc=r={RENDER_SAMPLE_RATE}:cl=stereo,atrim=0:{segment.duration:.3f}[a{i}]"
+                )
+
+        if n == 1:
+            filters += ["[v0]null[vbase]"] * video + ["[a0]anull[abase]"] * audio
+        elif self.transition:
+            for i in range(1, n):
+                if video:
+                    previous = "v0" if i == 1 else f"vx{i - 1}"
+                    out = "vbase" if i == n - 1 else f"vx{i}"
+                    filters.append(
+                        f"[{previous}][v{i}]xfade=transition={self.transition}:"
+                        f"duration={self.transition_duration}:offset={offsets[i]:.3f}[{out}]"
+                    )
+                if audio:
+                    previous = "a0" if i == 1 else f"ax{i - 1}"
+                    out = "abase" if i == n - 1 else f"ax{i}"
+                    filters.append(f"[{previous}][a{i}]acrossfade=d={self.transition_duration}[{out}]")
+        else:
+            if video:
+                streams = "".join(f"[v{i}]" for i in range(n))
+                filters.append(f"{streams}concat=n={n}:v=1:a=0[vbase]")
+            if audio:
+                streams = "".join(f"[a{i}]" for i in range(n))
+                filters.append(f"{streams}concat=n={n}:v=0:a=1[abase]")
+
+        if video:
+            # xfade may negotiate another pixel format; segments must all match
+            filters.append("[vbase]format=yuv420p[vout]")
+        if not audio:
+            return ";".join(filters)
+
+        scene_audio = []
+        input_index = n
+        for i, segment in enumerate(self.segments):
+            if not segment.audio_path:
+                continue
+            delay = int(offsets[i] * 1000)
+            filters.append(
+                f"[{input_index}:a]aresample={RENDER_SAMPLE_RATE},aformat=channel_layouts=stereo,"
+                f"atrim=0:{segment.duration:.3f},adelay=delays={delay}:all=1[sa{i}]"
+            )
+            scene_audio.append(f"[sa{i}]")
+            input_index += 1
+
+        if scene_audio:
+            filters.append(
+                f"[abase]{''.join(scene_audio)}amix=inputs={len(scene_audio) + 1}:"
+                f"duration=first:normalize=0[aout]"
+            )
+        else:
+            filters.append("[abase]anull[aout]")
+        return ";".join(filters)
+
+    def command(
+        self,
+        output_path: str,
+        threads: int = FFMPEG_THREAD_BUDGET,
+        faststart: bool = False,
+        video: bool = True,
+        audio: bool = True,
+    ) -> List[str]:
+        """ffmpeg command rendering the plan, or only its video or audio track."""
+        cmd = ["ffmpeg", "-y", *self.inputs(), "-filter_complex", self.filter_graph(video, audio)]
+        if video:
+            cmd += ["-map", "[vout]", "-c:v", "libx264", "-preset", RENDER_PRESET, "-crf", str(RENDER_CRF)]
+        if audio:
+            cmd += ["-map", "[aout]", "-c:a", "aac"]
+        return cmd + [
+            "-threads", str(threads),
+            *self.extra_output_args,
+            *(FASTSTART_ARGS if faststart else []),
+            output_path,
+        ]
+
+    def estimated_cost(self) -> dict:
+        """Rough cost of executing the plan, for logging and comparison."""
+        pixel_factor = (self.width * self.height) / (1920 * 1080)
+        segments = len(self.split())
+        return {
+            # Segmented renders add the audio track and a stream-copy mux
+            "ffmpeg_invocations": segments + 2 if segments > 1 else 1,
+            "parallel_segments": segments,
+            "inputs": len(self.segments) + sum(1 for s in self.segments if s.audio_path),
+            "output_seconds": round(self.total_duration, 3),
+            "transitions": len(self.segments) - 1 if self.transition else 0,
+            "estimated_cpu_seconds": round(
+                self.total_duration * pixel_factor * RENDER_CPU_SECONDS_PER_1080P_SECOND, 1
+            ),
+        }
 
 
 class VideoService:
     """Service for video processing using FFmpeg."""
 
-    def __init__(self, uploads_path: str = "/app/uploads"):
+    def __init__(self, uploads_path: str = "/app/uploads", project_id: Optional[int] = None):
         self.uploads_path = Path(uploads_path)
         self.uploads_path.mkdir(parents=True, exist_ok=True)
+        # Step timings are attributed to this project
+        self.project_id = project_id
+
+    def normalize_clips(
+        self,
+        video_paths: List[str],
+        target: Optional[ClipProfile] = None,
+        thread_budget: int = FFMPEG_THREAD_BUDGET,
+    ) -> List[str]:
+        """
+        Make every clip concat-compatible with stream copy.
+
+        All clips are probed; those that differ from the target profile (by
+        default the most common profile, so most clips stay untouched) are
+        re-encoded in parallel within `thread_budget` ffmpeg threads.
+        Normalized clips are cached by source file and target profile.
+
+        The encoder can't reproduce another encoder's extradata, so when the
+        re-encoded clips still don't match the target's, the remaining
+        clips are re-encoded too and the whole timeline shares one.
+        """
+        with span("ffmpeg_normalize", project_id=self.project_id):
+            return self._normalize_clips(video_paths, target, thread_budget)
+
+    def _normalize_clips(
+        self, video_paths: List[str], target: Optional[ClipProfile], thread_budget: int
+    ) -> List[str]:
+        jobs = max(1, thread_budget // FFMPEG_THREADS_PER_JOB)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            profiles = list(executor.map(probe_clip, video_paths))
+
+        target = target or Counter(profiles).most_common(1)[0][0]
+        mismatched = [i for i, profile in enumerate(profiles) if profile != target]
+        if not mismatched:
+            return list(video_paths)
+
+        result = list(video_paths)
+        self._encode_normalized(video_paths, mismatched, target, thread_budget, result)
+        if target.extradata_hash and probe_clip(result[mismatched[0]]).extradata_hash != target.extradata_hash:
+            remaining = [i for i, profile in enumerate(profiles) if profile == target]
+            self._encode_normalized(video_paths, remaining, target, thread_budget, result)
+        return result
+
+    def _encode_normalized(
+        self,
+        video_paths: List[str],
+        indices: List[int],
+        target: ClipProfile,
+        thread_budget: int,
+        result: List[str],
+    ):
+        jobs = max(1, thread_budget // FFMPEG_THREADS_PER_JOB)
+        normalized_dir = self.uploads_path / "cache" / "normalized"
+        normalized_dir.mkdir(parents=True, exist_ok=True)
+        threads = max(1, min(FFMPEG_THREADS_PER_JOB, thread_budget))
+
+        # ffmpeg runs as a child process, so threads give real parallelism and
+        # also work inside daemonic Celery pool processes
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {}
+            for i in indices:
+                output_path = normalized_dir / f"{self._normalized_key(video_paths[i], target)}.mp4"
+                result[i] = str(output_path)
+                if output_path.exists():
+                    touch(str(output_path))
+                else:
+                    futures[i] = executor.submit(
+                        self._normalize_atomic, video_paths[i], target, output_path, threads
+                    )
+            for future in futures.values():
+                future.result()
+
+    def _normalized_key(self, path: str, target: ClipProfile) -> str:
+        return hashlib.sha256(
+            json.dumps({"source": clip_identity(path), "target": asdict(target)}, sort_keys=True).encode()
+        ).hexdigest()
+
+    def _normalize_atomic(self, path: str, target: ClipProfile, output_path: Path, threads: int):
+        tmp_path = output_path.with_name(f"tmp_{output_path.name}")
+        with host_core_slot(threads):
+            normalize_clip(path, target, str(tmp_path), threads)
+        os.replace(tmp_path, output_path)
+
+    def stitch_chapters(
+        self,
+        video_paths: List[str],
+        chapter_size: int = CHAPTER_SIZE,
+        parallelism: int = CHAPTER_PARALLELISM,
+        boundary_keys: Optional[List[str]] = None,
+    ) -> List[str]:
+        """
+        Concatenate consecutive groups of clips into chapter files.
+
+        Chapter boundaries come from `boundary_keys` (stable identities of
+        the clips, by default their paths, see `chapter_groups`). Each
+        chapter is cached under a key derived from its member clips, so
+        unchanged chapters are reused and only changed ones are re-stitched,
+        independent chapters in parallel.
+        """
+        with span("ffmpeg_chapters", project_id=self.project_id):
+            return self._stitch_chapters(
+                video_paths, chapter_size, parallelism, boundary_keys or video_paths
+            )
+
+    def _stitch_chapters(
+        self, video_paths: List[str], chapter_size: int, parallelism: int, boundary_keys: List[str]
+    ) -> List[str]:
+        chapters_dir = self.uploads_path / "cache" / "chapters"
+        chapters_dir.mkdir(parents=True, exist_ok=True)
+
+        chapter_paths = []
+        pending = []
+        for group in chapter_groups(boundary_keys, chapter_size):
+            members = [video_paths[i] for i in group]
+            key = hashlib.sha256(
+                "\n".join(clip_identity(path) for path in members).encode()
+            ).hexdigest()
+            chapter_path = chapters_dir / f"{key}.mp4"
+            chapter_paths.append(str(chapter_path))
+            if chapter_path.exists():
+                chapter_path.touch()
+            else:
+                pending.append((members, chapter_path))
+
+        with ThreadPoolExecutor(max_workers=max(1, parallelism)) as executor:
+            futures = [
+                executor.submit(self._concat_atomic, members, chapter_path)
+                for members, chapter_path in pending
+            ]
+            for future in futures:
+                future.result()
+        return chapter_paths
+
+    def _concat_atomic(self, video_paths: List[str], output_path: Path):
+        tmp_path = output_path.with_name(f"tmp_{output_path.name}")
+        self.concat_copy(video_paths, str(tmp_path))
+        os.replace(tmp_path, output_path)
+
+    def concat_copy(self, video_paths: List[str], output_path: str, faststart: bool = False) -> str:
+        """Concatenate compatible clips with stream copy (no re-encode)."""
+        return self.stitch_videos(video_paths, output_path, normalize=False, faststart=faststart)
 
     def stitch_videos(
         self,
         video_paths: List[str],
         output_path: str,
         audio_path: str = None,
+        normalize: bool = True,
+        faststart: bool = True,
     ) -> str:
         """
         Stitch multiple video clips into a single video.
         Optionally add a background audio track.
+        Clips with a different codec, resolution, fps or timebase are
+        normalized first; matching clips are concatenated with stream copy.
+        Timelines longer than CHAPTER_SIZE clips are built from cached chapters,
+        whose boundaries follow the source clips (scene identity) rather than
+        the normalized copies.
+        With `faststart` the moov atom is written at the front of the file.
         """
+        if normalize:
+            source_paths = [os.path.abspath(path) for path in video_paths]
+            video_paths = self.normalize_clips(video_paths)
+            if len(video_paths) > CHAPTER_SIZE:
+                video_paths = self.stitch_chapters(video_paths, boundary_keys=source_paths)
+
         # Create a file list for FFmpeg concat
-        list_file = self.uploads_path / "concat_list.txt"
-        with open(list_file, "w") as f:
+        with tempfile.NamedTemporaryFile(
+            "w", suffix=".txt", prefix="concat_", dir=self.uploads_path, delete=False
+        ) as f:
+            list_file = Path(f.name)
             for path in video_paths:
                 f.write(f"file '{path}'\n")
 
@@ -42,12 +644,17 @@ class VideoService:
         else:
             cmd.extend(["-c:a", "copy"])
 
-        cmd.extend(["-c:v", "copy", output_path])
+        cmd.extend(["-c:v", "copy"])
+        if faststart:
+            cmd.extend(FASTSTART_ARGS)
+        cmd.append(output_path)
 
-        subprocess.run(cmd, check=True)
-
-        # Cleanup temp file
-        list_file.unlink()
+        try:
+            with span("ffmpeg_concat", project_id=self.project_id):
+                subprocess.run(cmd, check=True)
+        finally:
+            # Cleanup temp file
+            list_file.unlink()
 
         return output_path
 
@@ -68,7 +675,237 @@ class VideoService:
             "-map", "0:v:0",
             "-map", "1:a:0",
             "-shortest",
+            *FASTSTART_ARGS,
             output_path,
         ]
-        subprocess.run(cmd, check=True)
+        with span("ffmpeg_audio", project_id=self.project_id):
+            subprocess.run(cmd, check=True)
         return output_path
+
+    def plan_render(
+        self,
+        video_paths: List[str],
+        audio_paths: Optional[List[Optional[str]]] = None,
+        transition: Optional[str] = None,
+        transition_duration: float = 0.5,
+    ) -> RenderPlan:
+        """
+        Build a single-pass RenderPlan for the clips, with each clip's
+        optional audio (`audio_paths[i]`) placed at that clip's offset.
+        """
+        audio_paths = audio_paths or [None] * len(video_paths)
+        with ThreadPoolExecutor(max_workers=max(1, FFMPEG_THREAD_BUDGET)) as executor:
+            profiles = list(executor.map(probe_clip, video_paths))
+            durations = list(executor.map(probe_duration, video_paths))
+
+        target = Counter(profiles).most_common(1)[0][0]
+        segments = [
+            RenderSegment(
+                video_path=path,
+                duration=duration,
+                has_audio=profile.audio_codec is not None,
+                audio_path=audio_path,
+            )
+            for path, duration, profile, audio_path in zip(video_paths, durations, profiles, audio_paths)
+        ]
+        return RenderPlan(
+            segments=segments,
+            width=target.width,
+            height=target.height,
+            fps=target.fps,
+            transition=transition,
+            transition_duration=transition_duration,
+        )
+
+    def render(self, plan: RenderPlan, output_path: str) -> str:
+        """
+        Execute a RenderPlan within the host core budget. Short plans run as
+        a single ffmpeg invocation; long ones are split into scene-aligned
+        video segments (each starting on a keyframe) encoded in parallel,
+        next to one encode of the whole audio track, and joined losslessly
+        with stream copy. Encoding audio once avoids the AAC priming gap
+        and drift a join of separately encoded segments would add.
+        """
+        with span("ffmpeg_render", project_id=self.project_id):
+            return self._render(plan, output_path)
+
+    def _render(self, plan: RenderPlan, output_path: str) -> str:
+        sub_plans = plan.split()
+        if len(sub_plans) == 1:
+            with host_core_slot(FFMPEG_THREADS_PER_JOB):
+                subprocess.run(
+                    plan.command(output_path, threads=FFMPEG_THREADS_PER_JOB, faststart=True),
+                    check=True,
+                )
+            return output_path
+
+        segment_dir = Path(tempfile.mkdtemp(prefix="render_", dir=self.uploads_path))
+        segment_paths = [str(segment_dir / f"segment_{i:04d}.mp4") for i in range(len(sub_plans))]
+        audio_path = str(segment_dir / "audio.m4a")
+        commands = [
+            sub_plan.command(segment_path, threads=FFMPEG_THREADS_PER_JOB, audio=False)
+            for sub_plan, segment_path in zip(sub_plans, segment_paths)
+        ]
+        commands.append(plan.command(audio_path, threads=FFMPEG_THREADS_PER_JOB, video=False))
+        jobs = max(1, FFMPEG_HOST_CORE_BUDGET // FFMPEG_THREADS_PER_JOB)
+
+        def encode(cmd):
+            with host_core_slot(FFMPEG_THREADS_PER_JOB):
+                subprocess.run(cmd, check=True)
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(jobs, len(commands))) as executor:
+                list(executor.map(encode, commands))
+            self.mux_segments(segment_paths, audio_path, output_path)
+        finally:
+            shutil.rmtree(segment_dir, ignore_errors=True)
+        return output_path
+
+    def mux_segments(self, video_paths: List[str], audio_path: str, output_path: str) -> str:
+        """Join video-only segments and add an audio track, all with stream copy."""
+        list_file = Path(video_paths[0]).with_name("segments.txt")
+        list_file.write_text("".join(f"file '{path}'\n" for path in video_paths))
+        cmd = [
+            "ffmpeg", "-y",
+            "-f", "concat", "-safe", "0", "-i", str(list_file),
+            "-i", audio_path,
+            "-map", "0:v:0", "-map", "1:a:0",
+            "-c", "copy",
+            *FASTSTART_ARGS,
+            output_path,
+        ]
+        with span("ffmpeg_concat", project_id=self.project_id):
+            subprocess.run(cmd, check=True)
+        return output_path
+
+    def scale_image(self, image_path: str, output_path: str, width: int, height: int) -> str:
+        """Resize a still to cover `width`x`height` (Lanczos), cropping the overflow."""
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", image_path,
+            "-vf", (
+                f"scale={width}:{height}:force_original_aspect_ratio=increase:flags=lanczos,"
+                f"crop={width}:{height}"
+            ),
+            "-frames:v", "1", "-update", "1",
+            output_path,
+        ]
+        with span("ffmpeg_scale", project_id=self.project_id):
+            subprocess.run(cmd, check=True)
+        return output_path
+
+    def ken_burns(
+        self,
+        image_path: str,
+        output_path: str,
+        duration: float,
+        width: int,
+        height: int,
+        zoom_in: bool = True,
+        threads: int = FFMPEG_THREADS_PER_JOB,
+    ) -> str:
+        """
+        Render a still as a `width`x`height` clip slowly zooming in (or out),
+        with a silent audio track so it concatenates like generated clips.
+        """
+        frames = max(1, round(duration * KEN_BURNS_FPS))
+        step = (KEN_BURNS_ZOOM - 1) / frames
+        if zoom_in:
+            zoom = f"min(1+{step:.6f}*on,{KEN_BURNS_ZOOM})"
+        else:
+            zoom = f"max({KEN_BURNS_ZOOM}-{step:.6f}*on,1)"
+        # Panning over a 2x upscale keeps the motion smooth at low resolutions
+        video_filter = (
+            f"scale={2 * width}:{2 * height}:force_original_aspect_ratio=increase,"
+            f"crop={2 * width}:{2 * height},"
+            f"zoompan=z='{zoom}':x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)'"
+            f":d={frames}:s={width}x{height}:fps={KEN_BURNS_FPS},"
+            "format=yuv420p"
+        )
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", image_path,
+            "-f", "lavfi", "-i", f"anullsrc=r={RENDER_SAMPLE_RATE}:cl=stereo",
+            "-vf", video_filter,
+            "-frames:v", str(frames),
+            "-t", f"{frames / KEN_BURNS_FPS:g}",
+            "-c:v", "libx264", "-preset", DRAFT_PRESET, "-crf", str(DRAFT_CRF),
+            "-threads", str(threads),
+            "-c:a", "aac",
+            *FASTSTART_ARGS,
+            output_path,
+        ]
+        with span("ffmpeg_ken_burns", project_id=self.project_id):
+            subprocess.run(cmd, check=True)
+        return output_path
+
+    def segment_hls(self, clip_path: str, hls_dir: Path, name: str) -> Path:
+        """
+        Cut a clip into MPEG-TS segments (stream copy) with their own VOD
+        playlist `<name>.m3u8` in `hls_dir`, for appending to a live playlist.
+        """
+        hls_dir.mkdir(parents=True, exist_ok=True)
+        playlist_path = hls_dir / f"{name}.m3u8"
+        tmp_path = hls_dir / f"tmp_{name}.m3u8"
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", clip_path,
+            "-c", "copy",
+            "-f", "hls",
+            "-hls_time", str(HLS_SEGMENT_SECONDS),
+            "-hls_playlist_type", "vod",
+            "-hls_segment_filename", str(hls_dir / f"{name}_%03d.ts"),
+            str(tmp_path),
+        ]
+        with span("hls_segment", project_id=self.project_id):
+            subprocess.run(cmd, check=True)
+        os.replace(tmp_path, playlist_path)
+        return playlist_path
+
+    def write_live_playlist(self, hls_dir: Path, names: List[str], playlist_name: str = "live.m3u8") -> bool:
+        """
+        (Re)write the live playlist from the per-clip playlists of `names`,
+        in order, up to the first clip that is not segmented yet. Clips are
+        separated by discontinuities. Returns True once every clip is in, in
+        which case the playlist is ended.
+
+        The playlist only ever grows, so writers are serialized with a lock.
+        """
+        hls_dir.mkdir(parents=True, exist_ok=True)
+        with open(hls_dir / "playlist.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            entries, target, complete = [], 1, True
+            for name in names:
+                clip_playlist = hls_dir / f"{name}.m3u8"
+                if not clip_playlist.exists():
+                    complete = False
+                    break
+                if entries:
+                    entries.append("#EXT-X-DISCONTINUITY")
+                lines = clip_playlist.read_text().splitlines()
+                for i, line in enumerate(lines):
+                    if line.startswith("#EXTINF:"):
+                        target = max(target, math.ceil(float(line[8:].split(",")[0])))
+                        entries += [line, lines[i + 1]]
+
+            playlist = [
+                "#EXTM3U",
+                "#EXT-X-VERSION:3",
+                "#EXT-X-PLAYLIST-TYPE:EVENT",
+                f"#EXT-X-TARGETDURATION:{target}",
+                "#EXT-X-MEDIA-SEQUENCE:0",
+                *entries,
+            ]
+            if complete:
+                playlist.append("#EXT-X-ENDLIST")
+
+            tmp_path = hls_dir / f"tmp_{playlist_name}"
+            tmp_path.write_text("\n".join(playlist) + "\n")
+            os.replace(tmp_path, hls_dir / playlist_name)
+        return complete
+
+    def reset_hls(self, hls_dir: Path):
+        """Remove a previous live playlist and its segments."""
+        shutil.rmtree(hls_dir, ignore_errors=True)
+        hls_dir.mkdir(parents=True, exist_ok=True)
@@ -8,3 +8,94 @@ document.body.addEventListener('htmx:afterRequest', function(evt) {
         }
     }
 });
+
+// Live HLS preview of a project that is still generating. Safari plays HLS
+// natively, other browsers go through hls.js. The playlist grows while scenes
+// finish, so the player is re-attached after fatal errors.
+function attachLivePlayer(video) {
+    const src = video.dataset.playlist;
+    if (!src) {
+        return;
+    }
+    video.dataset.attached = 'true';
+    if (video.canPlayType('application/vnd.apple.mpegurl')) {
+        video.src = src;
+        return;
+    }
+    if (!window.Hls || !Hls.isSupported()) {
+        return;
+    }
+    const hls = new Hls({ liveDurationInfinity: true });
+    hls.on(Hls.Events.ERROR, function(event, data) {
+        if (data.fatal) {
+            hls.destroy();
+            setTimeout(function() { attachLivePlayer(video); }, 5000);
+        }
+    });
+    hls.loadSource(src);
+    hls.attachMedia(video);
+}
+
+window.addEventListener('load', function() {
+    document.querySelectorAll('video.live-preview').forEach(attachLivePlayer);
+});
+
+// Show the live preview of a render started after the page was loaded, once
+// the server has published its playlist
+function showLivePreview(playlist) {
+    const video = document.querySelector('video.live-preview');
+    if (!video || video.dataset.attached) {
+        return;
+    }
+    if (playlist) {
+        video.dataset.playlist = playlist;
+    }
+    if (!video.dataset.playlist) {
+        return;
+    }
+    document.getElementById('live-preview-section').hidden = false;
+    attachLivePlayer(video);
+}
+
+// Live generation progress of a project, pushed by the server over SSE
+function watchProjectProgress(projectId) {
+    const source = new EventSource('/api/projects/' + projectId + '/events');
+    source.onmessage = function(evt) {
+        const data = JSON.parse(evt.data);
+        if (data.event === 'scene') {
+            if (data.step === 'downloaded') {
+                showLivePreview();
+            }
+            const badge = document.querySelector('#scene-' + data.scene_id + ' .badge-progress');
+            if (!badge) {
+                return;
+            }
+            badge.hidden = false;
+            badge.classList.toggle('badge-error', data.step === 'failed');
+            badge.classList.toggle('badge-done', data.step === 'downloaded');
+            badge.textContent = data.step === 'failed' ? 'Generation failed' : data.step.replace(/_/g, ' ');
+            badge.title = data.error || '';
+        } else if (data.event === 'project') {
+            const status = document.getElementById('project-status');
+            status.className = 'status status-' + data.status;
+            status.textContent = data.status;
+            if (data.status === 'generating') {
+                showLivePreview(data.playlist);
+            }
+            if (data.status === 'completed') {
+                // Show the output video
+                window.location.reload();
+            }
+        } else if (data.event === 'draft') {
+            const status = document.getElementById('draft-status');
+            status.hidden = false;
+            status.className = 'status status-' + data.status;
+            status.textContent = 'draft ' + data.status;
+            status.title = data.error || '';
+            if (data.status === 'completed') {
+                // Show the draft video and promote buttons
+                window.location.reload();
+            }
+        }
+    };
+}
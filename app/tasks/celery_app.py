@@ -1,5 +1,23 @@
 import os
 from celery import Celery
+from kombu import Queue
+
+# Seconds between checks of pending fal.ai queue requests (webhook fallback)
+FAL_POLL_INTERVAL = float(os.getenv("FAL_POLL_INTERVAL", "10"))
+# Seconds between garbage collections of the uploads volume
+STORAGE_GC_INTERVAL = float(os.getenv("STORAGE_GC_INTERVAL", "3600"))
+
+# Seconds task results are kept in the result backend
+CELERY_RESULT_EXPIRES = int(os.getenv("CELERY_RESULT_EXPIRES", str(24 * 3600)))
+# Unacknowledged tasks are redelivered after this many seconds; must exceed
+# the longest task (a stitch), since tasks are acknowledged when they finish
+CELERY_VISIBILITY_TIMEOUT = int(os.getenv("CELERY_VISIBILITY_TIMEOUT", str(6 * 3600)))
+
+# I/O-bound tasks (fal.ai calls, polling, downloads) run on a worker with a
+# high-concurrency thread pool; ffmpeg stitching runs on a prefork worker
+# sized to the cores
+IO_QUEUE = "io"
+FFMPEG_QUEUE = "ffmpeg"
 
 redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
@@ -7,7 +25,7 @@ celery_app = Celery(
     "long_form_video",
     broker=redis_url,
     backend=redis_url,
-    include=["app.tasks.video"],
+    include=["app.tasks.video", "app.tasks.polling", "app.tasks.draft", "app.tasks.storage"],
 )
 
 celery_app.conf.update(
@@ -16,4 +34,36 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
+    task_queues=(Queue(IO_QUEUE), Queue(FFMPEG_QUEUE)),
+    task_default_queue=IO_QUEUE,
+    task_routes={
+        "app.tasks.video.stitch_project_video": {"queue": FFMPEG_QUEUE},
+        "app.tasks.video.append_live_clip": {"queue": FFMPEG_QUEUE},
+        "app.tasks.draft.stitch_project_draft": {"queue": FFMPEG_QUEUE},
+    },
+    # Priority queues on the Redis broker (0 = highest) so interactive renders
+    # overtake batch renders; prefetching would bypass the ordering
+    broker_transport_options={
+        "queue_order_strategy": "priority",
+        "priority_steps": list(range(10)),
+        "sep": ":",
+        "visibility_timeout": CELERY_VISIBILITY_TIMEOUT,
+    },
+    task_default_priority=5,
+    worker_prefetch_multiplier=1,
+    # Scene steps are checkpointed and stitches overwrite their output, so a
+    # task lost with its worker is safely run again
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    result_expires=CELERY_RESULT_EXPIRES,
+    beat_schedule={
+        "poll-fal-requests": {
+            "task": "app.tasks.polling.poll_fal_requests",
+            "schedule": FAL_POLL_INTERVAL,
+        },
+        "collect-garbage": {
+            "task": "app.tasks.storage.collect_garbage",
+            "schedule": STORAGE_GC_INTERVAL,
+        },
+    },
 )
@@ -0,0 +1,456 @@
+"""
+Draft renders: a quick, low-cost preview of a whole project.
+
+Drafts use the fastest configured models at a reduced resolution and, by
+default, no video model at all: each scene's still is turned into a Ken
+Burns clip locally with ffmpeg. Draft clips and the stitched draft live
+apart from the final render (under drafts/ and draft_video.mp4), and a
+scene's draft can be promoted into its final clip, which then starts from
+the approved still (upscaled to the project's image size).
+
+A promoted clip records the draft it came from in its fingerprint, so
+incremental renders keep it only while the scene and its draft are
+unchanged; a "full" render regenerates it from the project's image model.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
+
+from celery import chord
+
+from app.tasks.celery_app import celery_app
+from app.tasks.video import (
+    UPLOADS_PATH,
+    download_file,
+    generate_scene_video,
+    set_project_status,
+    stitch_project_video,
+    upload_reference_image,
+)
+from app.services.fal_service import FalService, IMAGE_MODELS, VIDEO_MODELS, fastest_model
+from app.services.video_service import (
+    VideoService,
+    FFMPEG_HOST_CORE_BUDGET,
+    FFMPEG_THREADS_PER_JOB,
+    host_core_slot,
+)
+from app.services.generation_cache import get_generation_cache
+from app.services.rate_limiter import get_rate_limiter, PRIORITY_INTERACTIVE
+from app.services.fingerprint import draft_fingerprint, promoted_fingerprint
+from app.services.retry import retry_call
+from app.services.progress import publish_progress
+from app.database import SessionLocal
+from app.models import Project, Scene, GenerationStep, ProjectStatus
+
+DRAFT_MODE = "draft"
+
+# Models of draft renders, the fastest (then cheapest) listed ones by default
+DRAFT_IMAGE_MODEL = os.getenv("DRAFT_IMAGE_MODEL", fastest_model(IMAGE_MODELS))
+DRAFT_VIDEO_MODEL = os.getenv("DRAFT_VIDEO_MODEL", fastest_model(VIDEO_MODELS))
+# "kenburns" animates the scene stills locally with ffmpeg, "fal" runs
+# DRAFT_VIDEO_MODEL on them
+DRAFT_VIDEO_MODE = os.getenv("DRAFT_VIDEO_MODE", "kenburns")
+# Long side of draft images and Ken Burns clips, in pixels
+DRAFT_RESOLUTION = int(os.getenv("DRAFT_RESOLUTION", "640"))
+# Scenes of a draft generated at the same time
+DRAFT_CONCURRENCY = int(os.getenv("DRAFT_CONCURRENCY", "8"))
+
+# Aspect ratios (width, height) of the fal image size presets
+ASPECT_RATIOS = {
+    "square": (1, 1),
+    "square_hd": (1, 1),
+    "portrait_4_3": (3, 4),
+    "portrait_16_9": (9, 16),
+    "landscape_4_3": (4, 3),
+    "landscape_16_9": (16, 9),
+}
+
+# Pixel sizes of the fal image size presets, the target of promoted stills
+PRESET_DIMENSIONS = {
+    "square": (512, 512),
+    "square_hd": (1024, 1024),
+    "portrait_4_3": (768, 1024),
+    "portrait_16_9": (576, 1024),
+    "landscape_4_3": (1024, 768),
+    "landscape_16_9": (1024, 576),
+}
+
+ACTIVE_STATUSES = (ProjectStatus.GENERATING, ProjectStatus.STITCHING)
+
+
+def draft_dimensions(image_size: str, long_side: int = DRAFT_RESOLUTION) -> tuple[int, int]:
+    """(width, height) of a draft in the aspect ratio of an image size preset, in multiples of 16."""
+    aspect_w, aspect_h = ASPECT_RATIOS.get(image_size, (16, 9))
+    scale = long_side / max(aspect_w, aspect_h)
+    return int(aspect_w * scale) // 16 * 16, int(aspect_h * scale) // 16 * 16
+
+
+def draft_settings(project: Project) -> dict:
+    """Settings that, besides the scene itself, determine a draft clip."""
+    settings = {
+        "image_model": DRAFT_IMAGE_MODEL,
+        "video_mode": DRAFT_VIDEO_MODE,
+        "image_size": project.image_size,
+        "resolution": DRAFT_RESOLUTION,
+        "video_duration": project.video_duration,
+    }
+    if DRAFT_VIDEO_MODE == "fal":
+        settings["video_model"] = DRAFT_VIDEO_MODEL
+    return settings
+
+
+def draft_dir(project_id: int) -> Path:
+    return UPLOADS_PATH / "drafts" / f"project_{project_id}"
+
+
+def set_draft_status(db, project: Project, status: str, **data):
+    """Update and publish a project's draft status."""
+    project.draft_status = status
+    db.commit()
+    publish_progress(project.id, "draft", status=status, **data)
+
+
+def render_draft_inputs(
+    fal_service: FalService, project: dict, scene: dict
+) -> dict:
+    """
+    Produce a scene's draft still (its reference image, or a generated one
+    at draft resolution) and, with the "fal" video mode, its draft clip.
+    Runs in a worker thread, so it only sees plain dicts.
+    """
+    scene_dir = draft_dir(project["id"])
+    width, height = draft_dimensions(project["image_size"])
+
+    image_url = None
+    image_path = scene["reference_image_path"]
+    if not image_path:
+        image_url = retry_call(
+            fal_service.generate_image,
+            scene["prompt"],
+            image_size={"width": width, "height": height},
+        )
+        suffix = Path(urlparse(image_url).path).suffix or ".png"
+        image_path = str(scene_dir / f"scene_{scene['id']}{suffix}")
+        retry_call(download_file, image_url, Path(image_path), project["id"])
+
+    video_path = None
+    if DRAFT_VIDEO_MODE == "fal":
+        image_url = image_url or upload_reference_image(image_path, project["id"])
+        video_url = retry_call(
+            fal_service.generate_video_from_image,
+            image_url=image_url,
+            prompt=scene["prompt"],
+            duration=project["video_duration"],
+        )
+        video_path = str(scene_dir / f"scene_{scene['id']}.mp4")
+        retry_call(download_file, video_url, Path(video_path), project["id"])
+
+    return {"draft_image_path": image_path, "draft_video_path": video_path}
+
+
+@celery_app.task(bind=True)
+def generate_project_draft(self, project_id: int, priority: int = PRIORITY_INTERACTIVE):
+    """
+    Generate the draft stills (and clips) of every scene whose draft is out
+    of date, then hand over to `stitch_project_draft` on the ffmpeg queue.
+    """
+    db = SessionLocal()
+    project = None
+
+    try:
+        project = db.query(Project).filter(Project.id == project_id).first()
+        if not project:
+            return {"status": "failed", "error": "Project not found"}
+
+        scenes = (
+            db.query(Scene)
+            .filter(Scene.project_id == project_id)
+            .order_by(Scene.order)
+            .all()
+        )
+        if not scenes:
+            set_draft_status(db, project, "failed", error="No scenes in project")
+            return {"status": "failed", "error": "No scenes in project"}
+
+        set_draft_status(db, project, "generating")
+        settings = draft_settings(project)
+
+        pending = []
+        for i, scene in enumerate(scenes):
+            fingerprint = draft_fingerprint(scene, settings)
+            if (
+                scene.draft_fingerprint == fingerprint
+                and scene.draft_image_path
+                and os.path.exists(scene.draft_image_path)
+            ):
+                continue
+            scene.draft_fingerprint = fingerprint
+            scene.draft_image_path = None
+            scene.draft_video_path = None
+            pending.append((i, scene))
+        db.commit()
+
+        fal_service = FalService(
+            image_model=DRAFT_IMAGE_MODEL,
+            video_model=DRAFT_VIDEO_MODEL,
+            cache=get_generation_cache(),
+            limiter=get_rate_limiter(),
+            project_id=project_id,
+            priority=priority,
+        )
+        project_data = {
+            "id": project_id,
+            "image_size": project.image_size,
+            "video_duration": project.video_duration,
+        }
+
+        def render(scene_data: dict) -> dict:
+            try:
+                return render_draft_inputs(fal_service, project_data, scene_data)
+            except Exception as e:
+                return {"error": f"Draft of scene {scene_data['index'] + 1} failed: {str(e)}"}
+
+        jobs = [
+            {
+                "id": scene.id,
+                "index": i,
+                "prompt": scene.prompt,
+                "reference_image_path": scene.reference_image_path,
+            }
+            for i, scene in pending
+        ]
+        errors = []
+        if jobs:
+            with ThreadPoolExecutor(max_workers=min(DRAFT_CONCURRENCY, len(jobs))) as executor:
+                results = list(executor.map(render, jobs))
+            for (_, scene), result in zip(pending, results):
+                if "error" in result:
+                    errors.append(result["error"])
+                    scene.draft_fingerprint = None
+                else:
+                    scene.draft_image_path = result["draft_image_path"]
+                    scene.draft_video_path = result["draft_video_path"]
+            db.commit()
+
+        if errors:
+            set_draft_status(db, project, "failed", error="; ".join(errors))
+            return {"status": "failed", "error": "; ".join(errors)}
+
+    except Exception as e:
+        if project:
+            set_draft_status(db, project, "failed", error=str(e))
+        return {"status": "failed", "error": str(e)}
+
+    finally:
+        db.close()
+
+    return self.replace(stitch_project_draft.si(project_id).set(priority=priority))
+
+
+@celery_app.task(bind=True)
+def stitch_project_draft(self, project_id: int):
+    """Animate draft stills that have no clip yet and stitch the draft video."""
+    db = SessionLocal()
+    project = None
+
+    try:
+        project = db.query(Project).filter(Project.id == project_id).first()
+        if not project:
+            return {"status": "failed", "error": "Project not found"}
+
+        scenes = (
+            db.query(Scene)
+            .filter(Scene.project_id == project_id)
+            .order_by(Scene.order)
+            .all()
+        )
+        set_draft_status(db, project, "stitching")
+        video_service = VideoService(str(UPLOADS_PATH), project_id=project_id)
+        width, height = draft_dimensions(project.image_size)
+
+        def animate(args):
+            index, image_path, output_path = args
+            with host_core_slot(FFMPEG_THREADS_PER_JOB):
+                video_service.ken_burns(
+                    image_path,
+                    output_path,
+                    duration=project.video_duration,
+                    width=width,
+                    height=height,
+                    zoom_in=index % 2 == 0,
+                )
+
+        missing = [
+            (i, scene) for i, scene in enumerate(scenes)
+            if not scene.draft_video_path or not os.path.exists(scene.draft_video_path)
+        ]
+        if any(not scene.draft_image_path for _, scene in missing):
+            error = "Draft stills are missing, generate the draft again"
+            set_draft_status(db, project, "failed", error=error)
+            return {"status": "failed", "error": error}
+
+        jobs = [
+            (i, scene.draft_image_path, str(draft_dir(project_id) / f"scene_{scene.id}.mp4"))
+            for i, scene in missing
+        ]
+        if jobs:
+            draft_dir(project_id).mkdir(parents=True, exist_ok=True)
+            workers = max(1, FFMPEG_HOST_CORE_BUDGET // FFMPEG_THREADS_PER_JOB)
+            with ThreadPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+                list(executor.map(animate, jobs))
+            for (_, scene), (_, _, output_path) in zip(missing, jobs):
+                scene.draft_video_path = output_path
+            db.commit()
+
+        output_dir = UPLOADS_PATH / "output" / f"project_{project_id}"
+        output_dir.mkdir(parents=True, exist_ok=True)
+        video_service.stitch_videos(
+            video_paths=[scene.draft_video_path for scene in scenes],
+            output_path=str(output_dir / "draft_video.mp4"),
+        )
+
+        project.draft_video_path = f"output/project_{project_id}/draft_video.mp4"
+        set_draft_status(db, project, "completed", video_path=project.draft_video_path)
+        return {"status": "completed", "video_path": project.draft_video_path}
+
+    except Exception as e:
+        if project:
+            set_draft_status(db, project, "failed", error=f"Draft stitching failed: {str(e)}")
+        return {"status": "failed", "error": str(e)}
+
+    finally:
+        db.close()
+
+
+def promotion_still(project: Project, scene: Scene) -> str:
+    """The draft still a promoted scene starts from, at the project's image size."""
+    if scene.draft_image_path == scene.reference_image_path:
+        return scene.draft_image_path
+    width, height = PRESET_DIMENSIONS.get(project.image_size, PRESET_DIMENSIONS["landscape_16_9"])
+    output_path = str(draft_dir(project.id) / f"scene_{scene.id}_{width}x{height}.png")
+    VideoService(str(UPLOADS_PATH), project_id=project.id).scale_image(
+        scene.draft_image_path, output_path, width, height
+    )
+    return output_path
+
+
+def fail_promotion(db, project: Project, scene: Scene, previous_status: str, error: str):
+    """
+    Record a failed promotion on its scene. The project gets its previous
+    status back, as its other clips and final video are still valid.
+    """
+    if scene:
+        scene.generation_error = error
+    set_project_status(db, project, previous_status or ProjectStatus.DRAFT)
+    if scene:
+        publish_progress(project.id, "scene", scene_id=scene.id, step="failed", error=error)
+
+
+@celery_app.task(bind=True)
+def promote_scene_draft(self, scene_id: int, priority: int = PRIORITY_INTERACTIVE):
+    """
+    Render a scene's final clip from its draft: the draft still, upscaled to
+    the project's image size, becomes the scene's image checkpoint, so only
+    the project's video model runs (in resume mode) and the final keeps the
+    approved composition. The project is then re-stitched if every other
+    scene has its clip.
+    """
+    db = SessionLocal()
+    project = scene = None
+    claimed = False
+
+    try:
+        scene = db.query(Scene).filter(Scene.id == scene_id).first()
+        if not scene:
+            return {"status": "failed", "error": "Scene not found"}
+        if not scene.draft_image_path or not os.path.exists(scene.draft_image_path):
+            return {"status": "failed", "error": "Scene has no draft"}
+
+        # Claim the project under its row lock, so promotion never runs
+        # alongside a render that also writes the scene's checkpoint
+        project = (
+            db.query(Project).filter(Project.id == scene.project_id).with_for_update().first()
+        )
+        if project.status in ACTIVE_STATUSES:
+            db.rollback()
+            return {"status": "failed", "error": "Project is being rendered"}
+        previous_status = project.status
+        set_project_status(db, project, ProjectStatus.GENERATING)
+        claimed = True
+
+        scene_ids = [
+            sid for (sid,) in
+            db.query(Scene.id).filter(Scene.project_id == project.id).order_by(Scene.order)
+        ]
+        project_id, index, total = project.id, scene_ids.index(scene_id), len(scene_ids)
+
+        still_path = promotion_still(project, scene)
+        scene.generated_image_url = upload_reference_image(still_path, project_id)
+        scene.generation_step = GenerationStep.IMAGE
+        scene.fingerprint = promoted_fingerprint(scene, project)
+        scene.generation_error = None
+        db.commit()
+
+    except Exception as e:
+        error = f"Promotion failed: {str(e)}"
+        db.rollback()
+        if claimed:
+            fail_promotion(db, project, scene, previous_status, error)
+        return {"status": "failed", "error": error}
+
+    finally:
+        db.close()
+
+    return self.replace(chord(
+        [generate_scene_video.si(
+            [], project_id, scene_id, index, total, "resume", priority
+        ).set(priority=priority)],
+        finish_scene_promotion.s(project_id, scene_id, previous_status, priority).set(priority=priority),
+    ))
+
+
+@celery_app.task(bind=True)
+def finish_scene_promotion(
+    self,
+    lane_results: list,
+    project_id: int,
+    scene_id: int,
+    previous_status: str,
+    priority: int = PRIORITY_INTERACTIVE,
+):
+    """
+    Re-stitch the project after a promotion, or restore its status if the
+    promotion failed or other clips are missing.
+    """
+    db = SessionLocal()
+    project = None
+
+    try:
+        project = db.query(Project).filter(Project.id == project_id).first()
+        if not project:
+            return {"status": "failed", "error": "Project not found"}
+        scene = db.query(Scene).filter(Scene.id == scene_id).first()
+
+        results = [r for lane in lane_results for r in lane]
+        errors = [r["error"] for r in results if r.get("status") != "completed"]
+        if errors:
+            fail_promotion(db, project, scene, previous_status, "; ".join(errors))
+            return {"status": "failed", "error": "; ".join(errors)}
+
+        scenes = db.query(Scene).filter(Scene.project_id == project_id).all()
+        if not all(scene.video_path and os.path.exists(scene.video_path) for scene in scenes):
+            set_project_status(db, project, previous_status or ProjectStatus.DRAFT)
+            return {"status": "completed", "stitched": False}
+
+    except Exception as e:
+        error = f"Promotion failed: {str(e)}"
+        db.rollback()
+        if project:
+            fail_promotion(db, project, db.get(Scene, scene_id), previous_status, error)
+        return {"status": "failed", "error": error}
+
+    finally:
+        db.close()
+
+    return self.replace(stitch_project_video.si(lane_results, project_id).set(priority=priority))
@@ -0,0 +1,289 @@
+import hashlib
+import hmac
+import os
+from functools import partial
+from typing import Optional
+
+from redis.exceptions import LockNotOwnedError
+from sqlalchemy import update
+
+from app.tasks.celery_app import celery_app
+from app.tasks.video import (
+    UPLOADS_PATH,
+    download_file,
+    make_fal_service,
+    queue_live_clip,
+    set_project_status,
+    start_scene_checkpoint,
+    stitch_project_video,
+    upload_reference_image,
+)
+from app.services.fal_service import QueuedGeneration
+from app.services.rate_limiter import PRIORITY_BATCH, SlotUnavailable
+from app.services.generation_cache import get_generation_cache
+from app.services.retry import retry_call
+from app.services.progress import publish_progress
+from app.database import SessionLocal
+from app.redis_client import get_redis
+from app.models import Project, Scene, GenerationStep, ProjectStatus
+
+# Public base URL of this app; when set together with the secret, fal.ai
+# calls /api/fal/webhook/{scene_id} as soon as a queued request finishes
+FAL_WEBHOOK_BASE_URL = os.getenv("FAL_WEBHOOK_BASE_URL", "")
+FAL_WEBHOOK_SECRET = os.getenv("FAL_WEBHOOK_SECRET", "")
+
+# fal_request of a scene whose next step waits for a rate limiter slot; the
+# poller retries it like a pending request
+WAITING_FOR_SLOT = "waiting_for_slot"
+
+
+def webhook_token(scene_id: int) -> str:
+    return hmac.new(FAL_WEBHOOK_SECRET.encode(), str(scene_id).encode(), hashlib.sha256).hexdigest()
+
+
+def webhook_url(scene_id: int) -> Optional[str]:
+    if not (FAL_WEBHOOK_BASE_URL and FAL_WEBHOOK_SECRET):
+        return None
+    base = FAL_WEBHOOK_BASE_URL.rstrip("/")
+    return f"{base}/api/fal/webhook/{scene_id}?token={webhook_token(scene_id)}"
+
+
+def advance_scene(db, scene: Scene, project: Project, priority: int = PRIORITY_BATCH):
+    """
+    Move a scene through its steps without waiting on fal.ai: collect a
+    finished queued request, then submit the next one (or hand the clip to
+    download_scene_clip). Returns as soon as a request is still pending or
+    no rate limiter slot is free, which leaves the scene waiting for the
+    poller instead of blocking the worker thread.
+    """
+    fal_service = make_fal_service(project, priority)
+
+    def report(step: str):
+        publish_progress(project.id, "scene", scene_id=scene.id, step=step)
+
+    def submit(step: str, fn, **kwargs) -> bool:
+        waiting = scene.fal_request == WAITING_FOR_SLOT
+        try:
+            queued = retry_call(
+                fn, webhook_url=webhook_url(scene.id), slot_name=f"scene:{scene.id}", **kwargs
+            )
+        except SlotUnavailable:
+            if not waiting:
+                scene.fal_request = WAITING_FOR_SLOT
+                db.commit()
+                report("waiting_for_slot")
+            return False
+        scene.fal_request = queued.to_json()
+        db.commit()
+        report(step)
+        return True
+
+    while True:
+        if scene.fal_request and scene.fal_request != WAITING_FOR_SLOT:
+            queued = fal_service.poll(QueuedGeneration.from_json(scene.fal_request))
+            if queued.url is None:
+                return
+            if queued.kind == "image":
+                scene.generated_image_url = queued.url
+                scene.generation_step = GenerationStep.IMAGE
+            else:
+                scene.generated_video_url = queued.url
+                scene.generation_step = GenerationStep.VIDEO
+            scene.fal_request = None
+            db.commit()
+            report(f"{queued.kind}_generated")
+
+        if project.status != ProjectStatus.GENERATING:
+            if scene.fal_request == WAITING_FOR_SLOT:
+                scene.fal_request = None
+                db.commit()
+            return
+
+        if not scene.has_completed(GenerationStep.IMAGE):
+            if scene.reference_image_path:
+                report("uploading_image")
+                scene.generated_image_url = upload_reference_image(scene.reference_image_path, project.id)
+                scene.generation_step = GenerationStep.IMAGE
+                db.commit()
+            else:
+                if not submit(
+                    "generating_image",
+                    fal_service.submit_image,
+                    prompt=scene.prompt,
+                    image_size=project.image_size,
+                ):
+                    return
+        elif not scene.has_completed(GenerationStep.VIDEO):
+            if not submit(
+                "generating_video",
+                fal_service.submit_video_from_image,
+                image_url=scene.generated_image_url,
+                prompt=scene.prompt,
+                duration=project.video_duration,
+            ):
+                return
+        else:
+            report("downloading_video")
+            download_scene_clip.apply_async((scene.id,), priority=priority)
+            return
+
+
+def maybe_stitch(db, project: Project):
+    """Start stitching once every scene's clip is on disk (at most once)."""
+    scenes = db.query(Scene).filter(Scene.project_id == project.id).all()
+    if not all(
+        scene.has_completed(GenerationStep.DOWNLOADED)
+        and scene.video_path
+        and os.path.exists(scene.video_path)
+        for scene in scenes
+    ):
+        return
+
+    # Compare-and-set so concurrent completions only stitch once
+    claimed = db.execute(
+        update(Project)
+        .where(Project.id == project.id, Project.status == ProjectStatus.GENERATING)
+        .values(status=ProjectStatus.STITCHING)
+    ).rowcount
+    db.commit()
+    if claimed:
+        publish_progress(project.id, "project", status=ProjectStatus.STITCHING)
+        stitch_project_video.apply_async(([], project.id), priority=project_priority(project))
+
+
+def project_priority(project: Project) -> int:
+    """Priority the project's render was started with."""
+    return project.render_priority if project.render_priority is not None else PRIORITY_BATCH
+
+
+def fail_scene(db, scene: Scene, project: Project, error: str):
+    scene.generation_error = error
+    scene.fal_request = None
+    publish_progress(project.id, "scene", scene_id=scene.id, step="failed", error=error)
+    set_project_status(db, project, ProjectStatus.FAILED, error=error)
+
+
+def start_queued_generation(
+    project_id: int, scene_ids: list[int], mode: str = "full", priority: int = PRIORITY_BATCH
+) -> dict:
+    """Submit the first step of every given scene to fal's queue."""
+    db = SessionLocal()
+    project = None
+
+    try:
+        project = db.query(Project).filter(Project.id == project_id).first()
+        if not project:
+            return {"status": "failed", "error": "Project not found"}
+
+        # Later steps are advanced by the poller, which reads the priority back
+        project.render_priority = priority
+        scenes = db.query(Scene).filter(Scene.id.in_(scene_ids)).all()
+        for scene in scenes:
+            start_scene_checkpoint(scene, project, mode)
+            if mode != "resume":
+                scene.fal_request = None
+        db.commit()
+
+        for scene in scenes:
+            try:
+                advance_scene(db, scene, project, priority)
+            except Exception as e:
+                fail_scene(db, scene, project, f"Submitting scene failed: {str(e)}")
+                return {"status": "failed", "error": str(e)}
+
+        return {"status": "submitted", "scenes": len(scenes)}
+
+    except Exception as e:
+        if project:
+            set_project_status(db, project, ProjectStatus.FAILED, error=str(e))
+        return {"status": "failed", "error": str(e)}
+
+    finally:
+        db.close()
+
+
+@celery_app.task
+def poll_scene(scene_id: int):
+    """Advance one scene whose fal.ai request may have finished."""
+    # Webhook and poller may fire together, only one of them advances the scene
+    lock = get_redis().lock(f"lock:advance_scene:{scene_id}", timeout=300)
+    if not lock.acquire(blocking=False):
+        return {"status": "locked"}
+
+    db = SessionLocal()
+
+    try:
+        scene = db.query(Scene).filter(Scene.id == scene_id).first()
+        if not scene or not scene.fal_request:
+            return {"status": "skipped"}
+        project = scene.project
+
+        try:
+            advance_scene(db, scene, project, project_priority(project))
+        except Exception as e:
+            fail_scene(db, scene, project, f"Generation failed: {str(e)}")
+            return {"status": "failed", "error": str(e)}
+
+        return {"status": "pending" if scene.fal_request else "advanced"}
+
+    finally:
+        db.close()
+        try:
+            lock.release()
+        except LockNotOwnedError:
+            # Uploads and retries outlived the lock; it expired on its own
+            pass
+
+
+@celery_app.task
+def poll_fal_requests():
+    """Periodic fallback for webhooks: check every scene with a pending request."""
+    db = SessionLocal()
+
+    try:
+        scene_ids = [
+            scene_id for (scene_id,) in
+            db.query(Scene.id).filter(Scene.fal_request.isnot(None)).all()
+        ]
+    finally:
+        db.close()
+
+    for scene_id in scene_ids:
+        poll_scene.delay(scene_id)
+    return {"polled": len(scene_ids)}
+
+
+@celery_app.task
+def download_scene_clip(scene_id: int):
+    """Download a finished scene clip, then stitch if it was the last one."""
+    db = SessionLocal()
+
+    try:
+        scene = db.query(Scene).filter(Scene.id == scene_id).first()
+        if not scene:
+            return {"status": "skipped"}
+        project = scene.project
+
+        clip_path = UPLOADS_PATH / "clips" / f"project_{project.id}" / f"scene_{scene.id}.mp4"
+        cache = get_generation_cache()
+        download = partial(download_file, project_id=project.id)
+        try:
+            if cache:
+                retry_call(cache.materialize, scene.generated_video_url, clip_path, download)
+            else:
+                retry_call(download, scene.generated_video_url, clip_path)
+        except Exception as e:
+            fail_scene(db, scene, project, f"Download failed: {str(e)}")
+            return {"status": "failed", "error": str(e)}
+
+        scene.video_path = str(clip_path)
+        scene.generation_step = GenerationStep.DOWNLOADED
+        db.commit()
+        queue_live_clip(project.id, scene.id, project_priority(project))
+        publish_progress(project.id, "scene", scene_id=scene.id, step="downloaded")
+
+        maybe_stitch(db, project)
+        return {"status": "completed", "video_path": str(clip_path)}
+
+    finally:
+        db.close()
@@ -0,0 +1,35 @@
+"""
+Periodic garbage collection of the uploads volume (see app.services.storage).
+"""
+from app.tasks.celery_app import celery_app
+from app.services.storage import collect, STORAGE_GC_DRY_RUN
+from app.redis_client import get_redis
+from app.database import SessionLocal
+
+
+@celery_app.task
+def collect_garbage(dry_run: bool = STORAGE_GC_DRY_RUN):
+    """Evict unreferenced and least recently used files, or with `dry_run` only report them."""
+    # Overlapping collections would plan on a stale scan; dry runs don't delete
+    lock = None
+    if not dry_run:
+        lock = get_redis().lock("lock:collect_garbage", timeout=3600)
+        if not lock.acquire(blocking=False):
+            return {"status": "locked"}
+
+    db = SessionLocal()
+
+    try:
+        report = collect(db, dry_run=dry_run)
+        if report["evicted_files"]:
+            action = "Would evict" if dry_run else "Evicted"
+            print(f"Storage GC: {action} {report['evicted_files']} files ({report['evicted_bytes']} bytes)")
+        return {"status": "completed", **report}
+
+    except Exception as e:
+        return {"status": "failed", "error": str(e)}
+
+    finally:
+        db.close()
+        if lock:
+            lock.release()
@@ -1,171 +1,632 @@
+import asyncio
 import os
-import httpx
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
+from typing import Optional
+from celery import chain, chord
 
 from app.tasks.celery_app import celery_app
 from app.services.fal_service import FalService
 from app.services.video_service import VideoService
+from app.services import downloader
+from app.services.generation_engine import GenerationEngine, SceneJob
+from app.services.generation_cache import get_generation_cache
+from app.services.rate_limiter import get_rate_limiter, PRIORITY_BATCH
+from app.services.fingerprint import is_current, scene_fingerprint
+from app.services.retry import retry_call
+from app.services.progress import publish_progress
+from app.services.metrics import span
+from app.services.storage import touch
 from app.database import SessionLocal
-from app.models import Project, Scene
+from app.models import Project, Scene, GenerationStep
 
 UPLOADS_PATH = Path(os.getenv("UPLOADS_PATH", "/app/uploads"))
 
+# Maximum number of scenes of a single project generated at the same time
+SCENE_CONCURRENCY = int(os.getenv("SCENE_CONCURRENCY", "4"))
 
-def download_file(url: str, output_path: Path) -> Path:
+# "celery" fans scenes out over the workers, "asyncio" renders them all
+# inside a single worker with the pipelined GenerationEngine, "queue" submits
+# to fal's queue API and advances scenes from webhooks/polling
+GENERATION_ENGINE = os.getenv("GENERATION_ENGINE", "celery")
+ASYNC_MAX_IN_FLIGHT = int(os.getenv("ASYNC_MAX_IN_FLIGHT", "16"))
+ASYNC_MAX_DOWNLOADS = int(os.getenv("ASYNC_MAX_DOWNLOADS", "4"))
+
+# Reference images of a project uploaded to the fal CDN at the same time
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "8"))
+
+# Optional xfade transition between scenes (e.g. "fade", "wipeleft")
+SCENE_TRANSITION = os.getenv("SCENE_TRANSITION", "")
+SCENE_TRANSITION_DURATION = float(os.getenv("SCENE_TRANSITION_DURATION", "0.5"))
+
+# Publish a live HLS playlist that grows as scene clips are downloaded, so a
+# project can be watched before the final stitch
+HLS_OUTPUT = os.getenv("HLS_OUTPUT", "false").lower() == "true"
+
+# "full" regenerates every scene, "incremental" only scenes whose inputs
+# changed, "resume" additionally continues half-finished scenes from their
+# last checkpointed step
+GENERATE_MODES = ("full", "incremental", "resume")
+
+
+def make_fal_service(project: Project, priority: int = PRIORITY_BATCH) -> FalService:
+    """FalService for a project's model settings, with caching and rate limiting."""
+    return FalService(
+        image_model=project.image_model,
+        video_model=project.video_model,
+        cache=get_generation_cache(),
+        limiter=get_rate_limiter(),
+        project_id=project.id,
+        priority=priority,
+    )
+
+
+def download_file(url: str, output_path: Path, project_id: Optional[int] = None) -> Path:
     """Download a file from URL to local path."""
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with httpx.Client(timeout=300) as client:
-        response = client.get(url)
-        response.raise_for_status()
-        with open(output_path, "wb") as f:
-            f.write(response.content)
-    return output_path
+    with span("download", project_id=project_id):
+        return downloader.download(url, output_path)
 
 
-@celery_app.task(bind=True)
-def generate_project_video(self, project_id: int):
+def upload_reference_image(path: str, project_id: Optional[int] = None) -> str:
+    """fal CDN URL of a local image, uploading it only when it is not cached."""
+    import fal_client
+
+    def upload(p: str) -> str:
+        with span("cdn_upload", project_id=project_id):
+            return fal_client.upload_file(p)
+
+    cache = get_generation_cache()
+    if cache:
+        return cache.upload(path, lambda p: retry_call(upload, p))
+    return retry_call(upload, path)
+
+
+def reference_images_to_upload(scenes: list, mode: str) -> set[str]:
+    """Distinct reference images the given scenes will upload in this mode."""
+    return {
+        scene.reference_image_path for scene in scenes
+        if scene.reference_image_path
+        and not (mode == "resume" and scene.has_completed(GenerationStep.IMAGE))
+    }
+
+
+def prefetch_reference_images(paths: set[str], project_id: Optional[int] = None):
     """
-    Generate full video for a project by:
-    1. Generating images for each scene (via fal.ai)
-    2. Generating video clips for each scene (via fal.ai)
-    3. Stitching all clips + audio into final video (via FFmpeg)
+    Upload reference images concurrently ahead of the scene steps, which then
+    find them in the cache. Failures are left for the scene steps to retry
+    and report.
     """
-    db = SessionLocal()
-    video_service = VideoService(str(UPLOADS_PATH))
+    if not paths or not get_generation_cache():
+        return
+
+    def upload(path: str):
+        try:
+            upload_reference_image(path, project_id)
+        except Exception:
+            pass
+
+    with ThreadPoolExecutor(max_workers=min(UPLOAD_CONCURRENCY, len(paths))) as executor:
+        list(executor.map(upload, paths))
+
+
+def scenes_to_render(project: Project, scenes: list, mode: str) -> list[tuple[int, Scene]]:
+    """
+    Return (index, scene) pairs that need a new clip. In incremental and
+    resume mode a scene is reused when its clip is on disk and its
+    fingerprint still matches.
+    """
+    pending = []
+    for i, scene in enumerate(scenes):
+        if (
+            mode != "full"
+            and scene.has_completed(GenerationStep.DOWNLOADED)
+            and scene.video_path
+            and os.path.exists(scene.video_path)
+            and is_current(scene, project)
+        ):
+            touch(scene.video_path)
+            continue
+        pending.append((i, scene))
+    return pending
+
+
+def split_into_lanes(items: list, lanes: int) -> list[list]:
+    """Distribute items round-robin over at most `lanes` lists."""
+    lanes = max(1, min(lanes, len(items)))
+    return [items[i::lanes] for i in range(lanes)]
 
+
+def live_playlist_dir(project_id: int) -> Path:
+    return UPLOADS_PATH / "output" / f"project_{project_id}" / "hls"
+
+
+def start_live_playlist(project: Project, scenes: list, pending_ids: set):
+    """
+    Start a fresh live playlist for a generation run, already containing
+    every scene whose clip is reused.
+    """
+    video_service = VideoService(str(UPLOADS_PATH), project_id=project.id)
+    hls_dir = live_playlist_dir(project.id)
     try:
-        # Load project and scenes
-        project = db.query(Project).filter(Project.id == project_id).first()
-        if not project:
-            return {"status": "failed", "error": "Project not found"}
+        video_service.reset_hls(hls_dir)
+        for scene in scenes:
+            if scene.id in pending_ids:
+                continue
+            video_service.segment_hls(scene.video_path, hls_dir, f"scene_{scene.id}")
+        video_service.write_live_playlist(hls_dir, [f"scene_{scene.id}" for scene in scenes])
+    except Exception as e:
+        # The preview is best effort and never fails a generation
+        print(f"Live playlist warning for project {project.id}: {e}")
+        return
+    project.preview_playlist_path = f"output/project_{project.id}/hls/live.m3u8"
+
 
+@celery_app.task
+def append_live_clip(project_id: int, scene_id: int):
+    """
+    Segment a freshly downloaded clip and append it to the live playlist.
+
+    Runs on the ffmpeg queue, so the scene steps and the asyncio engine only
+    queue it and keep going.
+    """
+    db = SessionLocal()
+    try:
         scenes = (
-            db.query(Scene)
+            db.query(Scene.id, Scene.video_path)
             .filter(Scene.project_id == project_id)
             .order_by(Scene.order)
             .all()
         )
+        video_path = next((path for id_, path in scenes if id_ == scene_id), None)
+        if not video_path:
+            return
+        video_service = VideoService(str(UPLOADS_PATH), project_id=project_id)
+        hls_dir = live_playlist_dir(project_id)
+        video_service.segment_hls(video_path, hls_dir, f"scene_{scene_id}")
+        video_service.write_live_playlist(hls_dir, [f"scene_{id_}" for id_, _ in scenes])
+    except Exception as e:
+        print(f"Live playlist warning for project {project_id}: {e}")
+    finally:
+        db.close()
 
-        if not scenes:
-            project.status = "failed"
-            db.commit()
-            return {"status": "failed", "error": "No scenes in project"}
 
-        # Initialize FalService with project's model settings
-        fal_service = FalService(
-            image_model=project.image_model,
-            video_model=project.video_model,
+def queue_live_clip(project_id: int, scene_id: int, priority: int = PRIORITY_BATCH):
+    """Queue `append_live_clip` for a downloaded clip when HLS_OUTPUT is on."""
+    if HLS_OUTPUT:
+        append_live_clip.apply_async((project_id, scene_id), priority=priority)
+
+
+def set_project_status(db, project: Project, status: str, **data):
+    """Update and publish a project's status."""
+    project.status = status
+    db.commit()
+    publish_progress(project.id, "project", status=status, **data)
+
+
+def start_scene_checkpoint(scene: Scene, project: Project, mode: str):
+    """
+    Prepare a scene for generation. In resume mode the existing checkpoint is
+    kept when the scene's inputs are unchanged; otherwise it starts over.
+    """
+    if mode != "resume" or not is_current(scene, project):
+        scene.generation_step = None
+        scene.fingerprint = scene_fingerprint(scene, project)
+    scene.generation_error = None
+
+
+@celery_app.task(bind=True)
+def generate_scene_video(
+    self,
+    results: list,
+    project_id: int,
+    scene_id: int,
+    index: int,
+    total: int,
+    mode: str = "full",
+    priority: int = PRIORITY_BATCH,
+):
+    """
+    Generate the clip for a single scene:
+    1. Generate or upload the scene image (via fal.ai)
+    2. Generate the video clip (via fal.ai)
+    3. Download the clip to the project's clips directory
+
+    Every step is checkpointed on the scene and published as a progress
+    event; transient fal.ai/httpx errors are retried with exponential
+    backoff. Scene tasks of a project are chained into lanes; each task
+    appends its outcome to the results of the previous task in the lane.
+    """
+    db = SessionLocal()
+    progress = int((index / total) * 90)
+    scene = None
+
+    def report(step: str, **data):
+        publish_progress(
+            project_id, "scene", scene_id=scene_id, index=index, step=step, progress=progress, **data
         )
 
-        project.status = "generating"
-        db.commit()
+    def fail(error: str):
+        if scene:
+            scene.generation_error = error
+            db.commit()
+        report("failed", error=error)
+        return results + [{"status": "failed", "scene_id": scene_id, "error": error}]
 
-        self.update_state(state="PROCESSING", meta={"step": "generating_images", "progress": 0})
+    try:
+        project = db.query(Project).filter(Project.id == project_id).first()
+        scene = db.query(Scene).filter(Scene.id == scene_id).first()
+        if not project or not scene:
+            return fail(f"Scene {index+1} not found")
 
-        video_clips = []
-        total_scenes = len(scenes)
+        fal_service = make_fal_service(project, priority)
+        start_scene_checkpoint(scene, project, mode)
+        db.commit()
 
-        for i, scene in enumerate(scenes):
-            progress = int((i / total_scenes) * 100)
-
-            # Step 1: Generate or use existing image
-            if scene.reference_image_path:
-                # Upload reference image to fal.ai CDN
-                self.update_state(
-                    state="PROCESSING",
-                    meta={"step": f"uploading_image_{i+1}", "progress": progress}
-                )
-                import fal_client
-                image_url = fal_client.upload_file(scene.reference_image_path)
-            else:
-                # Generate image from prompt using project's image_size setting
-                self.update_state(
-                    state="PROCESSING",
-                    meta={"step": f"generating_image_{i+1}", "progress": progress}
+        # Step 1: Generate or use existing image
+        if scene.has_completed(GenerationStep.IMAGE):
+            image_url = scene.generated_image_url
+        elif scene.reference_image_path:
+            # Upload reference image to fal.ai CDN
+            report("uploading_image")
+            try:
+                image_url = upload_reference_image(scene.reference_image_path, project_id)
+            except Exception as e:
+                return fail(f"Image upload failed for scene {index+1}: {str(e)}")
+        else:
+            # Generate image from prompt using project's image_size setting
+            report("generating_image")
+            try:
+                image_url = retry_call(
+                    fal_service.generate_image,
+                    scene.prompt,
+                    image_size=project.image_size,
                 )
-                try:
-                    image_url = fal_service.generate_image(
-                        scene.prompt,
-                        image_size=project.image_size,
-                    )
-                    scene.generated_image_url = image_url
-                    db.commit()
-                except Exception as e:
-                    project.status = "failed"
-                    db.commit()
-                    return {"status": "failed", "error": f"Image generation failed for scene {i+1}: {str(e)}"}
-
-            # Step 2: Generate video from image using project's duration setting
-            self.update_state(
-                state="PROCESSING",
-                meta={"step": f"generating_video_{i+1}", "progress": progress + 10}
-            )
+            except Exception as e:
+                return fail(f"Image generation failed for scene {index+1}: {str(e)}")
+
+        if not scene.has_completed(GenerationStep.IMAGE):
+            scene.generated_image_url = image_url
+            scene.generation_step = GenerationStep.IMAGE
+            db.commit()
+
+        # Step 2: Generate video from image using project's duration setting
+        if scene.has_completed(GenerationStep.VIDEO):
+            video_url = scene.generated_video_url
+        else:
+            report("generating_video")
             try:
-                video_url = fal_service.generate_video_from_image(
+                video_url = retry_call(
+                    fal_service.generate_video_from_image,
                     image_url=image_url,
                     prompt=scene.prompt,
                     duration=project.video_duration,
                 )
-                scene.generated_video_url = video_url
-                db.commit()
             except Exception as e:
-                project.status = "failed"
-                db.commit()
-                return {"status": "failed", "error": f"Video generation failed for scene {i+1}: {str(e)}"}
-
-            # Step 3: Download video clip
-            self.update_state(
-                state="PROCESSING",
-                meta={"step": f"downloading_video_{i+1}", "progress": progress + 20}
-            )
-            clip_path = UPLOADS_PATH / "clips" / f"project_{project_id}" / f"scene_{scene.id}.mp4"
-            download_file(video_url, clip_path)
-            scene.video_path = str(clip_path)
+                return fail(f"Video generation failed for scene {index+1}: {str(e)}")
+            scene.generated_video_url = video_url
+            scene.generation_step = GenerationStep.VIDEO
             db.commit()
-            video_clips.append(str(clip_path))
 
-        # Step 4: Stitch all clips together
-        self.update_state(state="PROCESSING", meta={"step": "stitching", "progress": 90})
+        # Step 3: Download video clip
+        report("downloading_video")
+        clip_path = UPLOADS_PATH / "clips" / f"project_{project_id}" / f"scene_{scene.id}.mp4"
+        cache = fal_service.cache
+        download = partial(download_file, project_id=project_id)
+        try:
+            if cache:
+                retry_call(cache.materialize, video_url, clip_path, download)
+            else:
+                retry_call(download, video_url, clip_path)
+        except Exception as e:
+            return fail(f"Download failed for scene {index+1}: {str(e)}")
+        scene.video_path = str(clip_path)
+        scene.generation_step = GenerationStep.DOWNLOADED
+        db.commit()
+        queue_live_clip(project_id, scene.id, priority)
+        report("downloaded")
+
+        return results + [
+            {"status": "completed", "scene_id": scene_id, "video_path": str(clip_path)}
+        ]
 
-        output_dir = UPLOADS_PATH / "output" / f"project_{project_id}"
-        output_dir.mkdir(parents=True, exist_ok=True)
-        output_path = str(output_dir / "final_video.mp4")
+    except Exception as e:
+        return fail(f"Scene {index+1} failed: {str(e)}")
 
-        # Check if any scene has audio for background track
-        audio_path = None
-        for scene in scenes:
-            if scene.audio_path:
-                audio_path = scene.audio_path
-                break
+    finally:
+        db.close()
 
-        try:
+
+def stitch_scene_clips(task, db, project: Project, results: list) -> dict:
+    """
+    Stitch all scene clips + audio of a project into the final video
+    (via FFmpeg), given the per-scene results of the generation step.
+    """
+    project_id = project.id
+    video_service = VideoService(str(UPLOADS_PATH), project_id=project_id)
+
+    errors = [r["error"] for r in results if r.get("status") != "completed"]
+    if errors:
+        set_project_status(db, project, "failed", error="; ".join(errors))
+        return {"status": "failed", "error": "; ".join(errors)}
+
+    scenes = (
+        db.query(Scene)
+        .filter(Scene.project_id == project_id)
+        .order_by(Scene.order)
+        .all()
+    )
+
+    missing = [
+        str(i + 1) for i, scene in enumerate(scenes)
+        if not scene.video_path or not os.path.exists(scene.video_path)
+    ]
+    if missing:
+        error = f"Missing clips for scene(s) {', '.join(missing)}"
+        set_project_status(db, project, "failed", error=error)
+        return {"status": "failed", "error": error}
+
+    video_clips = [scene.video_path for scene in scenes]
+
+    task.update_state(state="PROCESSING", meta={"step": "stitching", "progress": 90})
+    set_project_status(db, project, "stitching")
+
+    output_dir = UPLOADS_PATH / "output" / f"project_{project_id}"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_path = str(output_dir / "final_video.mp4")
+
+    # Scene audio or transitions need a re-encode: render the whole timeline
+    # in one ffmpeg pass; otherwise clips are concatenated with stream copy
+    audio_paths = [scene.audio_path for scene in scenes]
+    render_cost = None
+
+    try:
+        if any(audio_paths) or SCENE_TRANSITION:
+            plan = video_service.plan_render(
+                video_clips,
+                audio_paths=audio_paths,
+                transition=SCENE_TRANSITION or None,
+                transition_duration=SCENE_TRANSITION_DURATION,
+            )
+            render_cost = plan.estimated_cost()
+            video_service.render(plan, output_path)
+        else:
             video_service.stitch_videos(
                 video_paths=video_clips,
                 output_path=output_path,
-                audio_path=audio_path,
             )
-        except Exception as e:
-            project.status = "failed"
-            db.commit()
-            return {"status": "failed", "error": f"Video stitching failed: {str(e)}"}
+    except Exception as e:
+        error = f"Video stitching failed: {str(e)}"
+        set_project_status(db, project, "failed", error=error)
+        return {"status": "failed", "error": error}
+
+    # Update project with final video path
+    project.output_video_path = f"output/project_{project_id}/final_video.mp4"
+    set_project_status(db, project, "completed", video_path=project.output_video_path)
 
-        # Update project with final video path
-        project.output_video_path = f"output/project_{project_id}/final_video.mp4"
-        project.status = "completed"
+    return {
+        "status": "completed",
+        "video_path": project.output_video_path,
+        "render_cost": render_cost,
+    }
+
+
+def generate_in_process(
+    project_id: int,
+    scene_ids: list[int],
+    max_in_flight: int = None,
+    mode: str = "full",
+    priority: int = PRIORITY_BATCH,
+) -> list:
+    """
+    Render the given scenes of a project inside this worker with the
+    pipelined asyncio GenerationEngine. Returns the per-scene results for
+    `stitch_project_video`.
+    """
+    db = SessionLocal()
+
+    try:
+        project = db.query(Project).filter(Project.id == project_id).first()
+        if not project:
+            return [{"status": "failed", "error": "Project not found"}]
+
+        scenes = (
+            db.query(Scene)
+            .filter(Scene.project_id == project_id)
+            .order_by(Scene.order)
+            .all()
+        )
+        scenes_by_id = {scene.id: scene for scene in scenes}
+        total = len(scenes)
+
+        jobs = []
+        for i, scene in enumerate(scenes):
+            if scene.id not in scene_ids:
+                continue
+            start_scene_checkpoint(scene, project, mode)
+            jobs.append(SceneJob(
+                scene_id=scene.id,
+                index=i,
+                prompt=scene.prompt,
+                clip_path=UPLOADS_PATH / "clips" / f"project_{project_id}" / f"scene_{scene.id}.mp4",
+                reference_image_path=scene.reference_image_path,
+                image_url=scene.generated_image_url if scene.has_completed(GenerationStep.IMAGE) else None,
+                video_url=scene.generated_video_url if scene.has_completed(GenerationStep.VIDEO) else None,
+            ))
         db.commit()
 
-        self.update_state(state="SUCCESS", meta={"step": "completed", "progress": 100})
+        def on_update(job: SceneJob, step: str, values: dict):
+            if values:
+                scene = scenes_by_id[job.scene_id]
+                for key, value in values.items():
+                    setattr(scene, key, value)
+                db.commit()
+                if values.get("generation_step") == GenerationStep.DOWNLOADED:
+                    queue_live_clip(project_id, scene.id, priority)
+            publish_progress(
+                project_id, "scene",
+                scene_id=job.scene_id,
+                index=job.index,
+                step=step,
+                progress=int((job.index / total) * 90),
+                **({"error": values["generation_error"]} if "generation_error" in values else {}),
+            )
+
+        engine = GenerationEngine(
+            make_fal_service(project, priority),
+            image_size=project.image_size,
+            duration=project.video_duration,
+            max_in_flight=max_in_flight or ASYNC_MAX_IN_FLIGHT,
+            max_downloads=ASYNC_MAX_DOWNLOADS,
+        )
+        return asyncio.run(engine.run(jobs, on_update))
+
+    except Exception as e:
+        return [{"status": "failed", "error": str(e)}]
+
+    finally:
+        db.close()
+
+
+@celery_app.task(bind=True)
+def stitch_project_video(self, lane_results: list, project_id: int):
+    """Chord callback: stitch the project once every scene task has finished."""
+    db = SessionLocal()
+    project = None
+
+    try:
+        project = db.query(Project).filter(Project.id == project_id).first()
+        if not project:
+            return {"status": "failed", "error": "Project not found"}
 
-        return {
-            "status": "completed",
-            "video_path": project.output_video_path,
-        }
+        # Every lane returns the accumulated results of its scene tasks
+        results = [r for lane in lane_results for r in lane]
+        return stitch_scene_clips(self, db, project, results)
 
     except Exception as e:
         if project:
-            project.status = "failed"
-            db.commit()
+            set_project_status(db, project, "failed", error=str(e))
+        return {"status": "failed", "error": str(e)}
+
+    finally:
+        db.close()
+
+
+@celery_app.task(bind=True)
+def generate_project_video(
+    self,
+    project_id: int,
+    max_concurrency: int = None,
+    mode: str = "full",
+    priority: int = PRIORITY_BATCH,
+):
+    """
+    Generate full video for a project by fanning its scenes out over the
+    workers and stitching the clips once all of them are on disk.
+
+    Scenes are split into at most `max_concurrency` lanes (SCENE_CONCURRENCY
+    by default). Each lane is a chain of per-scene tasks, so a project never
+    has more than that many scenes in flight, and the lanes together form the
+    header of a chord whose callback is `stitch_project_video`. The chord
+    replaces this task, so its id keeps tracking the whole generation.
+
+    With GENERATION_ENGINE=asyncio the scenes are rendered inside this worker
+    by the pipelined GenerationEngine instead. With GENERATION_ENGINE=queue
+    the first step of every scene is submitted to fal's queue and the task
+    returns; app.tasks.polling advances scenes as their requests finish.
+
+    With HLS_OUTPUT every clip is also appended to a live HLS playlist as soon
+    as it is downloaded (see `append_live_clip`, which runs on the ffmpeg
+    queue).
+
+    In "incremental" mode only scenes whose fingerprint changed since their
+    clip was rendered are regenerated before re-stitching; "resume" also
+    continues unfinished scenes from their last checkpointed step.
+
+    `priority` (lower runs first) is applied to the scene tasks and to the
+    fal.ai rate limiter, so interactive renders overtake batch renders. Since
+    a project only ever has its lanes' worth of scene tasks queued, scene
+    tasks of concurrent projects interleave in the broker queue.
+    """
+    db = SessionLocal()
+    project = None
+
+    try:
+        # Load project and scenes
+        project = db.query(Project).filter(Project.id == project_id).first()
+        if not project:
+            return {"status": "failed", "error": "Project not found"}
+
+        scenes = (
+            db.query(Scene)
+            .filter(Scene.project_id == project_id)
+            .order_by(Scene.order)
+            .all()
+        )
+
+        if not scenes:
+            set_project_status(db, project, "failed", error="No scenes in project")
+            return {"status": "failed", "error": "No scenes in project"}
+
+        total = len(scenes)
+        pending_scenes = scenes_to_render(project, scenes, mode)
+        pending = [(i, scene.id) for i, scene in pending_scenes]
+        reference_images = reference_images_to_upload([scene for _, scene in pending_scenes], mode)
+
+        project.preview_playlist_path = None
+        if HLS_OUTPUT:
+            start_live_playlist(project, scenes, {scene_id for _, scene_id in pending})
+        # The page that started the render attaches its live player from this event
+        playlist = {"playlist": f"/uploads/{project.preview_playlist_path}"} if project.preview_playlist_path else {}
+        set_project_status(db, project, "generating", **playlist)
+
+    except Exception as e:
+        if project:
+            set_project_status(db, project, "failed", error=str(e))
         return {"status": "failed", "error": str(e)}
 
     finally:
         db.close()
+
+    self.update_state(state="PROCESSING", meta={"step": "generating_images", "progress": 0})
+
+    # Every clip is up to date, only the stitch has to run again
+    if not pending:
+        return self.replace(stitch_project_video.si([], project_id).set(priority=priority))
+
+    # The asyncio engine pipelines uploads itself; otherwise upload them all
+    # up front instead of one by one inside the scene steps
+    if GENERATION_ENGINE != "asyncio":
+        prefetch_reference_images(reference_images, project_id)
+
+    if GENERATION_ENGINE == "queue":
+        from app.tasks.polling import start_queued_generation
+
+        return start_queued_generation(
+            project_id, [scene_id for _, scene_id in pending], mode, priority
+        )
+
+    # Stitching always runs as its own task, so it lands on the ffmpeg queue
+    if GENERATION_ENGINE == "asyncio":
+        results = generate_in_process(
+            project_id, [scene_id for _, scene_id in pending], max_concurrency, mode, priority
+        )
+        return self.replace(stitch_project_video.si([results], project_id).set(priority=priority))
+
+    lanes = split_into_lanes(pending, max_concurrency or SCENE_CONCURRENCY)
+
+    header = []
+    for lane in lanes:
+        (first_index, first_id), rest = lane[0], lane[1:]
+        tasks = [generate_scene_video.s(
+            [], project_id, first_id, first_index, total, mode, priority
+        ).set(priority=priority)]
+        tasks += [
+            generate_scene_video.s(
+                project_id, scene_id, index, total, mode, priority
+            ).set(priority=priority)
+            for index, scene_id in rest
+        ]
+        header.append(chain(*tasks))
+
+    return self.replace(chord(header, stitch_project_video.s(project_id).set(priority=priority)))
@@ -0,0 +1,217 @@
+"""
+Local stand-in for the fal.ai APIs used by the app, for offline benchmarks.
+
+Serves the synchronous run API (`/run/<model>`, what fal_client.run calls),
+the queue API (`/queue/<model>`, see app.services.fal_queue) and the
+generated media (`/media/...`). Every model call waits a configurable
+latency and fails with a 503 at a configurable rate; results point at a
+synthetic clip (or image) rendered once with ffmpeg's lavfi sources.
+
+Configuration is read from FAKE_FAL_* environment variables so the server
+can run under uvicorn as a subprocess:
+
+    python -m benchmarks.fake_fal --port 9100 --video-latency 3 --clip-mb 4
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import time
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, JSONResponse
+
+from app.services.fal_service import VIDEO_MODELS
+
+# Base URL clients reach this server at (used in result and media URLs)
+FAKE_FAL_URL = os.getenv("FAKE_FAL_URL", "http://127.0.0.1:9100")
+# Seconds per model call, +/- FAKE_FAL_JITTER (a fraction of the latency)
+FAKE_FAL_IMAGE_LATENCY = float(os.getenv("FAKE_FAL_IMAGE_LATENCY", "1"))
+FAKE_FAL_VIDEO_LATENCY = float(os.getenv("FAKE_FAL_VIDEO_LATENCY", "3"))
+FAKE_FAL_JITTER = float(os.getenv("FAKE_FAL_JITTER", "0.2"))
+# Share of model calls answered with a 503 (the app retries these)
+FAKE_FAL_FAILURE_RATE = float(os.getenv("FAKE_FAL_FAILURE_RATE", "0"))
+# Synthetic clip served as every video result
+FAKE_FAL_CLIP_SECONDS = float(os.getenv("FAKE_FAL_CLIP_SECONDS", "5"))
+FAKE_FAL_CLIP_MB = float(os.getenv("FAKE_FAL_CLIP_MB", "2"))
+FAKE_FAL_RESOLUTION = os.getenv("FAKE_FAL_RESOLUTION", "1280x720")
+FAKE_FAL_MEDIA_DIR = Path(os.getenv("FAKE_FAL_MEDIA_DIR", "/tmp/fake_fal"))
+
+AUDIO_BITRATE_KBPS = 128
+
+
+def render_media(media_dir: Path = FAKE_FAL_MEDIA_DIR) -> tuple[Path, Path]:
+    """Render the synthetic clip and image (once per configuration)."""
+    media_dir.mkdir(parents=True, exist_ok=True)
+    key = f"{FAKE_FAL_RESOLUTION}_{FAKE_FAL_CLIP_SECONDS:g}s_{FAKE_FAL_CLIP_MB:g}mb"
+    clip_path = media_dir / f"clip_{key}.mp4"
+    image_path = media_dir / f"image_{FAKE_FAL_RESOLUTION}.png"
+
+    if not clip_path.exists():
+        # Size the video bitrate so the clip comes out at about FAKE_FAL_CLIP_MB
+        total_kbps = FAKE_FAL_CLIP_MB * 8 * 1024 / FAKE_FAL_CLIP_SECONDS
+        video_kbps = max(100, int(total_kbps - AUDIO_BITRATE_KBPS))
+        tmp_path = clip_path.with_name(f"tmp_{clip_path.name}")
+        subprocess.run([
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size={FAKE_FAL_RESOLUTION}:rate=24:duration={FAKE_FAL_CLIP_SECONDS}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={FAKE_FAL_CLIP_SECONDS}",
+            "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+            "-b:v", f"{video_kbps}k", "-maxrate", f"{video_kbps}k", "-bufsize", f"{2 * video_kbps}k",
+            "-c:a", "aac", "-b:a", f"{AUDIO_BITRATE_KBPS}k",
+            "-shortest", "-movflags", "+faststart",
+            "-f", "mp4", str(tmp_path),
+        ], check=True)
+        os.replace(tmp_path, clip_path)
+
+    if not image_path.exists():
+        subprocess.run([
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size={FAKE_FAL_RESOLUTION}",
+            "-frames:v", "1", str(image_path),
+        ], check=True)
+    return clip_path, image_path
+
+
+def is_video_model(model: str) -> bool:
+    return model in VIDEO_MODELS or "video" in model
+
+
+def latency(model: str) -> float:
+    base = FAKE_FAL_VIDEO_LATENCY if is_video_model(model) else FAKE_FAL_IMAGE_LATENCY
+    return max(0.0, base * random.uniform(1 - FAKE_FAL_JITTER, 1 + FAKE_FAL_JITTER))
+
+
+def should_fail() -> bool:
+    return random.random() < FAKE_FAL_FAILURE_RATE
+
+
+def unavailable() -> JSONResponse:
+    return JSONResponse({"detail": "Injected failure"}, status_code=503)
+
+
+def result_for(model: str, request_id: str) -> dict:
+    if is_video_model(model):
+        return {"video": {"url": f"{FAKE_FAL_URL}/media/video/{request_id}.mp4"}}
+    return {"images": [{"url": f"{FAKE_FAL_URL}/media/image/{request_id}.png"}]}
+
+
+# Queued requests: request id -> (model, unix time it completes)
+requests: dict[str, tuple[str, float]] = {}
+media: dict[str, Path] = {}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    media["video"], media["image"] = await asyncio.to_thread(render_media)
+    yield
+
+
+app = FastAPI(title="fal.ai stand-in", lifespan=lifespan)
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.post("/run/{model:path}")
+async def run(model: str):
+    """Synchronous run: answers once the model "finished"."""
+    await asyncio.sleep(latency(model))
+    if should_fail():
+        return unavailable()
+    return result_for(model, uuid.uuid4().hex)
+
+
+@app.post("/queue/{model:path}")
+async def submit(model: str, request: Request):
+    if should_fail():
+        return unavailable()
+    request_id = uuid.uuid4().hex
+    requests[request_id] = (model, time.time() + latency(model))
+
+    webhook_url = request.query_params.get("fal_webhook")
+    if webhook_url:
+        asyncio.create_task(call_webhook(webhook_url, request_id))
+    return {"request_id": request_id, "status": "IN_QUEUE"}
+
+
+async def call_webhook(url: str, request_id: str):
+    model, done_at = requests[request_id]
+    await asyncio.sleep(max(0.0, done_at - time.time()))
+    try:
+        async with httpx.AsyncClient(timeout=30) as client:
+            await client.post(url, json={"request_id": request_id, "status": "OK"})
+    except httpx.HTTPError:
+        pass  # the app falls back to polling
+
+
+@app.get("/queue/{app_id:path}/requests/{request_id}/status")
+async def status(app_id: str, request_id: str):
+    if request_id not in requests:
+        return JSONResponse({"detail": "Unknown request"}, status_code=404)
+    _, done_at = requests[request_id]
+    return {"status": "COMPLETED" if time.time() >= done_at else "IN_PROGRESS"}
+
+
+@app.get("/queue/{app_id:path}/requests/{request_id}")
+async def result(app_id: str, request_id: str):
+    if request_id not in requests:
+        return JSONResponse({"detail": "Unknown request"}, status_code=404)
+    model, done_at = requests[request_id]
+    if time.time() < done_at:
+        return JSONResponse({"detail": "Request is still in progress"}, status_code=400)
+    return result_for(model, request_id)
+
+
+@app.get("/media/{kind}/{name}")
+async def get_media(kind: str, name: str):
+    """Every result of a kind is the same synthetic file (Range requests work)."""
+    if kind not in media:
+        return JSONResponse({"detail": "Not found"}, status_code=404)
+    return FileResponse(media[kind])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--image-latency", type=float, default=FAKE_FAL_IMAGE_LATENCY)
+    parser.add_argument("--video-latency", type=float, default=FAKE_FAL_VIDEO_LATENCY)
+    parser.add_argument("--jitter", type=float, default=FAKE_FAL_JITTER)
+    parser.add_argument("--failure-rate", type=float, default=FAKE_FAL_FAILURE_RATE)
+    parser.add_argument("--clip-seconds", type=float, default=FAKE_FAL_CLIP_SECONDS)
+    parser.add_argument("--clip-mb", type=float, default=FAKE_FAL_CLIP_MB)
+    parser.add_argument("--resolution", default=FAKE_FAL_RESOLUTION)
+    parser.add_argument("--media-dir", default=str(FAKE_FAL_MEDIA_DIR))
+    args = parser.parse_args()
+
+    import uvicorn
+
+    os.environ.update(server_env(args, f"http://{args.host}:{args.port}"))
+    uvicorn.run("benchmarks.fake_fal:app", host=args.host, port=args.port, log_level="warning")
+
+
+def server_env(args, url: str) -> dict:
+    """FAKE_FAL_* variables for a server configured from parsed arguments."""
+    return {
+        "FAKE_FAL_URL": url,
+        "FAKE_FAL_IMAGE_LATENCY": str(args.image_latency),
+        "FAKE_FAL_VIDEO_LATENCY": str(args.video_latency),
+        "FAKE_FAL_JITTER": str(args.jitter),
+        "FAKE_FAL_FAILURE_RATE": str(args.failure_rate),
+        "FAKE_FAL_CLIP_SECONDS": str(args.clip_seconds),
+        "FAKE_FAL_CLIP_MB": str(args.clip_mb),
+        "FAKE_FAL_RESOLUTION": args.resolution,
+        "FAKE_FAL_MEDIA_DIR": args.media_dir,
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+"""
+Celery worker for benchmarks. fal_client has no setting for a plain-HTTP
+run host, so its run URL is pointed at the fal.ai stand-in (FAKE_FAL_URL)
+before the worker starts; queue mode uses FAL_QUEUE_URL as usual.
+
+    python -m benchmarks.worker -Q io --pool threads --concurrency 32
+"""
+import os
+import sys
+
+import fal_client.client
+
+fal_client.client.RUN_URL_FORMAT = os.environ["FAKE_FAL_URL"].rstrip("/") + "/run/"
+
+from app.tasks.celery_app import celery_app  # noqa: E402
+
+if __name__ == "__main__":
+    celery_app.worker_main(["worker", *sys.argv[1:]])